@@ -0,0 +1,152 @@
+import asyncio
+import os
+from datetime import datetime
+
+import asyncpg
+from dotenv import load_dotenv
+
+from PerevalDatabase import (
+    PerevalDatabase, SUBMIT_QUERY, SUBMIT_KNOWN_USER_QUERY, numbered_params, submit_params,
+)
+
+load_dotenv()  # Загружаем переменные окружения из .env файла
+
+# asyncpg использует параметры $1, $2, ...
+ASYNC_SUBMIT_QUERY = numbered_params(SUBMIT_QUERY)
+ASYNC_SUBMIT_KNOWN_USER_QUERY = numbered_params(SUBMIT_KNOWN_USER_QUERY)
+# Позиции параметров submit_params, которые asyncpg не приводит из строк сам
+# (psycopg2 передаёт параметры текстом, и старые заявки присылают координаты строками)
+FLOAT_INDEXES = (0, 1)  # latitude, longitude
+INTEGER_INDEXES = (2, 12)  # height, area_id
+ADD_TIME_INDEX = 11
+
+
+def coerce_params(params):
+    """Строковые числа и время из заявки -> типы столбцов"""
+    for index in FLOAT_INDEXES:
+        if isinstance(params[index], str):
+            params[index] = float(params[index])
+    for index in INTEGER_INDEXES:
+        if isinstance(params[index], str):
+            params[index] = int(params[index])
+    # asyncpg принимает для timestamp только datetime
+    if isinstance(params[ADD_TIME_INDEX], str):
+        params[ADD_TIME_INDEX] = datetime.fromisoformat(params[ADD_TIME_INDEX])
+    return params
+
+
+class AsyncPerevalDatabase:
+    """
+    Асинхронный клиент (asyncpg) с тем же контрактом submit_data, что у PerevalDatabase.
+    Соединения берутся из собственного пула, подготовленные операторы кэшируются asyncpg
+    в каждом соединении:
+
+        async with AsyncPerevalDatabase() as db:
+            ids = await db.submit_many(records, concurrency=20)
+    """
+    # Кэш (база, email) -> (id пользователя, данные пользователя) общий с PerevalDatabase:
+    # ключ базы без dsn тот же, что у синхронного клиента
+    user_cache = PerevalDatabase.user_cache
+
+    def __init__(self, dsn=None, pool_size=None, **pool_options):
+        self.dsn = dsn
+        self.db_host = os.getenv('FSTR_DB_HOST')
+        self.db_port = os.getenv('FSTR_DB_PORT')
+        self.db_login = os.getenv('FSTR_DB_LOGIN')
+        self.db_pass = os.getenv('FSTR_DB_PASS')
+        self.db_name = 'pereval'  # Можно также вынести в переменные окружения
+        self.pool_size = pool_size or int(os.getenv('FSTR_DB_ASYNC_POOL_SIZE', '10'))
+        self.pool_options = pool_options
+        # Подготовленные операторы - выключить для PgBouncer в режиме transaction
+        if os.getenv('FSTR_DB_PREPARE', 'True').lower() not in ('1', 'true', 'yes'):
+            self.pool_options.setdefault('statement_cache_size', 0)
+        self.pool = None
+
+    @property
+    def database_key(self):
+        return self.dsn or f'{self.db_host}:{self.db_port}/{self.db_name}'
+
+    async def connect(self):
+        """Создание пула соединений"""
+        try:
+            self.pool = await asyncpg.create_pool(
+                dsn=self.dsn,
+                host=None if self.dsn else self.db_host,
+                port=None if self.dsn else self.db_port,
+                database=None if self.dsn else self.db_name,
+                user=None if self.dsn else self.db_login,
+                password=None if self.dsn else self.db_pass,
+                min_size=1,
+                max_size=self.pool_size,
+                **self.pool_options,
+            )
+            print("Успешное подключение к базе данных")
+        except Exception as e:
+            print(f"Ошибка подключения к базе данных: {e}")
+            raise
+
+    async def disconnect(self):
+        """Закрытие пула соединений"""
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
+            print("Соединение с базой данных закрыто")
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.disconnect()
+
+    async def submit_data(self, pereval_data):
+        """
+        Добавление нового перевала в базу данных (один оператор, как в PerevalDatabase)
+        :param pereval_data: словарь с данными о перевале
+        :return: ID созданной записи или None в случае ошибки
+        """
+        if self.pool is None:
+            await self.connect()
+
+        email = (pereval_data.get('user') or {}).get('email')
+        cache_key = (self.database_key, email)
+        try:
+            fields, params = submit_params(pereval_data)
+            coerce_params(params)
+
+            cached = self.user_cache.get(cache_key)
+            async with self.pool.acquire() as conn:
+                if cached is not None and cached[1] == fields:
+                    row = await conn.fetchrow(ASYNC_SUBMIT_KNOWN_USER_QUERY, cached[0], *params)
+                else:
+                    row = await conn.fetchrow(ASYNC_SUBMIT_QUERY, email, *fields, *params)
+
+            self.user_cache.set(cache_key, (row['user_id'], fields))
+            return row['id']
+
+        except Exception as e:
+            print(f"Ошибка при добавлении перевала: {e}")
+            # id из кэша мог устареть (пользователь удалён) - повторная попытка пройдёт через upsert
+            if email:
+                self.user_cache.delete(cache_key)
+            return None
+
+    async def submit_many(self, records, concurrency=None):
+        """
+        Добавление перевалов, не более concurrency одновременно (по умолчанию - размер пула)
+        :param records: итерируемый набор словарей с данными о перевалах
+        :return: список ID в порядке records (None для записей с ошибкой)
+        """
+        if self.pool is None:
+            await self.connect()
+
+        results = {}
+        pending = enumerate(records)
+
+        async def worker():
+            # Итератор общий: каждый обработчик берёт следующую запись, когда освободится
+            for index, record in pending:
+                results[index] = await self.submit_data(record)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency or self.pool_size)))
+        return [results[index] for index in range(len(results))]
@@ -1,13 +1,139 @@
+import itertools
+import json
 import os
+import re
+import uuid
 import psycopg2
 from psycopg2 import sql
-from psycopg2.extras import DictCursor
+from psycopg2.extensions import cursor as TupleCursor
+from psycopg2.extras import DictCursor, NamedTupleCursor
 from dotenv import load_dotenv
 
+from lrucache import LRUCache
+
 load_dotenv()  # Загружаем переменные окружения из .env файла
 
 
+# Формат строк, которые возвращают методы чтения: словари (DictRow), кортежи или именованные кортежи
+ROW_FORMATS = {
+    'dict': DictCursor,
+    'tuple': TupleCursor,
+    'record': NamedTupleCursor,
+}
+
+# Перевал со связанными данными для методов чтения
+PEREVAL_SELECT = sql.SQL("""
+    SELECT p.id, p.beauty_title, p.title, p.other_titles, p.connect, p.add_time, p.status,
+           p.user_id, u.email, c.latitude, c.longitude, c.height,
+           l.winter, l.summer, l.autumn, l.spring
+    FROM pereval_added p
+    JOIN users u ON u.id = p.user_id
+    JOIN coords c ON c.id = p.coord_id
+    JOIN pereval_levels l ON l.id = p.level_id
+""")
+
+# Запись перевала одним оператором: цепочка CTE, изображения передаются массивом JSON.
+# Первый CTE (u) - upsert пользователя или уже известный id пользователя.
+USER_UPSERT_CTE = """
+    u AS (
+        INSERT INTO users (email, phone, last_name, first_name, middle_name)
+        VALUES (%s, %s, %s, %s, %s)
+        ON CONFLICT (email) DO UPDATE SET
+            phone = EXCLUDED.phone,
+            last_name = EXCLUDED.last_name,
+            first_name = EXCLUDED.first_name,
+            middle_name = EXCLUDED.middle_name
+        RETURNING id
+    )"""
+KNOWN_USER_CTE = """
+    u AS (SELECT %s::integer AS id)"""
+SUBMIT_CTE = """,
+    c AS (
+        INSERT INTO coords (latitude, longitude, height)
+        VALUES (%s, %s, %s)
+        RETURNING id
+    ),
+    l AS (
+        INSERT INTO pereval_levels (winter, summer, autumn, spring)
+        VALUES (%s, %s, %s, %s)
+        RETURNING id
+    ),
+    p AS (
+        INSERT INTO pereval_added (
+            beauty_title, title, other_titles, connect, add_time,
+            user_id, coord_id, level_id, area_id, activity_type, status
+        )
+        VALUES (%s, %s, %s, %s, %s, (SELECT id FROM u), (SELECT id FROM c), (SELECT id FROM l), %s, %s, 'new')
+        RETURNING id, user_id
+    ),
+    i AS (
+        INSERT INTO pereval_images (title, file_path, file_size, file_type, width, height, uploaded_by)
+        SELECT image.title, image.file_path, image.file_size, image.file_type, image.width, image.height, p.user_id
+        FROM p, jsonb_to_recordset(%s::jsonb) AS image(
+            title text, file_path text, file_size integer, file_type text, width integer, height integer
+        )
+        RETURNING id
+    ),
+    links AS (
+        INSERT INTO pereval_images_links (pereval_id, image_id)
+        SELECT p.id, i.id FROM p, i
+    )
+SELECT id, user_id FROM p
+"""
+SUBMIT_QUERY = 'WITH' + USER_UPSERT_CTE + SUBMIT_CTE
+SUBMIT_KNOWN_USER_QUERY = 'WITH' + KNOWN_USER_CTE + SUBMIT_CTE
+
+
+def numbered_params(query):
+    """%s -> $1, $2, ... (параметры подготовленного оператора)"""
+    counter = itertools.count(1)
+    return re.sub(r'%s', lambda match: f'${next(counter)}', query)
+
+
+def submit_params(pereval_data):
+    """
+    Параметры записи перевала для SUBMIT_QUERY / SUBMIT_KNOWN_USER_QUERY:
+    (данные пользователя без email, остальные параметры по порядку)
+    """
+    user_data = pereval_data.get('user') or {}
+    fields = (
+        user_data.get('phone'),
+        user_data.get('fam'),
+        user_data.get('name'),
+        user_data.get('otc')
+    )
+    coords = pereval_data.get('coords')
+    levels = pereval_data.get('level')
+    images = [
+        {
+            'title': image.get('title'),
+            'file_path': image.get('file_path'),
+            'file_size': image.get('file_size'),
+            'file_type': image.get('file_type'),
+            'width': image.get('width'),
+            'height': image.get('height'),
+        }
+        for image in pereval_data.get('images', [])
+    ]
+    params = [
+        coords.get('latitude'), coords.get('longitude'), coords.get('height'),
+        levels.get('winter'), levels.get('summer'), levels.get('autumn'), levels.get('spring'),
+        pereval_data.get('beautyTitle'), pereval_data.get('title'), pereval_data.get('other_titles'),
+        pereval_data.get('connect'), pereval_data.get('add_time'),
+        pereval_data.get('area_id'), pereval_data.get('activity_type'),
+        json.dumps(images),
+    ]
+    return fields, params
+
+
 class PerevalDatabase:
+    # Кэш (база, email) -> (id пользователя, данные пользователя), общий для всех экземпляров
+    # (и для AsyncPerevalDatabase). Если данные пользователя не изменились, upsert не выполняется.
+    user_cache = LRUCache(
+        maxsize=int(os.getenv('FSTR_USER_CACHE_SIZE', '10000')),
+        ttl=int(os.getenv('FSTR_USER_CACHE_TTL', '3600')),
+    )
+
     def __init__(self):
         self.db_host = os.getenv('FSTR_DB_HOST')
         self.db_port = os.getenv('FSTR_DB_PORT')
@@ -16,19 +142,35 @@ class PerevalDatabase:
         self.db_name = 'pereval'  # Можно также вынести в переменные окружения
         self.conn = None
         self.cursor = None
+        # Подготовленные операторы (PREPARE) - выключить для PgBouncer в режиме transaction
+        self.use_prepared = os.getenv('FSTR_DB_PREPARE', 'True').lower() in ('1', 'true', 'yes')
+        self._prepared = set()  # операторы, подготовленные в текущем соединении
+        # Сколько строк серверный курсор передаёт за один сетевой обмен
+        self.itersize = int(os.getenv('FSTR_DB_ITERSIZE', '2000'))
+
+    @property
+    def database_key(self):
+        """База, к которой относятся id пользователей в кэше"""
+        return f'{self.db_host}:{self.db_port}/{self.db_name}'
+
+    def _open_connection(self):
+        return psycopg2.connect(
+            host=self.db_host,
+            port=self.db_port,
+            dbname=self.db_name,
+            user=self.db_login,
+            password=self.db_pass,
+            cursor_factory=DictCursor,
+        )
 
     def connect(self):
         """Установка соединения с базой данных"""
         try:
-            self.conn = psycopg2.connect(
-                host=self.db_host,
-                port=self.db_port,
-                dbname=self.db_name,
-                user=self.db_login,
-                password=self.db_pass,
-                cursor_factory=DictCursor,
-            )
+            self.conn = self._open_connection()
+            # Перевал записывается одним оператором, отдельный COMMIT не нужен
+            self.conn.autocommit = True
             self.cursor = self.conn.cursor()
+            self._prepared = set()
             print("Успешное подключение к базе данных")
         except Exception as e:
             print(f"Ошибка подключения к базе данных: {e}")
@@ -40,177 +182,115 @@ class PerevalDatabase:
             self.conn.close()
             print("Соединение с базой данных закрыто")
 
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.disconnect()
+
+    def iter_passes(self, status=None, user_email=None, since=None, itersize=None, row_format='dict'):
+        """
+        Перевалы (с email пользователя, координатами и уровнями сложности) по одному,
+        в порядке id. Строки читаются серверным (именованным) курсором пачками по itersize,
+        поэтому в памяти не держится вся таблица.
+        :param status: только перевалы с этим статусом
+        :param user_email: только перевалы пользователя
+        :param since: только добавленные начиная с этого момента (datetime)
+        :param itersize: строк за один сетевой обмен (по умолчанию FSTR_DB_ITERSIZE)
+        :param row_format: 'dict', 'tuple' или 'record' (именованный кортеж)
+        """
+        if row_format not in ROW_FORMATS:
+            raise ValueError(f"Неизвестный формат строк: {row_format}")
+
+        conditions = []
+        params = []
+        for condition, value in (('p.status = %s', status), ('u.email = %s', user_email), ('p.add_time >= %s', since)):
+            if value is not None:
+                conditions.append(sql.SQL(condition))
+                params.append(value)
+        query = PEREVAL_SELECT
+        if conditions:
+            query += sql.SQL(' WHERE ') + sql.SQL(' AND ').join(conditions)
+        query += sql.SQL(' ORDER BY p.id')
+
+        # Отдельное соединение: чтение не мешает submit_data на этом же объекте
+        conn = self._open_connection()
+        try:
+            with conn.cursor(name=f'pereval_read_{uuid.uuid4().hex}', cursor_factory=ROW_FORMATS[row_format]) as cursor:
+                cursor.itersize = itersize or self.itersize
+                cursor.execute(query, params)
+                yield from cursor
+            conn.rollback()  # транзакция только читала
+        finally:
+            conn.close()
+
+    def iter_by_status(self, status, **kwargs):
+        """Перевалы со статусом status (new, pending, accepted, rejected)"""
+        return self.iter_passes(status=status, **kwargs)
+
+    def iter_by_user(self, email, **kwargs):
+        """Перевалы пользователя с указанным email"""
+        return self.iter_passes(user_email=email, **kwargs)
+
+    def iter_since(self, since, **kwargs):
+        """Перевалы, добавленные начиная с момента since"""
+        return self.iter_passes(since=since, **kwargs)
+
     def submit_data(self, pereval_data):
         """
-        Добавление нового перевала в базу данных
+        Добавление нового перевала в базу данных.
+        Пользователь, координаты, уровни сложности, перевал и изображения записываются
+        одним оператором (цепочка CTE) - один обмен с сервером на перевал.
         :param pereval_data: словарь с данными о перевале
         :return: ID созданной записи или None в случае ошибки
         """
+        # Внутри "with PerevalDatabase() as db" соединение и подготовленные операторы переиспользуются
+        own_connection = self.conn is None or self.conn.closed
+        user_data = pereval_data.get('user') or {}
+        email = user_data.get('email')
+        cache_key = (self.database_key, email)
         try:
-            self.connect()
-
-            # 1. Сначала добавляем пользователя (если его нет)
-            user_id = self._add_user(pereval_data.get('user'))
-            if not user_id:
-                raise ValueError("Не удалось добавить пользователя")
-
-            # 2. Добавляем координаты
-            coords = pereval_data.get('coords')
-            coord_id = self._add_coords(
-                latitude=coords.get('latitude'),
-                longitude=coords.get('longitude'),
-                height=coords.get('height')
-            )
-            if not coord_id:
-                raise ValueError("Не удалось добавить координаты")
-
-            # 3. Добавляем уровни сложности
-            levels = pereval_data.get('level')
-            level_id = self._add_levels(
-                winter=levels.get('winter'),
-                summer=levels.get('summer'),
-                autumn=levels.get('autumn'),
-                spring=levels.get('spring')
-            )
-            if not level_id:
-                raise ValueError("Не удалось добавить уровни сложности")
-
-            # 4. Добавляем сам перевал
-            pereval_id = self._add_pereval(
-                beauty_title=pereval_data.get('beautyTitle'),
-                title=pereval_data.get('title'),
-                other_titles=pereval_data.get('other_titles'),
-                connect=pereval_data.get('connect'),
-                add_time=pereval_data.get('add_time'),
-                user_id=user_id,
-                coord_id=coord_id,
-                level_id=level_id,
-                area_id=pereval_data.get('area_id'),
-                activity_type=pereval_data.get('activity_type')
-            )
+            if own_connection:
+                self.connect()
 
-            # 5. Добавляем изображения
-            images = pereval_data.get('images', [])
-            for image in images:
-                self._add_image(
-                    pereval_id=pereval_id,
-                    title=image.get('title'),
-                    file_path=image.get('file_path'),
-                    file_size=image.get('file_size'),
-                    file_type=image.get('file_type'),
-                    width=image.get('width'),
-                    height=image.get('height'),
-                    uploaded_by=user_id
-                )
-
-            self.conn.commit()
-            return pereval_id
+            fields, params = submit_params(pereval_data)
 
-        except Exception as e:
-            print(f"Ошибка при добавлении перевала: {e}")
-            if self.conn:
-                self.conn.rollback()
-            return None
-        finally:
-            self.disconnect()
-
-    def _add_user(self, user_data):
-        """Добавление пользователя в базу данных"""
-        query = sql.SQL("""
-            INSERT INTO users (email, phone, last_name, first_name, middle_name)
-            VALUES (%s, %s, %s, %s, %s)
-            ON CONFLICT (email) DO UPDATE SET
-                phone = EXCLUDED.phone,
-                last_name = EXCLUDED.last_name,
-                first_name = EXCLUDED.first_name,
-                middle_name = EXCLUDED.middle_name
-            RETURNING id
-        """)
-        try:
-            self.cursor.execute(query, (
-                user_data.get('email'),
-                user_data.get('phone'),
-                user_data.get('fam'),
-                user_data.get('name'),
-                user_data.get('otc')
-            ))
-            return self.cursor.fetchone()['id']
-        except Exception as e:
-            print(f"Ошибка при добавлении пользователя: {e}")
-            return None
+            # Если данные пользователя не изменились, upsert не нужен - id берётся из кэша
+            cached = self.user_cache.get(cache_key)
+            if cached is not None and cached[1] == fields:
+                self._execute_prepared('pereval_submit_known_user', SUBMIT_KNOWN_USER_QUERY, [cached[0]] + params)
+            else:
+                self._execute_prepared('pereval_submit', SUBMIT_QUERY, [email, *fields] + params)
+            row = self.cursor.fetchone()
 
-    def _add_coords(self, latitude, longitude, height):
-        """Добавление координат"""
-        query = sql.SQL("""
-            INSERT INTO coords (latitude, longitude, height)
-            VALUES (%s, %s, %s)
-            RETURNING id
-        """)
-        try:
-            self.cursor.execute(query, (latitude, longitude, height))
-            return self.cursor.fetchone()['id']
-        except Exception as e:
-            print(f"Ошибка при добавлении координат: {e}")
-            return None
+            self.user_cache.set(cache_key, (row['user_id'], fields))
+            return row['id']
 
-    def _add_levels(self, winter, summer, autumn, spring):
-        """Добавление уровней сложности"""
-        query = sql.SQL("""
-            INSERT INTO pereval_levels (winter, summer, autumn, spring)
-            VALUES (%s, %s, %s, %s)
-            RETURNING id
-        """)
-        try:
-            self.cursor.execute(query, (winter, summer, autumn, spring))
-            return self.cursor.fetchone()['id']
-        except Exception as e:
-            print(f"Ошибка при добавлении уровней сложности: {e}")
-            return None
-
-    def _add_pereval(self, beauty_title, title, other_titles, connect, add_time,
-                     user_id, coord_id, level_id, area_id=None, activity_type=None):
-        """Добавление информации о перевале"""
-        query = sql.SQL("""
-            INSERT INTO pereval_added (
-                beauty_title, title, other_titles, connect, add_time,
-                user_id, coord_id, level_id, area_id, activity_type, status
-            )
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 'new')
-            RETURNING id
-        """)
-        try:
-            self.cursor.execute(query, (
-                beauty_title, title, other_titles, connect, add_time,
-                user_id, coord_id, level_id, area_id, activity_type
-            ))
-            return self.cursor.fetchone()['id']
         except Exception as e:
             print(f"Ошибка при добавлении перевала: {e}")
+            # id из кэша мог устареть (пользователь удалён) - повторная попытка пройдёт через upsert
+            if email:
+                self.user_cache.delete(cache_key)
             return None
+        finally:
+            if own_connection:
+                self.disconnect()
 
-    def _add_image(self, pereval_id, title, file_path, file_size=None,
-                   file_type=None, width=None, height=None, uploaded_by=None):
-        """Добавление изображения"""
-        query = sql.SQL("""
-            INSERT INTO pereval_images (
-                title, file_path, file_size, file_type, width, height, uploaded_by
+    def _execute_prepared(self, name, query, params):
+        """Выполнение запроса через подготовленный оператор (PREPARE один раз на соединение)"""
+        if not self.use_prepared:
+            self.cursor.execute(query, params)
+            return
+        if name not in self._prepared:
+            self.cursor.execute(
+                sql.SQL('PREPARE {} AS ').format(sql.Identifier(name)) + sql.SQL(numbered_params(query))
             )
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-            RETURNING id
-        """)
-        try:
-            self.cursor.execute(query, (
-                title, file_path, file_size, file_type, width, height, uploaded_by
-            ))
-            image_id = self.cursor.fetchone()['id']
-
-            # Связываем изображение с перевалом
-            link_query = sql.SQL("""
-                INSERT INTO pereval_images_links (pereval_id, image_id)
-                VALUES (%s, %s)
-            """)
-            self.cursor.execute(link_query, (pereval_id, image_id))
-            return image_id
-        except Exception as e:
-            print(f"Ошибка при добавлении изображения: {e}")
-            return None
\ No newline at end of file
+            self._prepared.add(name)
+        self.cursor.execute(
+            sql.SQL('EXECUTE {} ({})').format(
+                sql.Identifier(name),
+                sql.SQL(', ').join(sql.Placeholder() * len(params))
+            ),
+            params
+        )
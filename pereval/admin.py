@@ -0,0 +1,113 @@
+from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connection
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+
+from .models import Area, User, Pereval, Image
+from .moderation import set_status
+
+
+class ApproximateCountPaginator(Paginator):
+    """
+    Для больших таблиц без фильтров число строк берётся из статистики PostgreSQL
+    (pg_class.reltuples) вместо COUNT(*) по всей таблице.
+    """
+    exact_count_limit = 100000  # меньше - считаем точно
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if connection.vendor == 'postgresql' and query is not None and not query.where:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                               [self.object_list.model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] > self.exact_count_limit:
+                return row[0]
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False  # без второго COUNT(*) при поиске и фильтрах
+    list_per_page = 50
+
+
+def image_preview(image):
+    src = image.thumbnail_path or image.file_path
+    if not src:
+        return '-'
+    return format_html('<img src="{}" alt="{}" style="max-height: 80px; max-width: 120px">', src, image.title)
+
+
+class ImageInline(admin.TabularInline):
+    model = Image
+    extra = 0
+    fields = ['preview', 'title', 'file_path', 'file_type', 'width', 'height']
+    readonly_fields = ['preview', 'file_type', 'width', 'height']
+    raw_id_fields = ['blob']
+
+    @admin.display(description='Превью')
+    def preview(self, obj):
+        return image_preview(obj)
+
+
+@admin.register(Pereval)
+class PerevalAdmin(LargeTableAdmin):
+    list_display = ['id', 'title', 'status', 'user', 'height', 'add_time']
+    list_select_related = ['user', 'coords']
+    # Фильтры по полям с индексами (pereval_status_idx, pereval_add_time_idx, pereval_area_status_idx)
+    list_filter = ['status', 'add_time', 'area']
+    search_fields = ['title']
+    raw_id_fields = ['user', 'coords', 'level']
+    readonly_fields = ['add_time', 'area']
+    inlines = [ImageInline]
+    actions = ['mark_pending', 'mark_accepted', 'mark_rejected']
+
+    @admin.display(description='Высота', ordering='coords__height')
+    def height(self, obj):
+        return obj.coords.height
+
+    def _set_status(self, request, queryset, status):
+        updated = set_status(queryset, status)
+        self.message_user(request, f'Статус "{status}" установлен у перевалов: {updated}')
+
+    @admin.action(description='Взять в работу (pending)')
+    def mark_pending(self, request, queryset):
+        self._set_status(request, queryset, 'pending')
+
+    @admin.action(description='Принять (accepted)')
+    def mark_accepted(self, request, queryset):
+        self._set_status(request, queryset, 'accepted')
+
+    @admin.action(description='Отклонить (rejected)')
+    def mark_rejected(self, request, queryset):
+        self._set_status(request, queryset, 'rejected')
+
+
+@admin.register(Area)
+class AreaAdmin(admin.ModelAdmin):
+    list_display = ['id', 'title', 'parent']
+    search_fields = ['title']
+    raw_id_fields = ['parent']
+    readonly_fields = ['min_latitude', 'max_latitude', 'min_longitude', 'max_longitude']
+
+
+@admin.register(User)
+class UserAdmin(LargeTableAdmin):
+    list_display = ['id', 'email', 'last_name', 'first_name', 'phone']
+    search_fields = ['=email', '^last_name']
+
+
+@admin.register(Image)
+class ImageAdmin(LargeTableAdmin):
+    list_display = ['id', 'preview', 'title', 'pereval', 'file_type']
+    list_select_related = ['pereval']
+    search_fields = ['=pereval__id']
+    raw_id_fields = ['pereval', 'blob']
+    readonly_fields = ['preview', 'file_size', 'file_type', 'width', 'height', 'thumbnail_path']
+
+    @admin.display(description='Превью')
+    def preview(self, obj):
+        return image_preview(obj)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class PerevalConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pereval'
+
+    def ready(self):
+        from . import checks  # noqa: F401 - регистрация системных проверок
+        from . import signals  # noqa: F401 - сброс кэша email -> id пользователя
@@ -0,0 +1,215 @@
+"""
+Определение горного района перевала по координатам.
+
+Многоугольники районов (Area) загружаются в память процесса и индексируются
+статическим R-деревом по ограничивающим прямоугольникам (упаковка
+Sort-Tile-Recursive). Поиск района для точки просматривает только узлы,
+прямоугольник которых содержит точку, а затем проверяет попадание в сами
+многоугольники (луч, чётность пересечений; дыры учитываются). Если точка
+попадает в несколько районов (вложенные хребты), выбирается наименьший.
+
+Индекс перестраивается после изменения районов в этом процессе и не реже
+раза в AREA_INDEX_TTL секунд (районы, загруженные другим процессом).
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from . import events
+from .models import Area, Pereval, polygons
+
+_lock = threading.Lock()
+_index = None  # (момент построения, AreaIndex)
+
+
+def _ring_area(ring):
+    return sum(x1 * y2 - x2 * y1 for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1])) / 2
+
+
+def _in_ring(x, y, ring):
+    inside = False
+    x1, y1 = ring[-1]
+    for x2, y2 in ring:
+        if (y1 > y) != (y2 > y) and x < (x2 - x1) * (y - y1) / (y2 - y1) + x1:
+            inside = not inside
+        x1, y1 = x2, y2
+    return inside
+
+
+class Region:
+    """Многоугольники района, подготовленные для проверки точек"""
+
+    def __init__(self, area_id, geometry):
+        self.area_id = area_id
+        self.polygons = [[[(float(x), float(y)) for x, y, *_ in ring] for ring in polygon]
+                         for polygon in polygons(geometry)]
+        points = [point for polygon in self.polygons for ring in polygon for point in ring]
+        self.bbox = (min(x for x, _ in points), min(y for _, y in points),
+                     max(x for x, _ in points), max(y for _, y in points))
+        self.size = sum(abs(_ring_area(polygon[0])) - sum(abs(_ring_area(hole)) for hole in polygon[1:])
+                        for polygon in self.polygons)
+
+    def contains(self, x, y):
+        # Чётность пересечений по всем кольцам: точка в дыре оказывается снаружи
+        return any(sum(_in_ring(x, y, ring) for ring in polygon) % 2 for polygon in self.polygons)
+
+
+def _union(boxes):
+    boxes = list(boxes)
+    return (min(box[0] for box in boxes), min(box[1] for box in boxes),
+            max(box[2] for box in boxes), max(box[3] for box in boxes))
+
+
+class RTree:
+    """Статическое R-дерево по прямоугольникам (min_x, min_y, max_x, max_y)"""
+
+    def __init__(self, items, node_size=16):
+        # Уровень дерева - список (прямоугольник, потомки); на нижнем уровне потомок - сам объект
+        level = [(box, item) for box, item in items]
+        self.height = 0
+        while len(level) > node_size:
+            level = self._pack(level, node_size)
+            self.height += 1
+        self.root = (_union(box for box, _ in level), level) if level else None
+
+    @staticmethod
+    def _pack(entries, node_size):
+        """Sort-Tile-Recursive: полосы по x, внутри полосы - узлы по y"""
+        node_count = math.ceil(len(entries) / node_size)
+        strip_size = math.ceil(math.sqrt(node_count)) * node_size
+        entries = sorted(entries, key=lambda entry: entry[0][0] + entry[0][2])
+        nodes = []
+        for start in range(0, len(entries), strip_size):
+            strip = sorted(entries[start:start + strip_size], key=lambda entry: entry[0][1] + entry[0][3])
+            for offset in range(0, len(strip), node_size):
+                group = strip[offset:offset + node_size]
+                nodes.append((_union(box for box, _ in group), group))
+        return nodes
+
+    def search(self, x, y):
+        """Объекты, прямоугольник которых содержит точку"""
+        if self.root is None:
+            return []
+        found = []
+        stack = [(self.root[1], self.height)]
+        while stack:
+            entries, depth = stack.pop()
+            for (min_x, min_y, max_x, max_y), child in entries:
+                if min_x <= x <= max_x and min_y <= y <= max_y:
+                    if depth:
+                        stack.append((child, depth - 1))
+                    else:
+                        found.append(child)
+        return found
+
+
+class AreaIndex:
+    """R-дерево районов процесса"""
+
+    def __init__(self, regions):
+        self.tree = RTree((region.bbox, region) for region in regions)
+        self.empty = not regions
+
+    def lookup(self, latitude, longitude):
+        """id наименьшего района, содержащего точку, или None"""
+        x, y = float(longitude), float(latitude)
+        matches = [region for region in self.tree.search(x, y) if region.contains(x, y)]
+        return min(matches, key=lambda region: region.size).area_id if matches else None
+
+
+def get_index():
+    global _index
+    with _lock:
+        if _index is None or time.monotonic() - _index[0] > settings.AREA_INDEX_TTL:
+            regions = [Region(pk, geometry) for pk, geometry in Area.objects.values_list('id', 'geometry')]
+            _index = (time.monotonic(), AreaIndex(regions))
+        return _index[1]
+
+
+def invalidate():
+    global _index
+    with _lock:
+        _index = None
+
+
+def area_for(latitude, longitude):
+    """id района для точки (или None, если точка вне всех районов)"""
+    return get_index().lookup(latitude, longitude)
+
+
+def load_geojson(collection, replace=False):
+    """
+    Загружает районы из GeoJSON FeatureCollection: геометрия Polygon/MultiPolygon,
+    properties.title (или name), необязательные id объекта и properties.parent (id района).
+    Районы с теми же id обновляются; replace - удалить районы, которых нет в файле.
+    Возвращает число загруженных районов.
+    """
+    features = collection.get('features') if isinstance(collection, dict) else None
+    if not isinstance(features, list):
+        raise ValueError('Ожидается GeoJSON FeatureCollection')
+
+    with transaction.atomic():
+        loaded, parents = [], []
+        for number, feature in enumerate(features, 1):
+            properties = feature.get('properties') or {}
+            title = properties.get('title') or properties.get('name')
+            if not title:
+                raise ValueError(f'Объект {number}: нет названия (properties.title)')
+            area_id = feature.get('id', properties.get('id'))
+            area = Area(pk=area_id, title=title, geometry=feature.get('geometry') or {})
+            try:
+                area.save()
+            except (ValueError, TypeError, KeyError, IndexError) as e:
+                raise ValueError(f'Объект {number} ({title}): некорректная геометрия: {e}')
+            loaded.append(area)
+            parents.append(properties.get('parent'))
+
+        # Родители назначаются после загрузки всех районов: порядок в файле не важен
+        for area, parent_id in zip(loaded, parents):
+            if parent_id is not None:
+                area.parent_id = parent_id
+                area.save(update_fields=['parent'])
+        if replace:
+            Area.objects.exclude(pk__in=[area.pk for area in loaded]).delete()
+        # После вставки с явными id последовательность id должна их пропустить (PostgreSQL)
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [Area]):
+                cursor.execute(sql)
+    return len(loaded)
+
+
+def assign(batch_size=10000):
+    """
+    Пересчитывает районы всех перевалов (после загрузки районов или массового импорта).
+    Возвращает число перевалов, у которых район изменился.
+    """
+    # read_model импортирует сериализаторы, а они - этот модуль
+    from . import read_model
+
+    index = get_index()
+    if index.empty and not Pereval.objects.filter(area__isnull=False).exists():
+        return 0
+
+    changes = {}
+    rows = Pereval.objects.order_by().values_list('id', 'coords__latitude', 'coords__longitude', 'area_id')
+    for pk, latitude, longitude, area_id in rows.iterator(chunk_size=batch_size):
+        new_area = index.lookup(latitude, longitude)
+        if new_area != area_id:
+            changes.setdefault(new_area, []).append(pk)
+
+    changed = 0
+    for area_id, ids in changes.items():
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            # update() не вызывает сигналы: документы и события обновляются явно
+            with transaction.atomic():
+                Pereval.objects.filter(pk__in=batch).update(area_id=area_id)
+                read_model.refresh_many(Pereval.objects.filter(pk__in=batch, status=read_model.PUBLISHED_STATUS)
+                                        .values_list('pk', flat=True))
+                events.emit_updates(batch)
+            changed += len(batch)
+    return changed
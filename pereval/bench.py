@@ -0,0 +1,205 @@
+"""
+Нагрузочный бенчмарк API.
+
+Заполняет базу синтетическими данными (пользователи, перевалы, изображения)
+и прогоняет в процессе запросы к SubmitDataView, SubmitDataDetail,
+SubmitDataUpdate и SubmitDataUserList с заданной параллельностью.
+Результат - словарь, пригодный для сохранения в JSON и сравнения между коммитами.
+"""
+import json
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .geo import grid_cell_for
+from .models import User, Coords, Level, Pereval, Image
+
+SCENARIOS = ('create', 'detail', 'update', 'user-list')
+
+DIFFICULTY_LEVELS = ['1A', '1B', '2A', '2B', '3A', '3B']
+
+# Все запросы бенчмарка идут с одного адреса: троттлинг и admission control отклоняли бы
+# большую часть из них, и замер показывал бы время ответов 429/503
+BENCHMARK_SETTINGS = {'RATE_LIMIT_ENABLED': False, 'ADMISSION_ENDPOINTS': []}
+
+
+def seed_dataset(users=100, passes=1000, images_per_pass=2, seed=0, batch_size=1000):
+    """
+    Заполняет базу синтетическими данными через bulk_create.
+    :return: словарь с id перевалов и email пользователей для сценариев
+    """
+    rnd = random.Random(seed)
+
+    user_objs = User.objects.bulk_create([
+        User(
+            email=f'bench{i}@example.com',
+            last_name=f'Фамилия{i}',
+            first_name=f'Имя{i}',
+            middle_name='',
+            phone=f'+7999{i:07d}',
+        )
+        for i in range(users)
+    ], batch_size=batch_size)
+    # На SQLite и PostgreSQL bulk_create возвращает объекты с id
+    user_ids = [user.pk for user in user_objs]
+
+    points = [(rnd.uniform(-60, 70), rnd.uniform(-180, 180)) for _ in range(passes)]
+    coords = Coords.objects.bulk_create([
+        Coords(latitude=lat, longitude=lon, height=rnd.randint(500, 7000), grid_cell=grid_cell_for(lat, lon))
+        for lat, lon in points
+    ], batch_size=batch_size)
+    levels = Level.objects.bulk_create([
+        Level(winter=rnd.choice(DIFFICULTY_LEVELS), summer=rnd.choice(DIFFICULTY_LEVELS))
+        for _ in range(passes)
+    ], batch_size=batch_size)
+    perevals = Pereval.objects.bulk_create([
+        Pereval(
+            title=f'Перевал {i}',
+            beauty_title='пер. ',
+            user_id=rnd.choice(user_ids),
+            coords=coords[i],
+            level=levels[i],
+        )
+        for i in range(passes)
+    ], batch_size=batch_size)
+    Image.objects.bulk_create([
+        Image(pereval=pereval, file_path=f'/media/bench/{pereval.pk}_{j}.jpg', title=f'Фото {j}')
+        for pereval in perevals
+        for j in range(images_per_pass)
+    ], batch_size=batch_size)
+
+    return {
+        'pereval_ids': [pereval.pk for pereval in perevals],
+        'emails': [user.email for user in user_objs],
+    }
+
+
+def _submit_payload(rnd, email):
+    return {
+        'beauty_title': 'пер. ',
+        'title': f'Новый перевал {rnd.randint(0, 10 ** 6)}',
+        'other_titles': '',
+        'connect': '',
+        'user': {
+            'email': email,
+            'last_name': 'Бенчмарк',
+            'first_name': 'Тест',
+            'middle_name': '',
+            'phone': '+79990000000',
+        },
+        'coords': {
+            'latitude': rnd.uniform(-60, 70),
+            'longitude': rnd.uniform(-180, 180),
+            'height': rnd.randint(500, 7000),
+        },
+        'level': {'winter': rnd.choice(DIFFICULTY_LEVELS), 'summer': rnd.choice(DIFFICULTY_LEVELS)},
+        'images': [{'file_path': '/media/bench/new.jpg', 'title': 'Фото'}],
+    }
+
+
+def _make_request(client, scenario, dataset, rnd):
+    if scenario == 'create':
+        return client.post(
+            reverse('submit-data'),
+            data=json.dumps(_submit_payload(rnd, rnd.choice(dataset['emails']))),
+            content_type='application/json',
+        )
+    if scenario == 'detail':
+        return client.get(reverse('submit-data-detail', kwargs={'pk': rnd.choice(dataset['pereval_ids'])}))
+    if scenario == 'update':
+        return client.patch(
+            reverse('submit-data-update', kwargs={'pk': rnd.choice(dataset['pereval_ids'])}),
+            data=json.dumps({'title': f'Обновлённый перевал {rnd.randint(0, 10 ** 6)}'}),
+            content_type='application/json',
+        )
+    if scenario == 'user-list':
+        return client.get(reverse('submit-data-user-list'), {'user__email': rnd.choice(dataset['emails'])})
+    raise ValueError(f'Неизвестный сценарий: {scenario}')
+
+
+def percentile(sorted_values, pct):
+    """Перцентиль методом ближайшего ранга"""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(pct / 100 * len(sorted_values)), 1)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def run_scenario(scenario, dataset, requests=200, concurrency=4, seed=0):
+    """
+    Выполняет requests запросов сценария в concurrency потоках.
+    При concurrency=1 запросы идут в текущем потоке (удобно внутри TestCase).
+    Ограничение частоты запросов и admission control на время замера отключены.
+    """
+    local = threading.local()
+    counter = iter(range(requests))
+    counter_lock = threading.Lock()
+    results = []
+    results_lock = threading.Lock()
+
+    def worker(worker_id):
+        client = Client()
+        rnd = random.Random(seed * 1000 + worker_id)
+        samples = []
+        while True:
+            with counter_lock:
+                if next(counter, None) is None:
+                    break
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = _make_request(client, scenario, dataset, rnd)
+                elapsed = time.perf_counter() - start
+            samples.append((elapsed, len(queries), response.status_code))
+        with results_lock:
+            results.extend(samples)
+        if concurrency > 1:
+            connection.close()
+
+    with override_settings(**BENCHMARK_SETTINGS):
+        started = time.perf_counter()
+        if concurrency == 1:
+            worker(0)
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                list(executor.map(worker, range(concurrency)))
+        wall_time = time.perf_counter() - started
+
+    latencies = sorted(sample[0] for sample in results)
+    errors = sum(1 for sample in results if sample[2] >= 400)
+    to_ms = lambda value: round(value * 1000, 3) if value is not None else None  # noqa: E731
+
+    return {
+        'scenario': scenario,
+        'requests': len(results),
+        'concurrency': concurrency,
+        'errors': errors,
+        'throughput_rps': round(len(results) / wall_time, 2) if wall_time else None,
+        'latency_ms': {
+            'p50': to_ms(percentile(latencies, 50)),
+            'p95': to_ms(percentile(latencies, 95)),
+            'p99': to_ms(percentile(latencies, 99)),
+            'max': to_ms(latencies[-1] if latencies else None),
+        },
+        'queries_per_request': round(sum(sample[1] for sample in results) / len(results), 2) if results else None,
+    }
+
+
+def run_benchmark(scenarios=SCENARIOS, users=100, passes=1000, images_per_pass=2,
+                  requests=200, concurrency=4, seed=0):
+    """Заполняет базу и прогоняет все сценарии"""
+    dataset = seed_dataset(users=users, passes=passes, images_per_pass=images_per_pass, seed=seed)
+    return {
+        'dataset': {'users': users, 'passes': passes, 'images_per_pass': images_per_pass, 'seed': seed},
+        'database': connection.vendor,
+        'results': [
+            run_scenario(scenario, dataset, requests=requests, concurrency=concurrency, seed=seed)
+            for scenario in scenarios
+        ],
+    }
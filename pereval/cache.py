@@ -0,0 +1,2 @@
+# Кэш вынесен в lrucache: он нужен и клиентам базы, которые работают без Django
+from lrucache import LRUCache  # noqa: F401
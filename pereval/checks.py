@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+
+@register()
+def check_production_database(app_configs, **kwargs):
+    """Предупреждение, если production-развёртывание работает на SQLite"""
+    errors = []
+    engine = settings.DATABASES.get('default', {}).get('ENGINE', '')
+
+    if settings.PRODUCTION and engine.endswith('sqlite3'):
+        errors.append(Warning(
+            'Production-развёртывание (DJANGO_DEBUG=False) использует SQLite',
+            hint='Укажите DJANGO_DB_ENGINE=postgresql и параметры FSTR_DB_* в окружении',
+            id='pereval.W001',
+        ))
+
+    return errors
@@ -0,0 +1,175 @@
+"""
+Генерация синтетических перевалов для нагрузочного тестирования.
+
+Данные порождаются пачками: пачка с номером N всегда строится генератором
+random.Random(f'{seed}:{N}'), поэтому набор данных воспроизводим при любом
+числе параллельных процессов. Пачки пишутся через bulk_create в обход сигналов:
+события создания пишутся в транзакции пачки, документы принятых перевалов
+пересобираются после генерации.
+"""
+import random
+
+from django.db import transaction
+
+from . import events
+from .geo import grid_cell_for
+from .models import User, Coords, Level, Pereval, Image
+
+# Горные районы: (название, широта мин/макс, долгота мин/макс, высота мин/макс)
+MOUNTAIN_RANGES = [
+    ('Кавказ', 42.0, 43.8, 40.0, 46.5, 2500, 5000),
+    ('Алтай', 49.0, 51.0, 85.0, 90.0, 2000, 4300),
+    ('Памир', 37.0, 39.5, 71.0, 75.0, 3500, 6500),
+    ('Тянь-Шань', 41.0, 43.5, 74.0, 80.0, 3000, 5500),
+    ('Саяны', 51.5, 53.5, 93.0, 101.0, 1800, 3400),
+    ('Хибины', 67.5, 68.0, 33.2, 34.2, 600, 1200),
+    ('Урал', 54.0, 64.0, 57.0, 60.0, 800, 1800),
+    ('Альпы', 45.5, 47.5, 6.0, 13.5, 2000, 4000),
+    ('Гималаи', 27.5, 30.5, 80.0, 88.5, 4500, 6500),
+    ('Анды', -33.5, -13.0, -72.0, -67.0, 3500, 5800),
+]
+
+TITLE_ADJECTIVES = [
+    'Северный', 'Южный', 'Ледовый', 'Каменный', 'Сухой', 'Снежный', 'Орлиный',
+    'Красный', 'Голубой', 'Туманный', 'Ветреный', 'Озёрный', 'Дальний', 'Верхний',
+]
+TITLE_NOUNS = [
+    'Перевал', 'Седло', 'Проход', 'Гребень', 'Цирк', 'Кулуар', 'Взлёт', 'Плечо',
+]
+
+# Категории трудности по возрастанию
+DIFFICULTY_LEVELS = ['', '1A', '1B', '2A', '2B', '3A', '3B']
+
+# Распределение статусов: большинство перевалов уже прошли модерацию
+STATUS_WEIGHTS = [('new', 10), ('pending', 5), ('accepted', 75), ('rejected', 10)]
+
+
+def create_users(count, batch_size=1000):
+    """Создаёт (или находит существующих) пользователей user<i>@example.com"""
+    emails = [f'user{i}@example.com' for i in range(count)]
+    User.objects.bulk_create([
+        User(
+            email=email,
+            last_name=f'Фамилия{i}',
+            first_name=f'Имя{i}',
+            middle_name='',
+            phone=f'+7999{i:07d}',
+        )
+        for i, email in enumerate(emails)
+    ], batch_size=batch_size, ignore_conflicts=True)
+    return list(User.objects.filter(email__in=emails).order_by('id').values_list('id', flat=True))
+
+
+def _difficulty(rnd, height, low, high):
+    # Чем выше перевал относительно района, тем выше категория
+    position = (height - low) / max(high - low, 1)
+    index = min(int(position * (len(DIFFICULTY_LEVELS) - 1) + rnd.random() * 2), len(DIFFICULTY_LEVELS) - 1)
+    return DIFFICULTY_LEVELS[index]
+
+
+def generate_batch(batch_index, batch_size, user_ids, seed=0, max_images=3):
+    """
+    Создаёт одну пачку перевалов с координатами, уровнями и изображениями
+    в одной транзакции.
+    :return: список id созданных перевалов
+    """
+    rnd = random.Random(f'{seed}:{batch_index}')
+    statuses, weights = zip(*STATUS_WEIGHTS)
+
+    coords, levels, passes = [], [], []
+    for i in range(batch_size):
+        _, lat_min, lat_max, lon_min, lon_max, h_min, h_max = rnd.choice(MOUNTAIN_RANGES)
+        height = rnd.randint(h_min, h_max)
+        latitude = round(rnd.uniform(lat_min, lat_max), 6)
+        longitude = round(rnd.uniform(lon_min, lon_max), 6)
+        coords.append(Coords(
+            latitude=latitude,
+            longitude=longitude,
+            height=height,
+            grid_cell=grid_cell_for(latitude, longitude),  # bulk_create не вызывает save()
+        ))
+        summer = _difficulty(rnd, height, h_min, h_max)
+        levels.append(Level(
+            winter=DIFFICULTY_LEVELS[min(DIFFICULTY_LEVELS.index(summer) + 1, len(DIFFICULTY_LEVELS) - 1)],
+            summer=summer,
+            autumn=summer,
+            spring=summer,
+        ))
+        title = f'{rnd.choice(TITLE_ADJECTIVES)} {rnd.choice(TITLE_NOUNS).lower()}'
+        passes.append(Pereval(
+            beauty_title='пер. ',
+            title=f'{title} {batch_index * batch_size + i}',
+            other_titles=rnd.choice(['', title]),
+            connect='',
+            status=rnd.choices(statuses, weights)[0],
+            user_id=rnd.choice(user_ids),
+        ))
+
+    with transaction.atomic():
+        coords = Coords.objects.bulk_create(coords)
+        levels = Level.objects.bulk_create(levels)
+        for pereval, coord, level in zip(passes, coords, levels):
+            pereval.coords = coord
+            pereval.level = level
+        passes = Pereval.objects.bulk_create(passes)
+        Image.objects.bulk_create([
+            Image(pereval=pereval, file_path=f'/media/generated/{pereval.pk}_{j}.jpg', title=f'Фото {j + 1}')
+            for pereval in passes
+            for j in range(rnd.randint(0, max_images))
+        ])
+        events.emit_created(passes)
+
+    return [pereval.pk for pereval in passes]
+
+
+def init_worker():
+    """Инициализация дочернего процесса: Django настроен, соединения родителя не используются"""
+    import django
+    from django.apps import apps
+    from django.db import connections
+
+    if not apps.ready:
+        django.setup()
+    connections.close_all()
+
+
+def _run_batch(args):
+    return len(generate_batch(*args))
+
+
+def generate_passes(total, users=1000, batch_size=1000, workers=1, seed=0, max_images=3, progress=None):
+    """
+    Генерирует total перевалов пачками по batch_size.
+    При workers > 1 пачки создаются в пуле процессов.
+    :param progress: функция, вызываемая с числом созданных перевалов после каждой пачки
+    :return: число созданных перевалов
+    """
+    from django.db import connections
+    # read_model импортирует сериализаторы и зависит от приложения целиком
+    from . import read_model
+
+    user_ids = create_users(users)
+    batches = [
+        (index, min(batch_size, total - index * batch_size), user_ids, seed, max_images)
+        for index in range((total + batch_size - 1) // batch_size)
+    ]
+
+    created = 0
+    if workers <= 1:
+        for batch in batches:
+            created += _run_batch(batch)
+            if progress:
+                progress(created)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+            for count in executor.map(_run_batch, batches):
+                created += count
+                if progress:
+                    progress(created)
+
+    # Документы принятых перевалов (bulk_create не вызывает сигналы read_model)
+    read_model.refresh_all()
+    return created
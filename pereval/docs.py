@@ -0,0 +1,43 @@
+"""
+Подключение документации API.
+
+Пакеты документации (drf_yasg, drf_spectacular) импортируются только при
+API_DOCS_ENABLED=True, поэтому воркеры без документации их не загружают.
+"""
+from django.conf import settings
+
+
+def _noop(*args, **kwargs):
+    return None
+
+
+class _DisabledOpenapi:
+    """Заглушка drf_yasg.openapi: при выключенной документации описания не строятся"""
+
+    def __getattr__(self, name):
+        return _noop
+
+
+def _disabled_swagger_auto_schema(**kwargs):
+    return lambda view_method: view_method
+
+
+if settings.API_DOCS_ENABLED:
+    from drf_yasg.utils import swagger_auto_schema
+    from drf_yasg import openapi
+else:
+    swagger_auto_schema = _disabled_swagger_auto_schema
+    openapi = _DisabledOpenapi()
+
+
+def docs_urlpatterns():
+    """Маршруты документации (импорт drf_spectacular происходит здесь)"""
+    from django.urls import path
+    from drf_spectacular.views import SpectacularSwaggerView, SpectacularRedocView
+    from .schema_views import CachedSpectacularAPIView
+
+    return [
+        path('submitData/schema/', CachedSpectacularAPIView.as_view(), name='schema'),
+        path('submitData/swagger/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
+        path('submitData/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
+    ]
@@ -0,0 +1,97 @@
+"""
+Поиск возможных дублей перевала при добавлении.
+
+Кандидаты выбираются по пространственной сетке (Coords.grid_cell) в радиусе
+DUPLICATE_RADIUS_M, затем сравниваются названия (title, other_titles) по
+триграммам. В PostgreSQL похожесть считает pg_trgm в самом запросе (по уже
+отобранным по сетке кандидатам, индекс для этого не нужен), в остальных СУБД -
+тот же алгоритм в Python.
+Найденные пары сохраняются в DuplicateCandidate для модераторов.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models.functions import Greatest
+
+from .geo import grid_cells_within, haversine_m
+from .models import Pereval, DuplicateCandidate
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def trigrams(text):
+    """Множество триграмм строки, как в pg_trgm (слова дополняются пробелами)"""
+    result = set()
+    for word in _WORD_RE.findall((text or '').lower()):
+        padded = f'  {word} '
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def similarity(a, b):
+    """Похожесть строк по триграммам (0..1), как similarity() в pg_trgm"""
+    ta, tb = trigrams(a), trigrams(b)
+    if not ta or not tb:
+        return 0.0
+    return len(ta & tb) / len(ta | tb)
+
+
+def _names(title, other_titles):
+    return [name for name in (title, other_titles) if name and name.strip()]
+
+
+def find_duplicates(pereval, radius_m=None, threshold=None):
+    """
+    Перевалы в радиусе radius_m от pereval с похожим названием.
+    :return: список (перевал, расстояние в метрах, похожесть)
+    """
+    radius_m = settings.DUPLICATE_RADIUS_M if radius_m is None else radius_m
+    threshold = settings.DUPLICATE_TITLE_SIMILARITY if threshold is None else threshold
+    coords = pereval.coords
+    names = _names(pereval.title, pereval.other_titles)
+    if not names:
+        return []
+
+    candidates = (Pereval.objects
+                  .filter(coords__grid_cell__in=grid_cells_within(coords.latitude, coords.longitude, radius_m))
+                  .exclude(pk=pereval.pk)
+                  .select_related('coords')
+                  .only('id', 'title', 'other_titles', 'coords__latitude', 'coords__longitude'))
+
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import TrigramSimilarity
+
+        scores = [TrigramSimilarity(field, name) for field in ('title', 'other_titles') for name in names]
+        candidates = candidates.annotate(
+            title_similarity=Greatest(*scores) if len(scores) > 1 else scores[0]
+        ).filter(title_similarity__gte=threshold)
+        scored = [(candidate, candidate.title_similarity) for candidate in candidates]
+    else:
+        scored = []
+        for candidate in candidates:
+            score = max(
+                (similarity(name, other) for name in names
+                 for other in _names(candidate.title, candidate.other_titles)),
+                default=0.0,
+            )
+            if score >= threshold:
+                scored.append((candidate, score))
+
+    result = []
+    for candidate, score in scored:
+        distance = haversine_m(coords.latitude, coords.longitude,
+                               candidate.coords.latitude, candidate.coords.longitude)
+        if distance <= radius_m:
+            result.append((candidate, distance, score))
+    return sorted(result, key=lambda item: item[1])
+
+
+def flag_duplicates(pereval):
+    """Сохраняет найденные возможные дубли для модераторов, возвращает их число"""
+    found = find_duplicates(pereval)
+    DuplicateCandidate.objects.bulk_create([
+        DuplicateCandidate(pereval=pereval, duplicate_of=candidate, distance_m=distance, similarity=score)
+        for candidate, distance, score in found
+    ], ignore_conflicts=True)
+    return len(found)
@@ -0,0 +1,259 @@
+"""
+События изменений перевалов и изображений для внешних потребителей.
+
+Событие (создание, изменение, смена статуса, удаление) записывается в таблицу
+ChangeEvent в той же транзакции, что и само изменение (outbox). Процесс
+manage.py relay_events переносит события в локальный журнал EVENT_LOG_DIR:
+файлы-сегменты только на дозапись, строка JSON на событие, у каждого события
+сквозной номер (offset). Имя сегмента - offset его первого события; новый
+сегмент начинается, когда текущий больше EVENT_LOG_SEGMENT_BYTES.
+
+Потребители читают журнал через GET /submitData/events/ начиная с нужного
+offset и сохраняют прочитанную позицию (POST /submitData/events/commit/).
+"""
+import fcntl
+import json
+import logging
+import os
+import re
+from bisect import bisect_right
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import ChangeEvent
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = '.log'
+CONSUMER_NAME_RE = re.compile(r'^[A-Za-z0-9_.-]{1,100}$')
+
+
+def emit(entity, action, pereval_id, image_id=None, status='', previous_status=''):
+    """Записывает событие в outbox (в текущей транзакции)"""
+    return ChangeEvent.objects.create(entity=entity, action=action, pereval_id=pereval_id, image_id=image_id,
+                                      status=status or '', previous_status=previous_status or '')
+
+
+def emit_status_changes(changes, status):
+    """События смены статуса для пар (id перевала, прежний статус)"""
+    ChangeEvent.objects.bulk_create([
+        ChangeEvent(entity='pereval', action='status', pereval_id=pk, status=status, previous_status=previous)
+        for pk, previous in changes if previous != status
+    ])
+
+
+def emit_created(passes):
+    """События создания перевалов, записанных в обход сигналов (QuerySet.bulk_create)"""
+    ChangeEvent.objects.bulk_create([
+        ChangeEvent(entity='pereval', action='created', pereval_id=pereval.pk, status=pereval.status)
+        for pereval in passes
+    ])
+
+
+def emit_updates(pereval_ids):
+    """События изменения перевалов, обновлённых в обход сигналов (QuerySet.update)"""
+    ChangeEvent.objects.bulk_create([
+        ChangeEvent(entity='pereval', action='updated', pereval_id=pk) for pk in pereval_ids
+    ])
+
+
+def to_record(event, offset):
+    """Компактная запись журнала"""
+    record = {
+        'offset': offset,
+        'event': event.id,
+        'type': f'{event.entity}.{event.action}',
+        'pereval': event.pereval_id,
+        'at': event.created_at.isoformat(),
+    }
+    if event.image_id is not None:
+        record['image'] = event.image_id
+    if event.status:
+        record['status'] = event.status
+    if event.previous_status:
+        record['previous_status'] = event.previous_status
+    return record
+
+
+class EventLog:
+    """Сегментированный журнал событий на диске"""
+
+    def __init__(self, directory=None, segment_bytes=None):
+        self.directory = directory or settings.EVENT_LOG_DIR
+        self.segment_bytes = segment_bytes or settings.EVENT_LOG_SEGMENT_BYTES
+        os.makedirs(os.path.join(self.directory, 'consumers'), exist_ok=True)
+
+    def segments(self):
+        """Начальные offset сегментов по возрастанию"""
+        return sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+                      if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit())
+
+    def _segment_path(self, base):
+        return os.path.join(self.directory, f'{base:020d}{SEGMENT_SUFFIX}')
+
+    @contextmanager
+    def lock(self):
+        """Монопольная запись в журнал (один процесс пересылки за раз)"""
+        with open(os.path.join(self.directory, 'LOCK'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def last_record(self):
+        """Последняя полностью записанная запись журнала или None"""
+        records = self.tail(1)
+        return records[-1] if records else None
+
+    def tail(self, count, chunk_size=64 * 1024):
+        """До count последних полностью записанных записей по возрастанию offset (читается только конец)"""
+        found = []
+        for base in reversed(self.segments()):
+            with open(self._segment_path(base), 'rb') as segment:
+                end = segment.seek(0, os.SEEK_END)
+                # Байты после последнего перевода строки - недописанная строка, она пропускается
+                carry = None
+                while end > 0 and len(found) < count:
+                    start = max(0, end - chunk_size)
+                    segment.seek(start)
+                    data = segment.read(end - start)
+                    end = start
+                    if carry is None:
+                        data, newline, _ = data.rpartition(b'\n')
+                        if not newline:
+                            continue
+                        carry = b''
+                    lines = (data + carry).split(b'\n')
+                    # Первая строка куска может начинаться в предыдущем куске
+                    carry = lines.pop(0) if start > 0 else b''
+                    for line in reversed(lines):
+                        try:
+                            found.append(json.loads(line))
+                        except ValueError:
+                            continue
+                        if len(found) >= count:
+                            break
+            if len(found) >= count:
+                break
+        found.reverse()
+        return found
+
+    def append(self, events):
+        """Дописывает события в журнал (под lock()), возвращает следующий offset"""
+        last = self.last_record()
+        offset = last['offset'] + 1 if last else 0
+        segments = self.segments()
+        base = segments[-1] if segments else 0
+        segment = None
+        try:
+            for event in events:
+                if segment is None:
+                    path = self._segment_path(base)
+                    if os.path.exists(path) and os.path.getsize(path) >= self.segment_bytes:
+                        base = offset
+                        path = self._segment_path(base)
+                    segment = open(path, 'ab')
+                    # Строка, оборванная при сбое, отделяется от новых записей
+                    if segment.tell() and not self._ends_with_newline(path):
+                        segment.write(b'\n')
+                line = json.dumps(to_record(event, offset), ensure_ascii=False).encode('utf-8')
+                segment.write(line + b'\n')
+                offset += 1
+                if segment.tell() >= self.segment_bytes:
+                    self._close(segment)
+                    segment, base = None, offset
+        finally:
+            if segment is not None:
+                self._close(segment)
+        return offset
+
+    @staticmethod
+    def _close(segment):
+        segment.flush()
+        os.fsync(segment.fileno())
+        segment.close()
+
+    @staticmethod
+    def _ends_with_newline(path):
+        with open(path, 'rb') as segment:
+            segment.seek(-1, os.SEEK_END)
+            return segment.read(1) == b'\n'
+
+    def read(self, offset, limit):
+        """До limit записей начиная с offset"""
+        segments = self.segments()
+        index = max(bisect_right(segments, offset) - 1, 0)
+        records = []
+        for base in segments[index:]:
+            with open(self._segment_path(base), 'rb') as segment:
+                for line in segment:
+                    # Недописанная строка (идёт запись) и обрывки после сбоя пропускаются
+                    if not line.endswith(b'\n'):
+                        break
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if record['offset'] < offset:
+                        continue
+                    records.append(record)
+                    if len(records) >= limit:
+                        return records
+        return records
+
+    def committed_offset(self, consumer):
+        """Сохранённая позиция потребителя (следующий offset для чтения)"""
+        try:
+            with open(self._consumer_path(consumer)) as position:
+                return int(position.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def commit_offset(self, consumer, offset):
+        path = self._consumer_path(consumer)
+        with open(path + '.tmp', 'w') as position:
+            position.write(str(offset))
+        os.replace(path + '.tmp', path)
+
+    def _consumer_path(self, consumer):
+        if not CONSUMER_NAME_RE.match(consumer):
+            raise ValueError('Имя потребителя: латинские буквы, цифры, "_", "-", "."')
+        return os.path.join(self.directory, 'consumers', consumer)
+
+
+def relay(batch_size=1000, log=None):
+    """Переносит события из outbox в журнал, возвращает их число"""
+    log = log or EventLog()
+    with log.lock(), transaction.atomic():
+        batch = list(ChangeEvent.objects.select_for_update(skip_locked=True).order_by('id')[:batch_size])
+        if not batch:
+            return 0
+        # После сбоя между записью в журнал и удалением из outbox события не дублируются.
+        # id выдаются при вставке, а транзакции фиксируются в другом порядке, поэтому
+        # сравнивать с id последней записи нельзя: проверяются id записей конца журнала,
+        # среди которых и пачка, записанная до сбоя
+        logged = {record['event'] for record in log.tail(batch_size)}
+        events = [event for event in batch if event.id not in logged]
+        if events:
+            log.append(events)
+        ChangeEvent.objects.filter(id__in=[event.id for event in batch]).delete()
+    return len(batch)
+
+
+def run_relay(stop_event, batch_size=1000, poll_interval=1.0):
+    """Цикл пересылки событий, пока не установлен stop_event"""
+    log = EventLog()
+    try:
+        while not stop_event.is_set():
+            try:
+                relayed = relay(batch_size, log)
+            except Exception:
+                logger.exception('Ошибка пересылки событий в журнал')
+                relayed = 0
+            if not relayed:
+                stop_event.wait(poll_interval)
+    finally:
+        connection.close()
@@ -0,0 +1,59 @@
+"""
+Геометрия: расстояния и пространственная сетка для поиска соседних перевалов.
+
+Поверхность разбита на ячейки GEO_GRID_DEG x GEO_GRID_DEG градусов, номер ячейки
+хранится в Coords.grid_cell (с индексом), поэтому поиск в радиусе сводится
+к выборке нескольких соседних ячеек по индексу вместо полного просмотра таблицы.
+"""
+import math
+
+from django.conf import settings
+
+EARTH_RADIUS_M = 6371000
+METERS_PER_DEGREE = 111320
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Расстояние между точками по поверхности Земли, в метрах"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _grid_size():
+    cell = settings.GEO_GRID_DEG
+    return cell, int(math.ceil(180 / cell)), int(math.ceil(360 / cell))
+
+
+def _row_col(latitude, longitude, cell, rows, cols):
+    row = min(int((latitude + 90) // cell), rows - 1)
+    col = int((longitude + 180) // cell) % cols
+    return row, col
+
+
+def grid_cell_for(latitude, longitude):
+    """Номер ячейки сетки для точки"""
+    cell, rows, cols = _grid_size()
+    row, col = _row_col(latitude, longitude, cell, rows, cols)
+    return row * cols + col
+
+
+def grid_cells_within(latitude, longitude, radius_m):
+    """Номера всех ячеек, которые может задеть круг радиуса radius_m вокруг точки"""
+    cell, rows, cols = _grid_size()
+    dlat = radius_m / METERS_PER_DEGREE
+    cos_lat = math.cos(math.radians(min(abs(latitude) + dlat, 89.9)))
+    dlon = min(radius_m / (METERS_PER_DEGREE * cos_lat), 180)
+
+    row_min, _ = _row_col(max(latitude - dlat, -90), longitude, cell, rows, cols)
+    row_max, _ = _row_col(min(latitude + dlat, 90), longitude, cell, rows, cols)
+    col_from = int((longitude - dlon + 180) // cell)
+    col_to = int((longitude + dlon + 180) // cell)
+
+    cells = set()
+    for row in range(row_min, row_max + 1):
+        for col in range(col_from, col_to + 1):
+            cells.add(row * cols + col % cols)
+    return sorted(cells)
@@ -0,0 +1,132 @@
+"""
+Идемпотентная обработка запросов по заголовку Idempotency-Key.
+
+Первый ответ на запрос с ключом сохраняется в таблицу IdempotencyRecord в той же
+транзакции, что и изменения данных, и в кэш процесса (LRU с TTL). Повтор запроса
+с тем же ключом получает сохранённый ответ без вызова сериализатора и без записи
+в базу. Ответы 5xx не сохраняются, а их изменения откатываются, чтобы повтор
+мог выполниться заново.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import transaction, IntegrityError, DatabaseError
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .cache import LRUCache
+from .models import IdempotencyRecord
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+_cache = LRUCache(maxsize=settings.IDEMPOTENCY_CACHE_SIZE, ttl=settings.IDEMPOTENCY_TTL)
+
+
+def clear_cache():
+    _cache.clear()
+
+
+def _request_hash(request):
+    return hashlib.sha256(request.body).hexdigest()
+
+
+def _lookup(key, scope):
+    """Сохранённый ответ (request_hash, status_code, body) из кэша или базы"""
+    cached = _cache.get((key, scope))
+    if cached is not None:
+        return cached
+
+    min_created = timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_TTL)
+    record = (IdempotencyRecord.objects
+              .filter(key=key, scope=scope, created_at__gte=min_created)
+              .values_list('request_hash', 'status_code', 'response_body')
+              .first())
+    if record is not None:
+        _cache.set((key, scope), record)
+    return record
+
+
+def _replay(stored, request_hash):
+    stored_hash, status_code, body = stored
+    if stored_hash != request_hash:
+        return Response({
+            'status': status.HTTP_422_UNPROCESSABLE_ENTITY,
+            'message': f'Ключ {IDEMPOTENCY_HEADER} уже использован для другого запроса',
+            'id': None
+        }, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    return Response(body, status=status_code, headers={REPLAYED_HEADER: 'true'})
+
+
+def purge_expired():
+    """Удаляет из базы записи старше IDEMPOTENCY_TTL"""
+    min_created = timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_TTL)
+    return IdempotencyRecord.objects.filter(created_at__lt=min_created).delete()[0]
+
+
+def idempotent(view_method):
+    """Декоратор метода APIView: поддержка заголовка Idempotency-Key"""
+
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+
+        key = key[:255]
+        scope = f'{request.method} {request.path}'[:255]
+        request_hash = _request_hash(request)
+
+        stored = _lookup(key, scope)
+        if stored is not None:
+            return _replay(stored, request_hash)
+
+        response = None
+        try:
+            with transaction.atomic():
+                response = view_method(self, request, *args, **kwargs)
+                if response.status_code >= 500:
+                    transaction.set_rollback(True)
+                    return response
+
+                # Ключ записывается в одной транзакции с изменениями: параллельный
+                # запрос с тем же ключом получит IntegrityError и откатится целиком
+                body = json.loads(json.dumps(response.data, default=str))
+                IdempotencyRecord.objects.filter(
+                    key=key, scope=scope,
+                    created_at__lt=timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_TTL),
+                ).delete()
+                IdempotencyRecord.objects.create(
+                    key=key, scope=scope, request_hash=request_hash,
+                    status_code=response.status_code, response_body=body,
+                )
+        except IntegrityError:
+            if response is None:
+                raise
+            stored = _lookup(key, scope)
+            if stored is not None:
+                return _replay(stored, request_hash)
+            return Response({
+                'status': status.HTTP_409_CONFLICT,
+                'message': f'Запрос с ключом {IDEMPOTENCY_HEADER} уже обрабатывается',
+                'id': None
+            }, status=status.HTTP_409_CONFLICT)
+        except DatabaseError:
+            if response is None:
+                raise
+            # Изменения представления откатились вместе с записью ключа: ответ представления
+            # (например, id перевала) описывал бы то, чего в базе нет
+            return Response({
+                'status': status.HTTP_500_INTERNAL_SERVER_ERROR,
+                'message': 'Не удалось сохранить результат запроса, повторите его с тем же ключом',
+                'id': None
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        _cache.set((key, scope), (request_hash, response.status_code, body))
+        return response
+
+    return wrapper
@@ -0,0 +1,96 @@
+"""
+Фоновая обработка загруженных изображений: размеры, тип и миниатюра.
+
+Работа с Pillow выполняется в пуле процессов (IMAGE_PROCESS_WORKERS), чтобы не
+занимать поток запроса и не упираться в GIL. При IMAGE_PROCESSING='inline'
+обработка выполняется сразу (удобно в тестах и командах).
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def extract_metadata(path, thumbnail_path, thumbnail_size):
+    """
+    Читает размеры и формат изображения и сохраняет миниатюру JPEG.
+    Выполняется в дочернем процессе, поэтому не использует Django.
+    """
+    from PIL import Image as PILImage
+
+    with PILImage.open(path) as img:
+        metadata = {
+            'width': img.width,
+            'height': img.height,
+            'file_type': PILImage.MIME.get(img.format, ''),
+        }
+        img.thumbnail((thumbnail_size, thumbnail_size))
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+        img.save(thumbnail_path, 'JPEG', quality=85)
+    metadata['thumbnail_path'] = thumbnail_path
+    return metadata
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=settings.IMAGE_PROCESS_WORKERS)
+        return _executor
+
+
+def _thumbnail_relative_path(relative_path):
+    directory, name = os.path.split(relative_path)
+    return os.path.join(directory, 'thumbs', os.path.splitext(name)[0] + '.jpg')
+
+
+def _save_metadata(blob_id, metadata):
+    from .models import Image, ImageBlob
+    from .uploads import media_url
+
+    thumbnail = os.path.relpath(metadata['thumbnail_path'], settings.MEDIA_ROOT)
+    ImageBlob.objects.filter(pk=blob_id).update(
+        width=metadata['width'], height=metadata['height'], thumbnail_path=thumbnail,
+    )
+    fields = {
+        'width': metadata['width'],
+        'height': metadata['height'],
+        'thumbnail_path': media_url(thumbnail),
+    }
+    if metadata['file_type']:
+        fields['file_type'] = metadata['file_type']
+    Image.objects.filter(blob_id=blob_id).update(**fields)
+
+
+def schedule(blob_id, relative_path):
+    """Ставит файл изображения (путь относительно MEDIA_ROOT) в обработку"""
+    path = os.path.join(settings.MEDIA_ROOT, relative_path)
+    thumbnail_path = os.path.join(settings.MEDIA_ROOT, _thumbnail_relative_path(relative_path))
+    args = (path, thumbnail_path, settings.IMAGE_THUMBNAIL_SIZE)
+
+    if settings.IMAGE_PROCESSING == 'inline':
+        try:
+            _save_metadata(blob_id, extract_metadata(*args))
+        except Exception:
+            logger.exception('Не удалось обработать файл изображения %s', blob_id)
+        return
+
+    def on_done(future):
+        try:
+            _save_metadata(blob_id, future.result())
+        except Exception:
+            logger.exception('Не удалось обработать файл изображения %s', blob_id)
+        finally:
+            connection.close()
+
+    _get_executor().submit(extract_metadata, *args).add_done_callback(on_done)
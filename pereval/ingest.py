@@ -0,0 +1,149 @@
+"""
+Асинхронная обработка заявок на добавление перевалов.
+
+В режиме INGEST_MODE='async' SubmitDataView только проверяет данные, кладёт
+заявку в таблицу-очередь IngestTicket и отвечает 202 с номером заявки.
+Фоновые обработчики (manage.py ingest_worker) забирают заявки пачками
+и создают перевалы, по одной транзакции на пачку.
+"""
+import logging
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction, connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import IngestTicket
+from .serializers import PerevalSerializer
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(payload):
+    """Добавляет проверенную заявку в очередь"""
+    return IngestTicket.objects.create(payload=payload)
+
+
+def claim_batch(batch_size):
+    """
+    Забирает до batch_size заявок из очереди. Заявки, зависшие в обработке
+    дольше INGEST_LEASE_SECONDS (обработчик упал), забираются повторно.
+    """
+    now = timezone.now()
+    expired = now - timedelta(seconds=settings.INGEST_LEASE_SECONDS)
+
+    with transaction.atomic():
+        queued = (IngestTicket.objects
+                  .select_for_update(skip_locked=True)
+                  .filter(status='queued')
+                  .order_by('created_at'))
+        ids = list(queued.values_list('id', flat=True)[:batch_size])
+        if len(ids) < batch_size:
+            stale = (IngestTicket.objects
+                     .select_for_update(skip_locked=True)
+                     .filter(status='processing', claimed_at__lt=expired)
+                     .order_by('created_at'))
+            ids += list(stale.values_list('id', flat=True)[:batch_size - len(ids)])
+        if not ids:
+            return []
+
+        # Условное обновление с меткой: на СУБД без SKIP LOCKED (SQLite)
+        # заявку всё равно получит только один обработчик
+        token = uuid.uuid4()
+        IngestTicket.objects.filter(id__in=ids).filter(
+            Q(status='queued') | Q(status='processing', claimed_at__lt=expired)
+        ).update(status='processing', claimed_at=now, claim_token=token)
+
+    return list(IngestTicket.objects.filter(claim_token=token, status='processing').order_by('created_at'))
+
+
+class LeaseLost(Exception):
+    """Заявку забрал другой обработчик (аренда истекла): её результат не сохраняется"""
+
+
+def _finish(ticket, **fields):
+    """Завершает заявку, только если она всё ещё закреплена за этим обработчиком"""
+    updated = (IngestTicket.objects
+               .filter(pk=ticket.pk, claim_token=ticket.claim_token, status='processing')
+               .update(**fields))
+    if not updated:
+        raise LeaseLost(ticket.pk)
+
+
+def process_batch(tickets):
+    """
+    Создаёт перевалы по заявкам в одной транзакции. Ошибка одной заявки не откатывает остальные.
+    Возвращает число заявок, завершённых этим обработчиком.
+    """
+    processed_at = timezone.now()
+    finished = 0
+    with transaction.atomic():
+        for ticket in tickets:
+            serializer = PerevalSerializer(data=ticket.payload)
+            try:
+                # Перевал и отметка о выполнении в одной точке сохранения: если заявку
+                # перехватил другой обработчик, созданный перевал откатывается
+                with transaction.atomic():
+                    serializer.is_valid(raise_exception=True)
+                    pereval = serializer.save()
+                    _finish(ticket, status='done', pereval=pereval, message='', processed_at=processed_at)
+            except LeaseLost:
+                logger.warning('Заявка %s обработана другим обработчиком', ticket.pk)
+                continue
+            except Exception as e:
+                try:
+                    _finish(ticket, status='failed', message=f"Ошибка при сохранении данных: {str(e)}",
+                            processed_at=processed_at)
+                except LeaseLost:
+                    logger.warning('Заявка %s обработана другим обработчиком', ticket.pk)
+                    continue
+            finished += 1
+    return finished
+
+
+def drain(batch_size=100):
+    """Обрабатывает очередь до опустошения. Возвращает число обработанных заявок."""
+    total = 0
+    while True:
+        tickets = claim_batch(batch_size)
+        if not tickets:
+            return total
+        total += process_batch(tickets)
+
+
+def run_worker(stop_event, batch_size=100, poll_interval=1.0):
+    """Цикл фонового обработчика: разбирает очередь, пока не установлен stop_event"""
+    try:
+        while not stop_event.is_set():
+            try:
+                processed = drain(batch_size)
+            except Exception:
+                logger.exception('Ошибка обработчика очереди заявок')
+                processed = 0
+            if not processed:
+                stop_event.wait(poll_interval)
+    finally:
+        connection.close()
+
+
+def run_pool(workers=2, batch_size=100, poll_interval=1.0, stop_event=None):
+    """Запускает workers потоков-обработчиков и ждёт stop_event"""
+    stop_event = stop_event or threading.Event()
+    threads = [
+        threading.Thread(target=run_worker, args=(stop_event, batch_size, poll_interval),
+                         name=f'ingest-worker-{i}', daemon=True)
+        for i in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        while any(thread.is_alive() for thread in threads):
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        stop_event.set()
+    for thread in threads:
+        thread.join()
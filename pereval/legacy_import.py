@@ -0,0 +1,292 @@
+"""
+Импорт архивных заявок ФСТР.
+
+Файлы в формате JSONL: одна заявка на строку, в том же формате, который
+принимает PerevalDatabase.submit_data (beautyTitle, user.fam/name/otc и т.д.).
+Каждый процесс обрабатывает свой шард пользователей (по хэшу email), поэтому
+процессы не конкурируют за одни и те же строки pereval_user. Строки файла
+распределяются по шардам одним предварительным проходом (email ищется в строке
+без разбора JSON), и каждый процесс разбирает только свои строки. Пачка записей
+и позиция в шарде (ImportCheckpoint) сохраняются в одной транзакции, так что
+прерванный импорт продолжается с места остановки без дублей.
+"""
+import json
+import os
+import re
+import zlib
+from array import array
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import events
+from .geo import grid_cell_for
+from .models import User, Coords, Level, Pereval, Image, ImportCheckpoint
+
+
+# Значение ключа "email" в строке JSONL (строковый литерал JSON)
+EMAIL_RE = re.compile(rb'"email"\s*:\s*("(?:[^"\\]|\\.)*")')
+
+
+class LegacyRecordError(ValueError):
+    """Запись архива не может быть импортирована"""
+
+
+class ShardCountMismatch(ValueError):
+    """Импорт файла начат с другим числом процессов"""
+
+
+def shard_for_email(email, shard_count):
+    """Стабильный номер шарда для email (одинаковый во всех процессах)"""
+    return zlib.crc32(email.strip().lower().encode('utf-8')) % shard_count
+
+
+def _check_lengths(model, fields, prefix):
+    """Значения длиннее max_length поля модели отклоняются до записи в базу"""
+    for name, value in fields.items():
+        max_length = model._meta.get_field(name).max_length
+        if max_length and isinstance(value, str) and len(value) > max_length:
+            raise LegacyRecordError(f'{prefix}{name}: длиннее {max_length} символов')
+
+
+def map_legacy_record(record):
+    """
+    Преобразует заявку формата PerevalDatabase в поля Django-моделей.
+    :return: словарь с ключами user, coords, level, pereval, images
+    """
+    user = record.get('user') or {}
+    coords = record.get('coords') or {}
+    level = record.get('level') or {}
+
+    email = (user.get('email') or '').strip()
+    if not email:
+        raise LegacyRecordError('user.email обязателен')
+    if not record.get('title'):
+        raise LegacyRecordError('title обязателен')
+    try:
+        latitude = float(coords['latitude'])
+        longitude = float(coords['longitude'])
+        height = int(float(coords['height']))
+    except (KeyError, TypeError, ValueError):
+        raise LegacyRecordError('coords.latitude, coords.longitude и coords.height обязательны')
+    if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+        raise LegacyRecordError('координаты вне допустимого диапазона')
+
+    add_time = record.get('add_time')
+    if isinstance(add_time, str):
+        add_time = parse_datetime(add_time.replace(' ', 'T'))
+        if add_time is not None and timezone.is_naive(add_time):
+            add_time = timezone.make_aware(add_time)
+    else:
+        add_time = None
+
+    mapped = {
+        'user': {
+            'email': email,
+            'phone': user.get('phone') or '',
+            'last_name': user.get('fam') or '',
+            'first_name': user.get('name') or '',
+            'middle_name': user.get('otc') or '',
+        },
+        'coords': {'latitude': latitude, 'longitude': longitude, 'height': height},
+        'level': {season: level.get(season) or None for season in ('winter', 'summer', 'autumn', 'spring')},
+        'pereval': {
+            'beauty_title': record.get('beautyTitle') or '',
+            'title': record['title'],
+            'other_titles': record.get('other_titles') or '',
+            'connect': record.get('connect') or '',
+            'add_time': add_time,
+        },
+        'images': [
+            {'file_path': image.get('file_path') or image.get('data') or '', 'title': image.get('title') or ''}
+            for image in record.get('images') or []
+        ],
+    }
+    _check_lengths(User, mapped['user'], 'user.')
+    _check_lengths(Level, mapped['level'], 'level.')
+    _check_lengths(Pereval, mapped['pereval'], '')
+    for image in mapped['images']:
+        _check_lengths(Image, image, 'images.')
+    return mapped
+
+
+def write_batch(mapped_records):
+    """Записывает пачку заявок bulk-запросами. Вызывается внутри транзакции."""
+    users = {}
+    for mapped in mapped_records:
+        users[mapped['user']['email']] = mapped['user']  # последняя версия данных пользователя
+    User.objects.bulk_create(
+        [User(**fields) for fields in users.values()],
+        update_conflicts=True,
+        unique_fields=['email'],
+        update_fields=['phone', 'last_name', 'first_name', 'middle_name'],
+    )
+    user_ids = dict(User.objects.filter(email__in=users).values_list('email', 'id'))
+
+    coords = Coords.objects.bulk_create([
+        Coords(grid_cell=grid_cell_for(mapped['coords']['latitude'], mapped['coords']['longitude']), **mapped['coords'])
+        for mapped in mapped_records
+    ])
+    levels = Level.objects.bulk_create([Level(**mapped['level']) for mapped in mapped_records])
+
+    passes = []
+    for mapped, coord, level in zip(mapped_records, coords, levels):
+        fields = dict(mapped['pereval'])
+        fields.pop('add_time')
+        passes.append(Pereval(user_id=user_ids[mapped['user']['email']], coords=coord, level=level, **fields))
+    passes = Pereval.objects.bulk_create(passes)
+
+    # add_time заполняется автоматически (auto_now_add), архивное время восстанавливаем отдельно
+    dated = []
+    for pereval, mapped in zip(passes, mapped_records):
+        if mapped['pereval']['add_time']:
+            pereval.add_time = mapped['pereval']['add_time']
+            dated.append(pereval)
+    if dated:
+        Pereval.objects.bulk_update(dated, ['add_time'])
+
+    Image.objects.bulk_create([
+        Image(pereval=pereval, **image)
+        for pereval, mapped in zip(passes, mapped_records)
+        for image in mapped['images']
+    ])
+    # bulk_create не вызывает сигналы: события создания пишутся в транзакции пачки
+    events.emit_created(passes)
+    return len(passes)
+
+
+def _save_position(checkpoint, position):
+    checkpoint.position = position
+    checkpoint.save(update_fields=['position', 'updated_at'])
+
+
+def _line_shard(line, shard_count):
+    """Шард строки по email без разбора всей записи; строки без email относятся к шарду 0"""
+    match = EMAIL_RE.search(line)
+    try:
+        email = json.loads(match.group(1)) if match else ''
+    except ValueError:
+        email = ''
+    return shard_for_email(email, shard_count) if email.strip() else 0
+
+
+def scan_shards(path, shard_count):
+    """
+    Один проход по файлу: непустые строки по шардам.
+    :return: для каждого шарда пара массивов (номера строк, смещения строк в файле)
+    """
+    shards = [(array('q'), array('q')) for _ in range(shard_count)]
+    offset = 0
+    with open(path, 'rb') as f:
+        for line_number, line in enumerate(f, 1):
+            if line.strip():
+                line_numbers, offsets = shards[_line_shard(line, shard_count)]
+                line_numbers.append(line_number)
+                offsets.append(offset)
+            offset += len(line)
+    return shards
+
+
+def _read_lines(path, start, lines=None):
+    """
+    Непустые строки шарда начиная с start-й: (номер строки в файле, строка).
+    lines - результат scan_shards для шарда; без него читаются все строки файла.
+    """
+    with open(path, 'rb') as f:
+        if lines is None:
+            index = 0
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                if index >= start:
+                    yield line_number, line
+                index += 1
+            return
+        line_numbers, offsets = lines
+        for index in range(start, len(offsets)):
+            f.seek(offsets[index])
+            yield line_numbers[index], f.readline()
+
+
+def check_shard_count(paths, shard_count):
+    """Позиции в шардах не переносятся на другое число шардов: такой запуск продублировал бы заявки"""
+    for path in paths:
+        started = (ImportCheckpoint.objects.filter(source=os.path.abspath(path))
+                   .exclude(shard_count=shard_count).values_list('shard_count', flat=True).first())
+        if started is not None:
+            raise ShardCountMismatch(
+                f'{path}: импорт начат в {started} процессах, продолжите его с --workers {started}'
+            )
+
+
+def import_shard(paths, shard, shard_count, batch_size=1000, shard_lines=None):
+    """
+    Импортирует из файлов заявки пользователей своего шарда.
+    :param shard_lines: строки шарда по файлам (scan_shards); без них шард - весь файл (shard_count=1)
+    :return: словарь со статистикой: imported, skipped, errors (список строк с ошибками)
+    """
+    if shard_lines is None and shard_count > 1:
+        shard_lines = {path: scan_shards(path, shard_count)[shard] for path in paths}
+    stats = {'shard': shard, 'imported': 0, 'skipped': 0, 'errors': []}
+
+    for path in paths:
+        source = os.path.abspath(path)
+        checkpoint, _ = ImportCheckpoint.objects.get_or_create(source=source, shard=shard, shard_count=shard_count)
+        batch = []
+        position = checkpoint.position
+
+        lines = shard_lines[path] if shard_lines is not None else None
+        for line_number, line in _read_lines(path, checkpoint.position, lines):
+            position += 1
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            try:
+                if not isinstance(record, dict):
+                    raise LegacyRecordError('некорректный JSON')
+                batch.append(map_legacy_record(record))
+            except (LegacyRecordError, AttributeError) as e:
+                stats['skipped'] += 1
+                stats['errors'].append(f'{path}:{line_number}: {e}')
+                continue
+
+            if len(batch) >= batch_size:
+                with transaction.atomic():
+                    stats['imported'] += write_batch(batch)
+                    _save_position(checkpoint, position)
+                batch = []
+
+        with transaction.atomic():
+            if batch:
+                stats['imported'] += write_batch(batch)
+            _save_position(checkpoint, position)
+
+    return stats
+
+
+def _run_shard(args):
+    return import_shard(*args)
+
+
+def import_files(paths, workers=1, batch_size=1000):
+    """
+    Импортирует файлы в workers процессов (по одному шарду пользователей на процесс).
+    :return: список статистик по шардам
+    """
+    check_shard_count(paths, workers)
+    if workers <= 1:
+        return [import_shard(paths, 0, 1, batch_size)]
+
+    from concurrent.futures import ProcessPoolExecutor
+    from django.db import connections
+    from .datagen import init_worker
+
+    # Файл просматривается один раз, каждый процесс получает только свои строки
+    scanned = {path: scan_shards(path, workers) for path in paths}
+    connections.close_all()
+    tasks = [(paths, shard, workers, batch_size, {path: scanned[path][shard] for path in paths})
+             for shard in range(workers)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+        return list(executor.map(_run_shard, tasks))
@@ -0,0 +1,30 @@
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from pereval.tiles import apply_deltas, run_apply
+
+
+class Command(BaseCommand):
+    help = 'Перенос накопленных изменений пирамиды карты в кластеры'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Изменений в одной транзакции')
+        parser.add_argument('--once', action='store_true', help='Перенести накопленные изменения и завершиться')
+        parser.add_argument('--poll-interval', type=float, default=None,
+                            help='Пауза между переносами, сек')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            applied = apply_deltas(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Перенесено изменений: {applied}'))
+            return
+
+        poll_interval = options['poll_interval'] or settings.TILE_DELTA_POLL_SECONDS
+        self.stdout.write('Перенос изменений пирамиды карты')
+        stop_event = threading.Event()
+        try:
+            run_apply(stop_event, batch_size=options['batch_size'], poll_interval=poll_interval)
+        except KeyboardInterrupt:
+            stop_event.set()
@@ -0,0 +1,60 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from pereval.bench import SCENARIOS, run_benchmark
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный бенчмарк API на отдельной тестовой базе: '
+            'пропускная способность, p50/p95/p99 и число SQL-запросов на запрос (JSON)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--passes', type=int, default=1000)
+        parser.add_argument('--images-per-pass', type=int, default=2)
+        parser.add_argument('--requests', type=int, default=200, help='Запросов на сценарий')
+        parser.add_argument('--concurrency', type=int, default=4, help='Число параллельных потоков')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS, dest='scenarios',
+                            help='Сценарий (можно указать несколько раз), по умолчанию все')
+        parser.add_argument('--output', help='Файл для JSON-результата (по умолчанию stdout)')
+        parser.add_argument('--keepdb', action='store_true', help='Не удалять тестовую базу')
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency']
+        if concurrency > 1 and connection.vendor == 'sqlite':
+            # Параллельная запись в SQLite даёт ошибки "database table is locked", а не замер
+            self.stderr.write('SQLite не поддерживает параллельную запись, используется один поток')
+            concurrency = 1
+
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            report = run_benchmark(
+                scenarios=options['scenarios'] or SCENARIOS,
+                users=options['users'],
+                passes=options['passes'],
+                images_per_pass=options['images_per_pass'],
+                requests=options['requests'],
+                concurrency=concurrency,
+                seed=options['seed'],
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        result = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(result + '\n')
+        else:
+            self.stdout.write(result)
+
+        # Перцентили по отклонённым запросам ничего не измеряют
+        failed = [f"{item['scenario']}: {item['errors']}" for item in report.get('results', []) if item['errors']]
+        if failed:
+            raise CommandError('Запросы сценариев завершились ошибками (' + ', '.join(failed) + ')')
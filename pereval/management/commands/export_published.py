@@ -0,0 +1,34 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+
+from pereval.read_model import iter_documents, refresh_all
+
+
+class Command(BaseCommand):
+    help = 'Выгрузка опубликованных перевалов (JSONL) из готовых документов, без JOIN связанных таблиц'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='-', help='Файл JSONL (по умолчанию stdout)')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Сначала пересобрать документы всех принятых перевалов')
+        parser.add_argument('--rebuild-only', action='store_true', help='Только пересобрать документы')
+
+    def handle(self, *args, **options):
+        if options['rebuild'] or options['rebuild_only']:
+            rebuilt = refresh_all()
+            self.stderr.write(f'Документов пересобрано: {rebuilt}')
+            if options['rebuild_only']:
+                return
+
+        output = sys.stdout if options['output'] == '-' else open(options['output'], 'w', encoding='utf-8')
+        exported = 0
+        try:
+            for document in iter_documents():
+                output.write(json.dumps(document, ensure_ascii=False) + '\n')
+                exported += 1
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        self.stderr.write(f'Выгружено перевалов: {exported}')
@@ -0,0 +1,33 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from pereval.snapshot import export, run_refresher
+
+
+class Command(BaseCommand):
+    help = 'Выгрузка колоночного снимка перевалов для аналитики (однократно или периодически)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help='Строк в одной пачке чтения')
+        parser.add_argument('--loop', action='store_true',
+                            help='Обновлять снимок каждые DJANGO_SNAPSHOT_REFRESH_SECONDS секунд')
+        parser.add_argument('--interval', type=int, default=None, help='Период обновления для --loop, сек')
+
+    def handle(self, *args, **options):
+        if options['loop']:
+            interval = options['interval'] or settings.SNAPSHOT_REFRESH_SECONDS
+            self.stdout.write(f'Снимок обновляется каждые {interval} с')
+            stop_event = threading.Event()
+            try:
+                run_refresher(stop_event, interval, batch_size=options['batch_size'])
+            except KeyboardInterrupt:
+                stop_event.set()
+            return
+
+        started = time.perf_counter()
+        version, rows = export(batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Снимок {version}: перевалов {rows}, время: {elapsed:.1f} с'))
@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from pereval.datagen import generate_passes
+from pereval.areas import assign as assign_areas
+from pereval.tiles import rebuild as rebuild_tiles
+
+
+class Command(BaseCommand):
+    help = 'Генерация синтетических перевалов (bulk insert пачками, опционально в несколько процессов)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('count', type=int, help='Число перевалов')
+        parser.add_argument('--users', type=int, default=1000, help='Число пользователей')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Перевалов в одной транзакции')
+        parser.add_argument('--workers', type=int, default=1, help='Число процессов')
+        parser.add_argument('--seed', type=int, default=0, help='Зерно генератора для воспроизводимости')
+        parser.add_argument('--max-images', type=int, default=3, help='Максимум изображений у перевала')
+
+    def handle(self, *args, **options):
+        if options['count'] <= 0:
+            raise CommandError('Число перевалов должно быть положительным')
+
+        workers = options['workers']
+        if workers > 1 and connection.vendor == 'sqlite':
+            self.stderr.write('SQLite не поддерживает параллельную запись, используется один процесс')
+            workers = 1
+
+        total = options['count']
+        started = time.perf_counter()
+
+        def progress(created):
+            self.stdout.write(f'\r{created}/{total}', ending='')
+            self.stdout.flush()
+
+        created = generate_passes(
+            total,
+            users=options['users'],
+            batch_size=options['batch_size'],
+            workers=workers,
+            seed=options['seed'],
+            max_images=options['max_images'],
+            progress=progress,
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано перевалов: {created} за {elapsed:.1f} с ({created / elapsed:.0f} в секунду)'
+        ))
+
+        # Пачки пишутся через bulk_create в обход сигналов, пирамида карты строится заново
+        clusters = rebuild_tiles()
+        self.stdout.write(f'Пирамида карты пересчитана, ячеек: {clusters}')
+        assigned = assign_areas()
+        self.stdout.write(f'Районы определены у перевалов: {assigned}')
@@ -0,0 +1,32 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pereval import read_model
+from pereval.areas import assign, load_geojson
+
+
+class Command(BaseCommand):
+    help = 'Загрузка горных районов из GeoJSON и определение районов перевалов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл GeoJSON FeatureCollection с многоугольниками районов')
+        parser.add_argument('--replace', action='store_true', help='Удалить районы, которых нет в файле')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Перевалов в одной пачке')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            with open(options['path'], encoding='utf-8') as source:
+                loaded = load_geojson(json.load(source), replace=options['replace'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        assigned = assign(batch_size=options['batch_size'])
+        # Документы, собранные до появления районов, не содержат поля area
+        documents = read_model.refresh_all()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено районов: {loaded}, район изменился у перевалов: {assigned}, '
+            f'пересобрано документов: {documents}, время: {elapsed:.1f} с'
+        ))
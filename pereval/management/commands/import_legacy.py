@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from pereval.legacy_import import ShardCountMismatch, import_files
+from pereval.areas import assign as assign_areas
+from pereval.tiles import rebuild as rebuild_tiles
+
+
+class Command(BaseCommand):
+    help = ('Импорт архивных заявок ФСТР (JSONL в формате PerevalDatabase.submit_data) '
+            'пачками, в несколько процессов, с возобновлением с места остановки')
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Файлы JSONL')
+        parser.add_argument('--workers', type=int, default=1, help='Число процессов (шардов по email)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Заявок в одной транзакции')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        if workers < 1:
+            raise CommandError('Число процессов должно быть положительным')
+        if workers > 1 and connection.vendor == 'sqlite':
+            self.stderr.write('SQLite не поддерживает параллельную запись, используется один процесс')
+            workers = 1
+
+        started = time.perf_counter()
+        try:
+            results = import_files(options['paths'], workers=workers, batch_size=options['batch_size'])
+        except (OSError, ShardCountMismatch) as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - started
+
+        imported = sum(result['imported'] for result in results)
+        skipped = sum(result['skipped'] for result in results)
+        for result in results:
+            for error in result['errors']:
+                self.stderr.write(error)
+        self.stdout.write(self.style.SUCCESS(
+            f'Импортировано заявок: {imported}, пропущено: {skipped}, время: {elapsed:.1f} с'
+        ))
+
+        # Пачки пишутся через bulk_create в обход сигналов, пирамида карты строится заново
+        clusters = rebuild_tiles()
+        self.stdout.write(f'Пирамида карты пересчитана, ячеек: {clusters}')
+        assigned = assign_areas()
+        self.stdout.write(f'Районы определены у перевалов: {assigned}')
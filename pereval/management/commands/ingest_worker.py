@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from pereval.ingest import drain, run_pool
+
+
+class Command(BaseCommand):
+    help = 'Фоновая обработка очереди заявок (DJANGO_INGEST_MODE=async)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='Число потоков-обработчиков')
+        parser.add_argument('--batch-size', type=int, default=100, help='Заявок в одной транзакции')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Пауза при пустой очереди, сек')
+        parser.add_argument('--once', action='store_true', help='Обработать очередь и завершиться')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            processed = drain(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Обработано заявок: {processed}'))
+            return
+
+        self.stdout.write(f"Запущено обработчиков: {options['workers']}")
+        run_pool(
+            workers=options['workers'],
+            batch_size=options['batch_size'],
+            poll_interval=options['poll_interval'],
+        )
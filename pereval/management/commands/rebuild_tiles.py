@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from pereval.tiles import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Полный пересчёт пирамиды кластеров карты (после загрузки данных в обход API)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Строк в одной пачке чтения и записи')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        clusters = rebuild(batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Ячеек карты: {clusters}, время: {elapsed:.1f} с'))
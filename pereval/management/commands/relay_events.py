@@ -0,0 +1,36 @@
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from pereval.events import relay, run_relay
+
+
+class Command(BaseCommand):
+    help = 'Перенос событий изменений из outbox в локальный журнал событий'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Событий в одной пачке')
+        parser.add_argument('--once', action='store_true', help='Перенести накопленные события и завершиться')
+        parser.add_argument('--poll-interval', type=float, default=None,
+                            help='Пауза между проверками outbox, сек')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size'] or settings.EVENT_RELAY_BATCH
+        if options['once']:
+            total = 0
+            while True:
+                relayed = relay(batch_size)
+                if not relayed:
+                    break
+                total += relayed
+            self.stdout.write(self.style.SUCCESS(f'Перенесено событий: {total}'))
+            return
+
+        poll_interval = options['poll_interval'] or settings.EVENT_RELAY_POLL_SECONDS
+        self.stdout.write(f'Перенос событий в {settings.EVENT_LOG_DIR}')
+        stop_event = threading.Event()
+        try:
+            run_relay(stop_event, batch_size=batch_size, poll_interval=poll_interval)
+        except KeyboardInterrupt:
+            stop_event.set()
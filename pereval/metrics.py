@@ -0,0 +1,149 @@
+"""
+Метрики производительности запросов к API.
+
+Для каждого запроса собираются число SQL-запросов, время SQL, время
+сериализации и общее время ответа. Значения накапливаются в гистограммах
+процесса и отдаются в формате Prometheus на /metrics.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.http import HttpResponse
+
+# Границы корзин гистограмм: секунды для времени, штуки для числа запросов
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class RequestStats:
+    """Показатели одного запроса"""
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+
+
+_current_stats = ContextVar('pereval_request_stats', default=None)
+
+
+def current_stats():
+    """Показатели текущего запроса или None вне middleware"""
+    return _current_stats.get()
+
+
+@contextmanager
+def collect_stats():
+    stats = RequestStats()
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+@contextmanager
+def measure_serializer():
+    """Учитывает время сериализации (вложенные вызовы не считаются повторно)"""
+    stats = _current_stats.get()
+    if stats is None or getattr(stats, '_in_serializer', False):
+        yield
+        return
+
+    stats._in_serializer = True
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serializer_time += time.perf_counter() - start
+        stats._in_serializer = False
+
+
+def sql_execute_wrapper(execute, sql, params, many, context):
+    """Обёртка для connection.execute_wrapper: считает запросы и их время"""
+    stats = _current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.sql_count += 1
+        stats.sql_time += time.perf_counter() - start
+
+
+class Histogram:
+    """Гистограмма Prometheus с меткой endpoint"""
+
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self._values = {}  # endpoint -> [счётчики корзин, сумма, количество]
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, value):
+        with self._lock:
+            values = self._values.get(endpoint)
+            if values is None:
+                values = self._values[endpoint] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values[0][i] += 1
+            values[1] += value
+            values[2] += 1
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} histogram',
+        ]
+        with self._lock:
+            for endpoint, (counts, total, count) in sorted(self._values.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{{endpoint="{endpoint}",le="{bound}"}} {bucket_count}')
+                lines.append(f'{self.name}_bucket{{endpoint="{endpoint}",le="+Inf"}} {count}')
+                lines.append(f'{self.name}_sum{{endpoint="{endpoint}"}} {total}')
+                lines.append(f'{self.name}_count{{endpoint="{endpoint}"}} {count}')
+        return '\n'.join(lines)
+
+
+REQUEST_DURATION = Histogram(
+    'pereval_request_duration_seconds', 'Общее время обработки запроса', DURATION_BUCKETS)
+SQL_DURATION = Histogram(
+    'pereval_sql_duration_seconds', 'Суммарное время SQL-запросов за запрос', DURATION_BUCKETS)
+SERIALIZER_DURATION = Histogram(
+    'pereval_serializer_duration_seconds', 'Время сериализации (включая выполненные в ней SQL-запросы)',
+    DURATION_BUCKETS)
+SQL_QUERIES = Histogram(
+    'pereval_sql_queries', 'Число SQL-запросов за запрос', QUERY_COUNT_BUCKETS)
+
+HISTOGRAMS = (REQUEST_DURATION, SQL_DURATION, SERIALIZER_DURATION, SQL_QUERIES)
+
+
+def observe_request(endpoint, stats, total_time):
+    REQUEST_DURATION.observe(endpoint, total_time)
+    SQL_DURATION.observe(endpoint, stats.sql_time)
+    SERIALIZER_DURATION.observe(endpoint, stats.serializer_time)
+    SQL_QUERIES.observe(endpoint, stats.sql_count)
+
+
+def reset_metrics():
+    for histogram in HISTOGRAMS:
+        histogram.reset()
+
+
+def render_metrics():
+    return '\n'.join(histogram.render() for histogram in HISTOGRAMS) + '\n'
+
+
+def metrics_view(request):
+    """GET /metrics — метрики процесса в текстовом формате Prometheus"""
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
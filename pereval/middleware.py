@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from .metrics import collect_stats, observe_request, sql_execute_wrapper
+
+
+class PerformanceMetricsMiddleware:
+    """
+    Замеряет число и время SQL-запросов, время сериализации и общее время
+    ответа для эндпоинтов из METRICS_ENDPOINTS. Результат добавляется
+    в заголовок Server-Timing и в гистограммы /metrics.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.endpoints = set(settings.METRICS_ENDPOINTS)
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with collect_stats() as stats, connection.execute_wrapper(sql_execute_wrapper):
+            response = self.get_response(request)
+        total_time = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        endpoint = match.url_name if match else None
+        if endpoint not in self.endpoints:
+            return response
+
+        observe_request(endpoint, stats, total_time)
+        response['Server-Timing'] = ', '.join([
+            'sql;dur=%.2f;desc="%d queries"' % (stats.sql_time * 1000, stats.sql_count),
+            'serializer;dur=%.2f' % (stats.serializer_time * 1000),
+            'total;dur=%.2f' % (total_time * 1000),
+        ])
+        return response
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pereval', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=500)),
+                ('shard', models.PositiveIntegerField()),
+                ('shard_count', models.PositiveIntegerField()),
+                ('position', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'pereval_import_checkpoint',
+                'constraints': [models.UniqueConstraint(fields=('source', 'shard', 'shard_count'), name='unique_import_checkpoint')],
+            },
+        ),
+    ]
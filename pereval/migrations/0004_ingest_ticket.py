@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:26
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pereval', '0003_idempotency_record'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestTicket',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('payload', models.JSONField()),
+                ('status', models.CharField(choices=[('queued', 'в очереди'), ('processing', 'обрабатывается'), ('done', 'перевал создан'), ('failed', 'ошибка обработки')], default='queued', max_length=10)),
+                ('message', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('claim_token', models.UUIDField(blank=True, null=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('pereval', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='pereval.pereval')),
+            ],
+            options={
+                'db_table': 'pereval_ingest_ticket',
+                'indexes': [models.Index(fields=['status', 'created_at'], name='ingest_ticket_status_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pereval', '0004_ingest_ticket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='file_size',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='file_type',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='thumbnail_path',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from pereval.geo import grid_cell_for
+
+
+def fill_grid_cells(apps, schema_editor):
+    Coords = apps.get_model('pereval', 'Coords')
+    batch = []
+    for coords in Coords.objects.filter(grid_cell__isnull=True).only('id', 'latitude', 'longitude').iterator(chunk_size=2000):
+        coords.grid_cell = grid_cell_for(coords.latitude, coords.longitude)
+        batch.append(coords)
+        if len(batch) >= 2000:
+            Coords.objects.bulk_update(batch, ['grid_cell'])
+            batch = []
+    if batch:
+        Coords.objects.bulk_update(batch, ['grid_cell'])
+
+
+def create_trigram_indexes(apps, schema_editor):
+    # Триграммные индексы для поиска похожих названий есть только в PostgreSQL
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS pereval_title_trgm_idx ON pereval_pereval USING gin (title gin_trgm_ops)'
+    )
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS pereval_other_titles_trgm_idx ON pereval_pereval USING gin (other_titles gin_trgm_ops)'
+    )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS pereval_title_trgm_idx')
+    schema_editor.execute('DROP INDEX IF EXISTS pereval_other_titles_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pereval', '0006_image_blob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coords',
+            name='grid_cell',
+            field=models.BigIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='DuplicateCandidate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('distance_m', models.FloatField()),
+                ('similarity', models.FloatField()),
+                ('resolved', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('duplicate_of', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pereval.pereval')),
+                ('pereval', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='duplicate_candidates', to='pereval.pereval')),
+            ],
+            options={
+                'db_table': 'pereval_duplicate_candidate',
+                'indexes': [models.Index(fields=['resolved', 'created_at'], name='duplicate_resolved_idx')],
+                'constraints': [models.UniqueConstraint(fields=('pereval', 'duplicate_of'), name='unique_duplicate_candidate')],
+            },
+        ),
+        migrations.RunPython(fill_grid_cells, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
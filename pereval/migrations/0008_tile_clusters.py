@@ -0,0 +1,88 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:35
+
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Логика pereval.tiles на момент миграции: миграция не зависит от изменений модуля
+MAX_LATITUDE = 85.0511287798
+
+
+def cell_for(latitude, longitude, level):
+    n = 1 << level
+    latitude = max(min(float(latitude), MAX_LATITUDE), -MAX_LATITUDE)
+    x = int((float(longitude) + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(latitude))) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def build_clusters(points):
+    bits = settings.TILE_CLUSTER_BITS
+    max_zoom = settings.TILE_MAX_ZOOM
+    levels = [defaultdict(lambda: [0, 0.0, 0.0, None]) for _ in range(max_zoom + 1)]
+
+    for latitude, longitude, height in points:
+        cell = levels[max_zoom][cell_for(latitude, longitude, max_zoom + bits)]
+        cell[0] += 1
+        cell[1] += latitude
+        cell[2] += longitude
+        cell[3] = height if cell[3] is None else max(cell[3], height)
+
+    for zoom in range(max_zoom, 0, -1):
+        for (x, y), (count, latitude_sum, longitude_sum, height) in levels[zoom].items():
+            parent = levels[zoom - 1][(x >> 1, y >> 1)]
+            parent[0] += count
+            parent[1] += latitude_sum
+            parent[2] += longitude_sum
+            parent[3] = height if parent[3] is None else max(parent[3], height)
+
+    return [(zoom, x, y, *cell) for zoom, cells in enumerate(levels) for (x, y), cell in cells.items()]
+
+
+def fill_tile_clusters(apps, schema_editor):
+    Pereval = apps.get_model('pereval', 'Pereval')
+    TileCluster = apps.get_model('pereval', 'TileCluster')
+    points = (Pereval.objects.exclude(status='rejected')
+              .values_list('coords__latitude', 'coords__longitude', 'coords__height'))
+    TileCluster.objects.bulk_create([
+        TileCluster(zoom=zoom, x=x, y=y, count=count, latitude_sum=latitude_sum,
+                    longitude_sum=longitude_sum, max_height=height)
+        for zoom, x, y, count, latitude_sum, longitude_sum, height in build_clusters(points.iterator(chunk_size=5000))
+    ], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pereval', '0007_duplicate_detection'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TileCluster',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('zoom', models.PositiveSmallIntegerField()),
+                ('x', models.PositiveIntegerField()),
+                ('y', models.PositiveIntegerField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('latitude_sum', models.FloatField(default=0)),
+                ('longitude_sum', models.FloatField(default=0)),
+                ('max_height', models.IntegerField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'pereval_tile_cluster',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='coords',
+            index=models.Index(fields=['latitude', 'longitude'], name='coords_lat_lon_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='tilecluster',
+            constraint=models.UniqueConstraint(fields=('zoom', 'x', 'y'), name='unique_tile_cluster'),
+        ),
+        migrations.RunPython(fill_tile_clusters, migrations.RunPython.noop),
+    ]
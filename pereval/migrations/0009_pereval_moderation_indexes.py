@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pereval', '0008_tile_clusters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pereval',
+            index=models.Index(fields=['status', 'add_time'], name='pereval_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pereval',
+            index=models.Index(fields=['add_time'], name='pereval_add_time_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pereval', '0009_pereval_moderation_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pereval',
+            name='claim_token',
+            field=models.UUIDField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='pereval',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='pereval',
+            name='moderator',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='moderated_perevals', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='pereval',
+            index=models.Index(fields=['status', 'claimed_at'], name='pereval_claim_idx'),
+        ),
+    ]
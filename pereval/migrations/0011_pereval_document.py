@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pereval', '0010_moderation_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PerevalDocument',
+            fields=[
+                ('pereval', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='document', serialize=False, to='pereval.pereval')),
+                ('document', models.JSONField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pereval.user')),
+            ],
+            options={
+                'db_table': 'pereval_document',
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pereval', '0011_pereval_document'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity', models.CharField(choices=[('pereval', 'перевал'), ('image', 'изображение')], max_length=10)),
+                ('action', models.CharField(choices=[('created', 'создан'), ('updated', 'изменён'), ('status', 'смена статуса'), ('deleted', 'удалён')], max_length=10)),
+                ('pereval_id', models.BigIntegerField()),
+                ('image_id', models.BigIntegerField(blank=True, null=True)),
+                ('status', models.CharField(blank=True, max_length=10)),
+                ('previous_status', models.CharField(blank=True, max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'pereval_change_event',
+            },
+        ),
+    ]
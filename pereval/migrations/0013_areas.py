@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pereval', '0012_change_events'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Area',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=255)),
+                ('geometry', models.JSONField()),
+                ('min_latitude', models.FloatField(default=0)),
+                ('max_latitude', models.FloatField(default=0)),
+                ('min_longitude', models.FloatField(default=0)),
+                ('max_longitude', models.FloatField(default=0)),
+                ('parent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='children', to='pereval.area')),
+            ],
+            options={
+                'verbose_name': 'Район',
+                'verbose_name_plural': 'Районы',
+                'db_table': 'pereval_area',
+            },
+        ),
+        migrations.AddField(
+            model_name='pereval',
+            name='area',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='perevals', to='pereval.area'),
+        ),
+        migrations.AddIndex(
+            model_name='pereval',
+            index=models.Index(fields=['area', 'status'], name='pereval_area_status_idx'),
+        ),
+    ]
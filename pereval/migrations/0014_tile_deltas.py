@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pereval', '0013_areas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TileDelta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('height', models.IntegerField()),
+                ('sign', models.SmallIntegerField()),
+            ],
+            options={
+                'db_table': 'pereval_tile_delta',
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:05
+
+from django.db import migrations
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    # Кандидаты в дубли отбираются по ячейкам сетки, а похожесть считается функцией
+    # similarity(), которую GIN-индекс не ускоряет: индексы только замедляли запись
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS pereval_title_trgm_idx')
+    schema_editor.execute('DROP INDEX IF EXISTS pereval_other_titles_trgm_idx')
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS pereval_title_trgm_idx ON pereval_pereval USING gin (title gin_trgm_ops)'
+    )
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS pereval_other_titles_trgm_idx ON pereval_pereval USING gin (other_titles gin_trgm_ops)'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pereval', '0014_tile_deltas'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_trigram_indexes, create_trigram_indexes),
+    ]
@@ -1,6 +1,11 @@
+import uuid
+
+from django.conf import settings
 from django.db import models
 from django.core.validators import MaxValueValidator, MinValueValidator
 
+from .geo import grid_cell_for
+
 
 class User(models.Model):
     email = models.EmailField(unique=True)
@@ -15,18 +20,37 @@ class User(models.Model):
     def __str__(self):
         return f"{self.last_name} {self.first_name} {self.middle_name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Email на момент загрузки: по нему сигнал pre_save узнаёт о смене email без запроса
+        instance._loaded_email = instance.__dict__.get('email')
+        return instance
+
 
 class Coords(models.Model):
     latitude = models.FloatField(validators=[MinValueValidator(-90), MaxValueValidator(90)])
     longitude = models.FloatField(validators=[MinValueValidator(-180), MaxValueValidator(180)])
     height = models.IntegerField()
+    # Ячейка пространственной сетки (pereval.geo), вычисляется при сохранении
+    grid_cell = models.BigIntegerField(null=True, blank=True, db_index=True)
 
     class Meta:
         db_table = 'pereval_coords'  # явное имя таблицы
+        indexes = [
+            models.Index(fields=['latitude', 'longitude'], name='coords_lat_lon_idx'),
+        ]
 
     def __str__(self):
         return f"Широта: {self.latitude}, Долгота: {self.longitude}, Высота: {self.height}"
 
+    def save(self, *args, **kwargs):
+        self.grid_cell = grid_cell_for(float(self.latitude), float(self.longitude))
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'grid_cell' not in update_fields:
+            kwargs['update_fields'] = list(update_fields) + ['grid_cell']
+        super().save(*args, **kwargs)
+
 
 class Level(models.Model):
     winter = models.CharField(max_length=10, blank=True, null=True)
@@ -41,6 +65,42 @@ class Level(models.Model):
         return f"Зима: {self.winter}, Лето: {self.summer}, Осень: {self.autumn}, Весна: {self.spring}"
 
 
+class Area(models.Model):
+    """Горный район: многоугольник (geometry GeoJSON Polygon/MultiPolygon, координаты [долгота, широта])"""
+    title = models.CharField(max_length=255)
+    parent = models.ForeignKey('self', null=True, blank=True, related_name='children', on_delete=models.SET_NULL)
+    geometry = models.JSONField()
+    # Ограничивающий прямоугольник, вычисляется при сохранении
+    min_latitude = models.FloatField(default=0)
+    max_latitude = models.FloatField(default=0)
+    min_longitude = models.FloatField(default=0)
+    max_longitude = models.FloatField(default=0)
+
+    class Meta:
+        db_table = 'pereval_area'  # явное имя таблицы
+        verbose_name = 'Район'
+        verbose_name_plural = 'Районы'
+
+    def __str__(self):
+        return self.title
+
+    def save(self, *args, **kwargs):
+        points = [point for polygon in polygons(self.geometry) for ring in polygon for point in ring]
+        longitudes, latitudes = [point[0] for point in points], [point[1] for point in points]
+        self.min_longitude, self.max_longitude = min(longitudes), max(longitudes)
+        self.min_latitude, self.max_latitude = min(latitudes), max(latitudes)
+        super().save(*args, **kwargs)
+
+
+def polygons(geometry):
+    """Многоугольники GeoJSON-геометрии: список колец (внешнее, затем дыры) для каждого"""
+    if geometry.get('type') == 'Polygon':
+        return [geometry['coordinates']]
+    if geometry.get('type') == 'MultiPolygon':
+        return geometry['coordinates']
+    raise ValueError('Ожидается геометрия Polygon или MultiPolygon')
+
+
 class Pereval(models.Model):
     STATUS_CHOICES = [
         ('new', 'новый'),
@@ -60,23 +120,234 @@ class Pereval(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     coords = models.OneToOneField(Coords, on_delete=models.CASCADE)
     level = models.ForeignKey(Level, on_delete=models.CASCADE)
+    # Горный район, определяется по координатам (pereval.areas); индекс - pereval_area_status_idx
+    area = models.ForeignKey(Area, null=True, blank=True, related_name='perevals', on_delete=models.SET_NULL,
+                             db_index=False)
+
+    # Очередь модерации: кто взял перевал в работу и когда (аренда истекает через MODERATION_LEASE_SECONDS)
+    moderator = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True,
+                                  related_name='moderated_perevals', on_delete=models.SET_NULL)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    claim_token = models.UUIDField(null=True, blank=True)  # метка пачки, взятой одним запросом
 
     class Meta:
         db_table = 'pereval_pereval'  # явное имя таблицы
         verbose_name = 'Перевал'
         verbose_name_plural = 'Перевалы'
+        indexes = [
+            models.Index(fields=['status', 'add_time'], name='pereval_status_idx'),
+            models.Index(fields=['add_time'], name='pereval_add_time_idx'),
+            models.Index(fields=['status', 'claimed_at'], name='pereval_claim_idx'),
+            models.Index(fields=['area', 'status'], name='pereval_area_status_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
 
+class PerevalDocument(models.Model):
+    """Готовое представление принятого перевала (PerevalSerializer) для чтения без JOIN"""
+    pereval = models.OneToOneField(Pereval, primary_key=True, related_name='document', on_delete=models.CASCADE)
+    user = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)  # для списка по пользователю
+    document = models.JSONField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'pereval_document'  # явное имя таблицы
+
+    def __str__(self):
+        return str(self.pereval_id)
+
+
+class ImageBlob(models.Model):
+    """Содержимое файла изображения, хранится один раз по SHA-256 (content-addressed)"""
+    sha256 = models.CharField(max_length=64, unique=True)
+    path = models.CharField(max_length=255)  # путь относительно MEDIA_ROOT
+    size = models.PositiveIntegerField()
+    content_type = models.CharField(max_length=50)
+    ref_count = models.PositiveIntegerField(default=0)  # число ссылающихся Image
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    thumbnail_path = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'pereval_image_blob'  # явное имя таблицы
+
+    def __str__(self):
+        return self.sha256
+
+
+class DuplicateCandidate(models.Model):
+    """Возможный дубль: новый перевал рядом с существующим и с похожим названием"""
+    pereval = models.ForeignKey(Pereval, related_name='duplicate_candidates', on_delete=models.CASCADE)
+    duplicate_of = models.ForeignKey(Pereval, related_name='+', on_delete=models.CASCADE)
+    distance_m = models.FloatField()
+    similarity = models.FloatField()
+    resolved = models.BooleanField(default=False)  # модератор разобрал
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'pereval_duplicate_candidate'  # явное имя таблицы
+        constraints = [
+            models.UniqueConstraint(fields=['pereval', 'duplicate_of'], name='unique_duplicate_candidate'),
+        ]
+        indexes = [
+            models.Index(fields=['resolved', 'created_at'], name='duplicate_resolved_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.pereval_id} ~ {self.duplicate_of_id} ({self.distance_m:.0f} м, {self.similarity:.2f})"
+
+
+class TileCluster(models.Model):
+    """Кластер перевалов в ячейке карты одного масштаба (пирамида для /submitData/tiles/)"""
+    zoom = models.PositiveSmallIntegerField()
+    # Ячейка - тайл масштаба zoom + TILE_CLUSTER_BITS
+    x = models.PositiveIntegerField()
+    y = models.PositiveIntegerField()
+    count = models.PositiveIntegerField(default=0)
+    latitude_sum = models.FloatField(default=0)
+    longitude_sum = models.FloatField(default=0)
+    max_height = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'pereval_tile_cluster'  # явное имя таблицы
+        constraints = [
+            models.UniqueConstraint(fields=['zoom', 'x', 'y'], name='unique_tile_cluster'),
+        ]
+
+    def __str__(self):
+        return f"{self.zoom}/{self.x}/{self.y}: {self.count}"
+
+
+class TileDelta(models.Model):
+    """Изменение пирамиды карты, ещё не перенесённое в TileCluster (+1 - перевал появился, -1 - исчез)"""
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    height = models.IntegerField()
+    sign = models.SmallIntegerField()
+
+    class Meta:
+        db_table = 'pereval_tile_delta'  # явное имя таблицы
+
+    def __str__(self):
+        return f"{self.sign:+d} ({self.latitude}, {self.longitude})"
+
+
 class Image(models.Model):
     pereval = models.ForeignKey(Pereval, related_name='images', on_delete=models.CASCADE)
+    # Загруженный файл; у изображений, переданных только ссылкой file_path, не задан
+    blob = models.ForeignKey(ImageBlob, null=True, blank=True, related_name='images', on_delete=models.PROTECT)
     file_path = models.CharField(max_length=255)  # вместо data
     title = models.CharField(max_length=255)
+    # Метаданные загруженного файла (заполняются при загрузке и фоновой обработке)
+    file_size = models.PositiveIntegerField(null=True, blank=True)
+    file_type = models.CharField(max_length=50, blank=True)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    thumbnail_path = models.CharField(max_length=255, blank=True)
 
     class Meta:
         db_table = 'pereval_image'  # явное имя таблицы
 
     def __str__(self):
-        return self.title
\ No newline at end of file
+        return self.title
+
+
+class ImportCheckpoint(models.Model):
+    """Позиция импорта архивного файла для одного шарда (для возобновления импорта)"""
+    source = models.CharField(max_length=500)
+    shard = models.PositiveIntegerField()
+    shard_count = models.PositiveIntegerField()
+    position = models.PositiveBigIntegerField(default=0)  # число обработанных строк шарда
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'pereval_import_checkpoint'  # явное имя таблицы
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'shard', 'shard_count'], name='unique_import_checkpoint'),
+        ]
+
+    def __str__(self):
+        return f"{self.source} [{self.shard}/{self.shard_count}]: {self.position}"
+
+
+class IdempotencyRecord(models.Model):
+    """Сохранённый ответ на запрос с заголовком Idempotency-Key"""
+    key = models.CharField(max_length=255)
+    scope = models.CharField(max_length=255)  # метод и путь запроса
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField()
+    response_body = models.JSONField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        db_table = 'pereval_idempotency_record'  # явное имя таблицы
+        constraints = [
+            models.UniqueConstraint(fields=['key', 'scope'], name='unique_idempotency_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.key}"
+
+
+class IngestTicket(models.Model):
+    """Заявка в очереди асинхронной обработки (outbox) и её результат"""
+    STATUS_CHOICES = [
+        ('queued', 'в очереди'),
+        ('processing', 'обрабатывается'),
+        ('done', 'перевал создан'),
+        ('failed', 'ошибка обработки'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    pereval = models.ForeignKey(Pereval, null=True, blank=True, on_delete=models.SET_NULL)
+    message = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    claim_token = models.UUIDField(null=True, blank=True)  # метка обработчика, забравшего заявку
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'pereval_ingest_ticket'  # явное имя таблицы
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='ingest_ticket_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.id}: {self.status}"
+
+
+class ChangeEvent(models.Model):
+    """
+    Событие изменения перевала или изображения (outbox). Пишется в той же транзакции,
+    что и изменение; manage.py relay_events переносит события в локальный журнал.
+    """
+    ENTITY_CHOICES = [
+        ('pereval', 'перевал'),
+        ('image', 'изображение'),
+    ]
+    ACTION_CHOICES = [
+        ('created', 'создан'),
+        ('updated', 'изменён'),
+        ('status', 'смена статуса'),
+        ('deleted', 'удалён'),
+    ]
+
+    entity = models.CharField(max_length=10, choices=ENTITY_CHOICES)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    # Без внешних ключей: событие об удалении переживает сам объект
+    pereval_id = models.BigIntegerField()
+    image_id = models.BigIntegerField(null=True, blank=True)
+    status = models.CharField(max_length=10, blank=True)
+    previous_status = models.CharField(max_length=10, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'pereval_change_event'  # явное имя таблицы
+
+    def __str__(self):
+        return f"{self.id}: {self.entity}.{self.action} {self.pereval_id}"
@@ -0,0 +1,114 @@
+"""
+Модерация перевалов: массовая смена статуса и очередь модерации.
+
+QuerySet.update() не вызывает сигналы моделей, поэтому всё, что зависит
+от статуса перевала (кластеры карты, документы опубликованных перевалов),
+обновляется здесь явно, как и события смены статуса для журнала событий.
+
+Модераторы забирают новые перевалы пачками (claim_next): строки выбираются
+через SELECT ... FOR UPDATE SKIP LOCKED, поэтому параллельные модераторы
+получают разные перевалы и не ждут блокировок друг друга. Перевал переходит
+в pending и закрепляется за модератором на MODERATION_LEASE_SECONDS; брошенные
+перевалы после истечения аренды снова выдаются в работу.
+"""
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import events, read_model, tiles
+from .models import Pereval
+
+
+def set_status(queryset, status, **fields):
+    """
+    Переводит перевалы queryset в статус status (и обновляет поля fields),
+    возвращает число изменённых
+    """
+    with transaction.atomic():
+        changed = queryset.exclude(status=status) if not fields else queryset
+        # Перевалы, которые появляются на карте или исчезают с неё
+        if tiles.is_visible(status):
+            toggled = changed.filter(status__in=tiles.HIDDEN_STATUSES)
+        else:
+            toggled = changed.exclude(status__in=tiles.HIDDEN_STATUSES)
+        points = list(toggled.values_list('coords__latitude', 'coords__longitude', 'coords__height'))
+        # Перевалы, которые публикуются или снимаются с публикации
+        if status == read_model.PUBLISHED_STATUS:
+            published = list(changed.values_list('pk', flat=True))
+        else:
+            published = list(changed.filter(status=read_model.PUBLISHED_STATUS).values_list('pk', flat=True))
+        previous = list(changed.values_list('pk', 'status'))
+
+        updated = changed.update(status=status, **fields)
+
+        if tiles.is_visible(status):
+            tiles.add_points(points)
+        else:
+            tiles.remove_points(points)
+        read_model.refresh_many(published)
+        events.emit_status_changes(previous, status)
+    return updated
+
+
+def lease_expires_at(claimed_at):
+    return claimed_at + timedelta(seconds=settings.MODERATION_LEASE_SECONDS)
+
+
+def claim_next(moderator, limit):
+    """
+    Забирает до limit перевалов в работу модератору: сначала новые (старые первыми),
+    затем перевалы с истёкшей арендой. Возвращает (перевалы, момент взятия).
+    """
+    now = timezone.now()
+    expired = now - timedelta(seconds=settings.MODERATION_LEASE_SECONDS)
+
+    with transaction.atomic():
+        new = (Pereval.objects
+               .select_for_update(skip_locked=True)
+               .filter(status='new')
+               .order_by('add_time'))
+        ids = list(new.values_list('id', flat=True)[:limit])
+        if len(ids) < limit:
+            stale = (Pereval.objects
+                     .select_for_update(skip_locked=True)
+                     .filter(status='pending', claimed_at__lt=expired)
+                     .order_by('claimed_at'))
+            ids += list(stale.values_list('id', flat=True)[:limit - len(ids)])
+        if not ids:
+            return [], now
+
+        # Условное обновление с меткой: на СУБД без SKIP LOCKED (SQLite)
+        # перевал всё равно получит только один модератор
+        token = uuid.uuid4()
+        set_status(
+            Pereval.objects.filter(id__in=ids).filter(Q(status='new') | Q(status='pending', claimed_at__lt=expired)),
+            'pending', moderator=moderator, claimed_at=now, claim_token=token,
+        )
+
+    claimed = (Pereval.objects.filter(claim_token=token, moderator=moderator)
+               .select_related('user', 'coords', 'level').prefetch_related('images').order_by('add_time'))
+    return list(claimed), now
+
+
+def renew(moderator):
+    """Продлевает аренду всех перевалов модератора, возвращает их число"""
+    return Pereval.objects.filter(status='pending', moderator=moderator).update(claimed_at=timezone.now())
+
+
+def resolve(pereval_id, moderator, status):
+    """
+    Завершает модерацию перевала, взятого этим модератором (accepted или rejected).
+    Возвращает False, если перевал уже не за ним (аренда истекла и его забрал другой).
+    """
+    queryset = Pereval.objects.filter(pk=pereval_id, status='pending', moderator=moderator)
+    return set_status(queryset, status, claimed_at=None, claim_token=None) == 1
+
+
+def release(pereval_id, moderator):
+    """Возвращает перевал модератора в очередь (статус new)"""
+    queryset = Pereval.objects.filter(pk=pereval_id, status='pending', moderator=moderator)
+    return set_status(queryset, 'new', moderator=None, claimed_at=None, claim_token=None) == 1
@@ -0,0 +1,256 @@
+"""
+Уведомления о смене статуса перевалов для клиентов (Server-Sent Events).
+
+Источник - журнал событий (pereval.events), который заполняет manage.py relay_events,
+поэтому модерация в любом процессе (админка, очередь модерации) доходит до всех
+процессов ASGI. В каждом процессе один опрос журнала (StatusHub) раздаёт события
+подписчикам: клиент подписывается по email и получает смены статуса своих перевалов.
+
+Поток асинхронный и работает под ASGI (pereval_api.asgi, например
+uvicorn pereval_api.asgi:application): открытое соединение не занимает поток.
+Пропущенное за время разрыва клиент получает после переподключения с Last-Event-ID.
+"""
+import asyncio
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+
+from . import user_cache
+from .events import EventLog
+from .models import Pereval
+
+logger = logging.getLogger(__name__)
+
+STATUS_EVENT = 'pereval.status'
+CREATED_EVENT = 'pereval.created'
+
+
+def to_notification(record):
+    """Уведомление клиенту из записи журнала"""
+    return {
+        'offset': record['offset'],
+        'id': record['pereval'],
+        'status': record.get('status'),
+        'previous_status': record.get('previous_status'),
+        'at': record['at'],
+    }
+
+
+class Subscription:
+    """Подписка клиента: его перевалы и очередь уведомлений"""
+
+    def __init__(self, user_id, pereval_ids):
+        self.user_id = user_id
+        self.pereval_ids = set(pereval_ids)
+        self.queue = asyncio.Queue(maxsize=settings.NOTIFY_QUEUE_SIZE)
+        self.closed = False
+
+    def push(self, notification):
+        try:
+            self.queue.put_nowait(notification)
+        except asyncio.QueueFull:
+            # Клиент не успевает читать: соединение закрывается, после переподключения
+            # с Last-Event-ID пропущенное придёт из журнала
+            self.close()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class StatusHub:
+    """Опрос журнала событий и раздача смен статуса подписчикам процесса"""
+
+    def __init__(self):
+        self.subscriptions = set()
+        self.offset = None
+        self._task = None
+        self._loop = None
+
+    def full(self):
+        return len(self.subscriptions) >= settings.NOTIFY_MAX_SUBSCRIBERS
+
+    def subscribe(self, user_id, pereval_ids):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self.offset = _log_end()
+            self._loop = loop
+            self._task = loop.create_task(self._run())
+        subscription = Subscription(user_id, pereval_ids)
+        self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscriptions.discard(subscription)
+
+    def close(self):
+        """Завершение всех подписок (остановка сервера)"""
+        for subscription in list(self.subscriptions):
+            subscription.close()
+        self.subscriptions.clear()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        log = EventLog()
+        read = sync_to_async(log.read, thread_sensitive=False)
+        while self.subscriptions:
+            try:
+                records = await read(self.offset, settings.EVENT_READ_MAX)
+                if records:
+                    await self.dispatch(records)
+                    self.offset = records[-1]['offset'] + 1
+            except Exception:
+                logger.exception('Ошибка чтения журнала событий')
+                records = []
+            if len(records) < settings.EVENT_READ_MAX:
+                await asyncio.sleep(settings.NOTIFY_POLL_SECONDS)
+
+    async def dispatch(self, records):
+        # Новые перевалы подписчиков добавляются в их подписки (один запрос на пачку)
+        created = [record['pereval'] for record in records if record['type'] == CREATED_EVENT]
+        if created:
+            owners = {subscription.user_id for subscription in self.subscriptions}
+            pairs = await sync_to_async(_owned)(created, owners)
+            for subscription in self.subscriptions:
+                subscription.pereval_ids.update(pk for pk, user_id in pairs if user_id == subscription.user_id)
+
+        for record in records:
+            if record['type'] != STATUS_EVENT:
+                continue
+            for subscription in list(self.subscriptions):
+                if record['pereval'] in subscription.pereval_ids:
+                    subscription.push(to_notification(record))
+
+
+hub = StatusHub()
+
+
+def _log_end():
+    last = EventLog().last_record()
+    return last['offset'] + 1 if last else 0
+
+
+def _owned(pereval_ids, user_ids):
+    return list(Pereval.objects.filter(pk__in=pereval_ids, user_id__in=user_ids).values_list('pk', 'user_id'))
+
+
+def _user_passes(email):
+    user_id = user_cache.get_user_id(email)
+    if user_id is None:
+        return None, []
+    return user_id, list(Pereval.objects.filter(user_id=user_id).values_list('pk', flat=True))
+
+
+def _missed(after, until, pereval_ids):
+    """Смены статуса перевалов из журнала с offset после after и до until"""
+    log = EventLog()
+    missed = []
+    offset = after + 1
+    while offset < until:
+        records = [record for record in log.read(offset, settings.EVENT_READ_MAX) if record['offset'] < until]
+        if not records:
+            break
+        missed += [to_notification(record) for record in records
+                   if record['type'] == STATUS_EVENT and record['pereval'] in pereval_ids]
+        offset = records[-1]['offset'] + 1
+    return missed
+
+
+def _parse_offset(value):
+    if value in (None, ''):
+        return None
+    offset = int(value)
+    if offset < -1:
+        raise ValueError
+    return offset
+
+
+def _format_sse(notification):
+    data = json.dumps(notification, ensure_ascii=False)
+    return f"id: {notification['offset']}\nevent: status\ndata: {data}\n\n"
+
+
+async def status_stream(request):
+    """
+    GET /submitData/status/stream/?email=<email> — поток смен статуса перевалов
+    пользователя (text/event-stream). После переподключения с Last-Event-ID
+    (или ?after=<id последнего события>) сначала приходят пропущенные смены статуса.
+    """
+    email = request.GET.get('email')
+    if not email:
+        return JsonResponse({'error': 'Параметр email обязателен'}, status=400)
+    try:
+        after = _parse_offset(request.headers.get('Last-Event-ID') or request.GET.get('after'))
+    except ValueError:
+        return JsonResponse({'error': 'Некорректный Last-Event-ID'}, status=400)
+    user_id, pereval_ids = await sync_to_async(_user_passes)(email)
+    if user_id is None:
+        return JsonResponse({'error': 'Пользователь с таким email не найден'}, status=404)
+
+    if hub.full():
+        response = JsonResponse({'error': 'Слишком много подписок, повторите позже'}, status=503)
+        response['Retry-After'] = str(settings.ADMISSION_RETRY_AFTER)
+        return response
+
+    async def stream():
+        # Подписка оформляется при начале передачи: отключившийся раньше клиент её не оставляет
+        subscription = hub.subscribe(user_id, pereval_ids)
+        sent = after if after is not None else -1
+        try:
+            yield f"retry: {settings.NOTIFY_RETRY_MS}\n\n"
+            if after is not None:
+                missed = await sync_to_async(_missed, thread_sensitive=False)(after, hub.offset,
+                                                                              subscription.pereval_ids)
+                for notification in missed:
+                    sent = notification['offset']
+                    yield _format_sse(notification)
+            while True:
+                try:
+                    notification = await asyncio.wait_for(subscription.queue.get(),
+                                                          settings.NOTIFY_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # Комментарий держит соединение через прокси и выявляет отключившихся клиентов
+                    yield ': ping\n\n'
+                    continue
+                if notification is None:
+                    return
+                if notification['offset'] > sent:
+                    sent = notification['offset']
+                    yield _format_sse(notification)
+        finally:
+            hub.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+class LifespanApplication:
+    """
+    ASGI-приложение Django с обработкой lifespan: при остановке сервера
+    открытые потоки уведомлений закрываются, а не ждут таймаута
+    """
+
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'lifespan':
+            return await self.application(scope, receive, send)
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                hub.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
@@ -0,0 +1,144 @@
+"""
+Ограничение частоты запросов и сброс нагрузки.
+
+TokenBucketThrottle - троттлинг DRF по алгоритму token bucket: у каждого клиента
+(аутентифицированного пользователя, иначе IP-адреса) своё ведро для чтения и
+для записи. Email из заявки клиент указывает сам, поэтому ведро по нему не
+выбирается. Ведро пополняется на RATE_LIMIT_<READ|WRITE>_RATE запросов в секунду
+и вмещает RATE_LIMIT_<READ|WRITE>_BURST; пустое ведро - ответ 429 с Retry-After.
+Состояние хранится в кэше процесса или в общем кэше Django (RATE_LIMIT_CACHE_BACKEND).
+
+AdmissionControlMiddleware ограничивает число одновременно обрабатываемых
+запросов процесса отдельно для чтения и записи: массовая запись не занимает
+все потоки, а при перегрузке запрос сразу получает 503 с Retry-After вместо
+ожидания в очереди.
+"""
+import contextlib
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+from rest_framework.throttling import BaseThrottle
+
+from .cache import LRUCache
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_local = LRUCache(maxsize=settings.RATE_LIMIT_CACHE_SIZE)
+_local_lock = threading.Lock()
+
+
+def lane_for(request):
+    return 'read' if request.method in READ_METHODS else 'write'
+
+
+def _limits(lane):
+    if lane == 'read':
+        return settings.RATE_LIMIT_READ_RATE, settings.RATE_LIMIT_READ_BURST
+    return settings.RATE_LIMIT_WRITE_RATE, settings.RATE_LIMIT_WRITE_BURST
+
+
+def take_token(key, rate, burst, now=None):
+    """
+    Берёт токен из ведра key. Возвращает 0, если запрос разрешён,
+    иначе - через сколько секунд появится следующий токен.
+    """
+    now = time.time() if now is None else now
+    alias = settings.RATE_LIMIT_CACHE_BACKEND
+    store = caches[alias] if alias else None
+
+    # Общий кэш: чтение и запись не атомарны, при гонке лимит может быть немного превышен
+    lock = _local_lock if store is None else contextlib.nullcontext()
+    with lock:
+        state = _local.get(key) if store is None else store.get(key)
+        tokens, updated = state if state is not None else (burst, now)
+        tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        if store is None:
+            _local.set(key, (tokens, now))
+        else:
+            # Полное ведро хранить не нужно: запись живёт, пока ведро не наполнится
+            store.set(key, (tokens, now), timeout=math.ceil(burst / rate) + 1)
+    return wait
+
+
+def reset():
+    """Очистка вёдер процесса (общий кэш не затрагивается)"""
+    _local.clear()
+
+
+def client_id(request):
+    """
+    Клиент: аутентифицированный пользователь, иначе IP-адрес. Email из заявки или
+    user__email клиент указывает сам, поэтому по нему ведро не выбирается: иначе
+    можно менять email для обхода лимита или расходовать ведро чужого пользователя.
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return 'user:%s' % user.pk
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR') if settings.RATE_LIMIT_TRUST_FORWARDED else None
+    return 'ip:' + (forwarded.split(',')[0].strip() if forwarded else request.META.get('REMOTE_ADDR', ''))
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Троттлинг DRF: token bucket на клиента, отдельно для чтения и записи"""
+
+    def allow_request(self, request, view):
+        if not settings.RATE_LIMIT_ENABLED:
+            return True
+        lane = lane_for(request)
+        rate, burst = _limits(lane)
+        key = 'pereval:rate:%s:%s' % (lane, hashlib.sha1(client_id(request).encode('utf-8')).hexdigest())
+        self._wait = take_token(key, rate, burst)
+        return self._wait == 0
+
+    def wait(self):
+        return self._wait
+
+
+class AdmissionControlMiddleware:
+    """
+    Не более ADMISSION_MAX_READS запросов чтения и ADMISSION_MAX_WRITES запросов
+    записи одновременно (на процесс) для эндпоинтов из ADMISSION_ENDPOINTS.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.endpoints = set(settings.ADMISSION_ENDPOINTS)
+        self.lanes = {
+            'read': threading.BoundedSemaphore(settings.ADMISSION_MAX_READS),
+            'write': threading.BoundedSemaphore(settings.ADMISSION_MAX_WRITES),
+        }
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            lane = getattr(request, '_admission_lane', None)
+            if lane is not None:
+                self.lanes[lane].release()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        if match is None or match.url_name not in self.endpoints:
+            return None
+
+        lane = lane_for(request)
+        if not self.lanes[lane].acquire(blocking=False):
+            response = JsonResponse({
+                'status': 503,
+                'message': 'Сервер перегружен, повторите запрос позже',
+                'id': None
+            }, status=503)
+            response['Retry-After'] = str(settings.ADMISSION_RETRY_AFTER)
+            return response
+        request._admission_lane = lane
+        return None
@@ -0,0 +1,81 @@
+"""
+Материализованное представление опубликованных (accepted) перевалов.
+
+Когда перевал принимается, его полное представление PerevalSerializer
+сохраняется в PerevalDocument и обновляется при правках перевала, координат,
+уровня, изображений и пользователя (signals.py, moderation.set_status).
+GET /submitData/<id>/, список перевалов пользователя и выгрузка опубликованных
+перевалов отдают готовый документ одним запросом по первичному ключу,
+без JOIN с User, Coords, Level и Image.
+"""
+from django.db import transaction
+
+from .models import Pereval, PerevalDocument
+from .serializers import PerevalSerializer
+
+PUBLISHED_STATUS = 'accepted'
+
+
+def _published(ids):
+    return (Pereval.objects.filter(pk__in=ids, status=PUBLISHED_STATUS)
+            .select_related('user', 'coords', 'level').prefetch_related('images'))
+
+
+def refresh_many(ids, batch_size=500):
+    """
+    Пересобирает документы перевалов ids: для принятых - сохраняет представление,
+    у остальных удаляет документ. Возвращает число сохранённых документов.
+    """
+    ids = list(ids)
+    saved = 0
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        with transaction.atomic():
+            documents = [
+                PerevalDocument(pereval_id=pereval.pk, user_id=pereval.user_id,
+                                document=PerevalSerializer(pereval).data)
+                for pereval in _published(batch)
+            ]
+            PerevalDocument.objects.filter(pereval_id__in=batch).delete()
+            PerevalDocument.objects.bulk_create(documents)
+        saved += len(documents)
+    return saved
+
+
+def refresh(pereval_id):
+    return refresh_many([pereval_id])
+
+
+def refresh_all(batch_size=500):
+    """Пересобирает документы всех принятых перевалов (после загрузки в обход сигналов)"""
+    ids = Pereval.objects.filter(status=PUBLISHED_STATUS).order_by('pk').values_list('pk', flat=True)
+    with transaction.atomic():
+        PerevalDocument.objects.exclude(pereval__status=PUBLISHED_STATUS).delete()
+    return refresh_many(ids.iterator(), batch_size=batch_size)
+
+
+def get_document(pereval_id):
+    """Готовый документ перевала или None, если перевал не опубликован"""
+    return PerevalDocument.objects.filter(pk=pereval_id).values_list('document', flat=True).first()
+
+
+def user_documents(user_id, area_id=None):
+    """
+    Представления всех перевалов пользователя (или только района area_id) в порядке id:
+    опубликованные берутся из документов, остальные сериализуются как обычно
+    """
+    published = PerevalDocument.objects.filter(user_id=user_id)
+    others = Pereval.objects.filter(user_id=user_id, document__isnull=True)
+    if area_id is not None:
+        published = published.filter(pereval__area_id=area_id)
+        others = others.filter(area_id=area_id)
+    documents = list(published.values_list('pereval_id', 'document'))
+    others = others.select_related('user', 'coords', 'level').prefetch_related('images')
+    documents += [(pereval.pk, data) for pereval, data in zip(others, PerevalSerializer(others, many=True).data)]
+    return [document for _, document in sorted(documents, key=lambda item: item[0])]
+
+
+def iter_documents(chunk_size=2000):
+    """Документы всех опубликованных перевалов по порядку id (для выгрузки)"""
+    return (PerevalDocument.objects.order_by('pereval_id')
+            .values_list('document', flat=True).iterator(chunk_size=chunk_size))
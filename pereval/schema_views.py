@@ -0,0 +1,110 @@
+import hashlib
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils import translation
+from drf_spectacular.utils import extend_schema
+from drf_spectacular.views import SpectacularAPIView, SCHEMA_KWARGS
+from rest_framework.settings import api_settings
+
+# Готовые схемы: ключ (формат, язык, версия) -> (содержимое, content-type, etag)
+_schema_cache = {}
+_schema_lock = threading.Lock()
+
+SCHEMA_FILE_CONTENT_TYPES = {
+    '.json': 'application/vnd.oai.openapi+json',
+    '.yaml': 'application/vnd.oai.openapi',
+    '.yml': 'application/vnd.oai.openapi',
+}
+
+
+def clear_schema_cache():
+    """Сброс закэшированной схемы (например, в тестах)"""
+    with _schema_lock:
+        _schema_cache.clear()
+
+
+def _make_etag(content):
+    return '"%s"' % hashlib.sha256(content).hexdigest()[:32]
+
+
+def _supported_lang(lang):
+    """Язык из settings.LANGUAGES или None (схема на языке по умолчанию)"""
+    if not lang or not settings.USE_I18N:
+        return None
+    try:
+        return translation.get_supported_language_variant(lang)
+    except LookupError:
+        return None
+
+
+def _supported_version(version):
+    """Версия из ALLOWED_VERSIONS или None: без списка версий ?version= не учитывается"""
+    if version and api_settings.ALLOWED_VERSIONS and version in api_settings.ALLOWED_VERSIONS:
+        return version
+    return None
+
+
+class CachedSpectacularAPIView(SpectacularAPIView):
+    """
+    OpenAPI-схема, которая строится один раз и отдаётся из памяти с ETag.
+
+    Если задан API_SCHEMA_FILE, отдаётся заранее сгенерированный файл
+    (python manage.py spectacular --file schema.yml). При API_SCHEMA_CACHE=False
+    схема строится на каждый запрос, как в SpectacularAPIView.
+    """
+
+    @extend_schema(**SCHEMA_KWARGS)
+    def get(self, request, *args, **kwargs):
+        if not settings.API_SCHEMA_CACHE and not settings.API_SCHEMA_FILE:
+            return super().get(request, *args, **kwargs)
+
+        # Ключ только из поддерживаемых значений: произвольные ?lang= и ?version= не раздувают кэш
+        lang = _supported_lang(request.GET.get('lang'))
+        version = _supported_version(request.GET.get('version'))
+        key = (request.accepted_renderer.format, lang, version)
+        cached = _schema_cache.get(key)
+        if cached is None:
+            with _schema_lock:
+                cached = _schema_cache.get(key)
+                if cached is None:
+                    cached = self._build_schema(request, lang, version, *args, **kwargs)
+                    _schema_cache[key] = cached
+
+        content, content_type, etag = cached
+        if request.headers.get('If-None-Match') == etag:
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(content, content_type=content_type)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'public, max-age=%d' % settings.API_SCHEMA_MAX_AGE
+        return response
+
+    def _build_schema(self, request, lang, version, *args, **kwargs):
+        if settings.API_SCHEMA_FILE:
+            path = Path(settings.API_SCHEMA_FILE)
+            content = path.read_bytes()
+            content_type = SCHEMA_FILE_CONTENT_TYPES.get(path.suffix, 'application/octet-stream')
+            return content, content_type, _make_etag(content)
+
+        # Схема строится по тем же значениям, что и ключ кэша
+        query = request._request.GET.copy()
+        for name, value in (('lang', lang), ('version', version)):
+            if value is None:
+                query.pop(name, None)
+            else:
+                query[name] = value
+        request._request.GET = query
+
+        response = super().get(request, *args, **kwargs)
+        renderer = request.accepted_renderer
+        content = renderer.render(
+            response.data,
+            request.accepted_media_type,
+            {'request': request, 'response': response, 'view': self},
+        )
+        if isinstance(content, str):
+            content = content.encode(renderer.charset or 'utf-8')
+        return content, request.accepted_media_type, _make_etag(content)
@@ -1,12 +1,19 @@
+from django.conf import settings
 from rest_framework import serializers
+from rest_framework.fields import empty
 from .models import User, Coords, Level, Pereval, Image
+from .metrics import measure_serializer
+from . import areas, user_cache
+from .duplicates import flag_duplicates
 
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['email', 'last_name', 'first_name', 'middle_name', 'phone']
-        read_only_fields = ['email', 'last_name', 'first_name', 'middle_name', 'phone']
+        # Данные пользователя принимаются только при создании перевала (update их игнорирует),
+        # повторная заявка от существующего пользователя не должна падать на проверке уникальности email
+        extra_kwargs = {'email': {'validators': []}}
 
 
 class CoordsSerializer(serializers.ModelSerializer):
@@ -24,7 +31,8 @@ class LevelSerializer(serializers.ModelSerializer):
 class ImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Image
-        fields = ['file_path', 'title']
+        fields = ['file_path', 'title', 'file_size', 'file_type', 'width', 'height', 'thumbnail_path']
+        read_only_fields = ['file_size', 'file_type', 'width', 'height', 'thumbnail_path']
 
 
 class PerevalSerializer(serializers.ModelSerializer):
@@ -36,8 +44,17 @@ class PerevalSerializer(serializers.ModelSerializer):
     class Meta:
         model = Pereval
         fields = ['id', 'beauty_title', 'title', 'other_titles', 'connect', 'add_time',
-                  'status', 'user', 'coords', 'level', 'images']
-        read_only_fields = ['id', 'add_time', 'status']
+                  'status', 'area', 'user', 'coords', 'level', 'images']
+        read_only_fields = ['id', 'add_time', 'status', 'area']
+
+    # Время валидации и построения представления учитывается в метриках запроса
+    def run_validation(self, data=empty):
+        with measure_serializer():
+            return super().run_validation(data)
+
+    def to_representation(self, instance):
+        with measure_serializer():
+            return super().to_representation(instance)
 
     def create(self, validated_data):
         user_data = validated_data.pop('user')
@@ -45,8 +62,8 @@ class PerevalSerializer(serializers.ModelSerializer):
         level_data = validated_data.pop('level')
         images_data = validated_data.pop('images', [])
 
-        # Создаем пользователя или получаем существующего
-        user, _ = User.objects.get_or_create(email=user_data['email'], defaults=user_data)
+        # Создаем пользователя или получаем существующего (id берётся из кэша email -> id)
+        user_id = user_cache.get_or_create_user_id(user_data)
 
         # Создаем координаты
         coords = Coords.objects.create(**coords_data)
@@ -54,11 +71,12 @@ class PerevalSerializer(serializers.ModelSerializer):
         # Создаем уровень сложности
         level = Level.objects.create(**level_data)
 
-        # Создаем перевал
+        # Создаем перевал (район определяется по координатам)
         pereval = Pereval.objects.create(
-            user=user,
+            user_id=user_id,
             coords=coords,
             level=level,
+            area_id=areas.area_for(coords.latitude, coords.longitude),
             **validated_data
         )
 
@@ -67,6 +85,10 @@ class PerevalSerializer(serializers.ModelSerializer):
             if isinstance(image_data, dict):  # Проверяем, что данные являются словарем
                 Image.objects.create(pereval=pereval, **image_data)
 
+        # Отмечаем возможные дубли (рядом и с похожим названием) для модераторов
+        if settings.DUPLICATE_DETECTION:
+            flag_duplicates(pereval)
+
         return pereval
 
     def update(self, instance, validated_data):
@@ -89,6 +111,8 @@ class PerevalSerializer(serializers.ModelSerializer):
             # Если координат нет, создаем новые
             coords = Coords.objects.create(**coords_data)
             instance.coords = coords
+        if coords_data:
+            instance.area_id = areas.area_for(instance.coords.latitude, instance.coords.longitude)
 
         # Обновляем уровень сложности (если передан)
         if level_data and instance.level:
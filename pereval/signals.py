@@ -0,0 +1,166 @@
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from . import areas, events, read_model, tiles, user_cache
+from .models import User, Coords, Level, Pereval, Image, Area
+from .uploads import release_blob
+
+
+@receiver(pre_save, sender=User)
+def invalidate_changed_email(sender, instance, **kwargs):
+    """При смене email старое значение удаляется из кэша email -> id"""
+    if instance.pk is None:
+        return
+    old_email = getattr(instance, '_loaded_email', None)
+    if old_email is None:
+        # Объект создан не загрузкой из базы (или email не загружался): прежний email читается из базы
+        old_email = User.objects.filter(pk=instance.pk).values_list('email', flat=True).first()
+    if old_email and old_email != instance.email:
+        user_cache.invalidate(old_email)
+
+
+@receiver(post_save, sender=User)
+def invalidate_created_user(sender, instance, created, **kwargs):
+    """Новый пользователь вытесняет устаревшую запись с тем же email"""
+    instance._loaded_email = instance.email
+    if created:
+        user_cache.invalidate(instance.email)
+
+
+@receiver(post_delete, sender=User)
+def invalidate_deleted_user(sender, instance, **kwargs):
+    user_cache.invalidate(instance.email)
+
+
+@receiver(post_delete, sender=Image)
+def release_image_blob(sender, instance, **kwargs):
+    """Удаление изображения уменьшает счётчик ссылок на файл"""
+    if instance.blob_id:
+        release_blob(instance.blob_id)
+
+
+@receiver(pre_save, sender=Pereval)
+def remember_pereval_status(sender, instance, **kwargs):
+    """Запоминает прежний статус: от него зависит, показан ли перевал на карте"""
+    if instance.pk is not None:
+        instance._old_status = Pereval.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+
+
+@receiver(post_save, sender=Pereval)
+def update_tiles_on_pereval_save(sender, instance, created, **kwargs):
+    """Добавление и модерация перевала меняют кластеры карты"""
+    old_visible = not created and tiles.is_visible(getattr(instance, '_old_status', None))
+    new_visible = tiles.is_visible(instance.status)
+    if old_visible == new_visible:
+        return
+    coords = instance.coords
+    if new_visible:
+        tiles.add_point(coords.latitude, coords.longitude, coords.height)
+    else:
+        tiles.remove_point(coords.latitude, coords.longitude, coords.height)
+
+
+@receiver(post_delete, sender=Pereval)
+def update_tiles_on_pereval_delete(sender, instance, **kwargs):
+    if tiles.is_visible(instance.status):
+        coords = instance.coords
+        tiles.remove_point(coords.latitude, coords.longitude, coords.height)
+
+
+@receiver(pre_save, sender=Coords)
+def remember_coords(sender, instance, **kwargs):
+    """Запоминает прежние координаты перевала, показанного на карте"""
+    instance._old_point = None
+    if instance.pk is None:
+        return
+    old = (Coords.objects.filter(pk=instance.pk)
+           .values_list('latitude', 'longitude', 'height', 'pereval__status').first())
+    if old and old[3] is not None and tiles.is_visible(old[3]):
+        instance._old_point = old[:3]
+
+
+@receiver(post_save, sender=Coords)
+def update_tiles_on_coords_save(sender, instance, created, **kwargs):
+    """Правка координат переносит перевал в другие ячейки карты"""
+    old = getattr(instance, '_old_point', None)
+    new = (float(instance.latitude), float(instance.longitude), int(instance.height))
+    if old and tuple(old) != new:
+        tiles.move_point(old, new)
+
+
+@receiver(post_save, sender=Pereval)
+def refresh_document_on_pereval_save(sender, instance, created, **kwargs):
+    """Принятие перевала и правка принятого пересобирают его документ, снятие с публикации - удаляет"""
+    if read_model.PUBLISHED_STATUS in (instance.status, getattr(instance, '_old_status', None)):
+        read_model.refresh(instance.pk)
+
+
+@receiver(post_save, sender=Coords)
+@receiver(post_save, sender=Level)
+def refresh_document_on_related_save(sender, instance, created, **kwargs):
+    if created:
+        return
+    field = 'coords' if sender is Coords else 'level'
+    ids = Pereval.objects.filter(**{field: instance}, status=read_model.PUBLISHED_STATUS).values_list('pk', flat=True)
+    read_model.refresh_many(ids)
+
+
+@receiver(post_save, sender=Image)
+def refresh_document_on_image_save(sender, instance, **kwargs):
+    if instance.pereval.status == read_model.PUBLISHED_STATUS:
+        read_model.refresh(instance.pereval_id)
+
+
+@receiver(post_delete, sender=Image)
+def refresh_document_on_image_delete(sender, instance, origin=None, **kwargs):
+    # При удалении самого перевала (каскадом) документ удаляется вместе с ним
+    deleting_images = isinstance(origin, Image) or (isinstance(origin, QuerySet) and origin.model is Image)
+    if deleting_images and instance.pereval.status == read_model.PUBLISHED_STATUS:
+        read_model.refresh(instance.pereval_id)
+
+
+@receiver(post_save, sender=User)
+def refresh_documents_on_user_save(sender, instance, created, **kwargs):
+    """Данные пользователя входят в документы всех его принятых перевалов"""
+    if not created:
+        read_model.refresh_many(
+            Pereval.objects.filter(user=instance, status=read_model.PUBLISHED_STATUS).values_list('pk', flat=True)
+        )
+
+
+@receiver(post_save, sender=Pereval)
+def emit_pereval_saved(sender, instance, created, **kwargs):
+    old_status = getattr(instance, '_old_status', None)
+    if created:
+        events.emit('pereval', 'created', instance.pk, status=instance.status)
+    elif old_status is not None and old_status != instance.status:
+        events.emit('pereval', 'status', instance.pk, status=instance.status, previous_status=old_status)
+    else:
+        events.emit('pereval', 'updated', instance.pk, status=instance.status)
+
+
+@receiver(post_delete, sender=Pereval)
+def emit_pereval_deleted(sender, instance, **kwargs):
+    events.emit('pereval', 'deleted', instance.pk, previous_status=instance.status)
+
+
+@receiver(post_save, sender=Image)
+def emit_image_saved(sender, instance, created, **kwargs):
+    events.emit('image', 'created' if created else 'updated', instance.pereval_id, image_id=instance.pk)
+
+
+@receiver(post_delete, sender=Image)
+def emit_image_deleted(sender, instance, origin=None, **kwargs):
+    # При каскадном удалении перевала достаточно события pereval.deleted
+    if isinstance(origin, Image) or (isinstance(origin, QuerySet) and origin.model is Image):
+        events.emit('image', 'deleted', instance.pereval_id, image_id=instance.pk)
+
+
+@receiver(post_save, sender=Area)
+@receiver(post_delete, sender=Area)
+def invalidate_area_index(sender, instance, **kwargs):
+    # Сразу - для этой транзакции, после фиксации - для индекса, построенного другими потоками
+    areas.invalidate()
+    transaction.on_commit(areas.invalidate)
@@ -0,0 +1,275 @@
+"""
+Колоночный снимок перевалов для аналитики (/submitData/analytics/).
+
+Pereval + Coords + Level выгружаются в каталог SNAPSHOT_DIR/<версия>/ как
+отдельные массивы NumPy (.npy): координаты, высота, время добавления, коды
+статуса, коды категорий сложности (словарь значений - в meta.json) и id района.
+Файл SNAPSHOT_DIR/CURRENT указывает на последнюю готовую версию, поэтому
+новый снимок подменяет старый атомарно. Запросы к снимку выполняются
+векторно над массивами, отображёнными в память (np.load(mmap_mode='r')),
+и не обращаются к базе данных.
+"""
+import json
+import logging
+import os
+import shutil
+import threading
+from array import array
+from datetime import datetime
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .models import Area, Pereval
+
+logger = logging.getLogger(__name__)
+
+STATUSES = [code for code, _ in Pereval.STATUS_CHOICES]
+SEASONS = ('winter', 'summer', 'autumn', 'spring')
+LEVEL_COLUMNS = tuple(f'level_{season}' for season in SEASONS)
+# Колонка -> код типа массива (array/NumPy)
+COLUMNS = {
+    'id': 'q',
+    'latitude': 'f',
+    'longitude': 'f',
+    'height': 'i',
+    'add_time': 'q',  # секунды от начала эпохи (UTC)
+    'status': 'B',
+    **{column: 'H' for column in LEVEL_COLUMNS},
+    'area': 'L',  # id района, 0 - вне районов
+}
+GROUP_COLUMNS = ('status',) + LEVEL_COLUMNS
+CURRENT_FILE = 'CURRENT'
+
+_lock = threading.Lock()
+_loaded = None  # (каталог версии, Snapshot)
+
+
+class SnapshotUnavailable(Exception):
+    """Снимок ещё не выгружен"""
+
+
+def export(directory=None, batch_size=10000):
+    """Выгружает новый снимок, возвращает (версия, число перевалов)"""
+    directory = directory or settings.SNAPSHOT_DIR
+    os.makedirs(directory, exist_ok=True)
+
+    columns = {name: array(typecode) for name, typecode in COLUMNS.items()}
+    status_codes = {status: code for code, status in enumerate(STATUSES)}
+    level_codes = {'': 0}  # значение сложности -> код, 0 - не указана
+
+    rows = (Pereval.objects.order_by()
+            .values_list('id', 'coords__latitude', 'coords__longitude', 'coords__height',
+                         'add_time', 'status', 'area_id', *(f'level__{season}' for season in SEASONS)))
+    for pk, latitude, longitude, height, add_time, status, area_id, *levels in rows.iterator(chunk_size=batch_size):
+        columns['id'].append(pk)
+        columns['latitude'].append(latitude)
+        columns['longitude'].append(longitude)
+        columns['height'].append(height)
+        columns['add_time'].append(int(add_time.timestamp()))
+        columns['status'].append(status_codes[status])
+        columns['area'].append(area_id or 0)
+        for column, value in zip(LEVEL_COLUMNS, levels):
+            columns[column].append(level_codes.setdefault(value or '', len(level_codes)))
+
+    version = timezone.now().strftime('%Y%m%dT%H%M%S%f')
+    staging = os.path.join(directory, '.tmp-' + version)
+    os.makedirs(staging)
+    try:
+        for name, values in columns.items():
+            np.save(os.path.join(staging, name + '.npy'), np.frombuffer(values, dtype=COLUMNS[name]))
+        with open(os.path.join(staging, 'meta.json'), 'w', encoding='utf-8') as meta:
+            json.dump({
+                'version': version,
+                'created_at': timezone.now().isoformat(),
+                'rows': len(columns['id']),
+                'statuses': STATUSES,
+                'levels': list(level_codes),
+                'areas': {str(pk): title for pk, title in Area.objects.values_list('id', 'title')},
+            }, meta, ensure_ascii=False)
+        os.rename(staging, os.path.join(directory, version))
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    pointer = os.path.join(directory, CURRENT_FILE + '.tmp')
+    with open(pointer, 'w') as current:
+        current.write(version)
+    os.replace(pointer, os.path.join(directory, CURRENT_FILE))
+    _remove_old_versions(directory, keep=settings.SNAPSHOT_KEEP)
+    return version, len(columns['id'])
+
+
+def _remove_old_versions(directory, keep):
+    # Открытые отображения удалённых файлов остаются рабочими до закрытия
+    versions = sorted(name for name in os.listdir(directory)
+                      if os.path.isdir(os.path.join(directory, name)) and not name.startswith('.'))
+    for name in versions[:-keep] if keep > 0 else []:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+def run_refresher(stop_event, interval, batch_size=10000):
+    """Цикл фонового обновления снимка раз в interval секунд, пока не установлен stop_event"""
+    try:
+        while not stop_event.is_set():
+            try:
+                version, rows = export(batch_size=batch_size)
+                logger.info('Снимок %s выгружен, перевалов: %s', version, rows)
+            except Exception:
+                logger.exception('Ошибка выгрузки снимка для аналитики')
+            stop_event.wait(interval)
+    finally:
+        connection.close()
+
+
+class Snapshot:
+    """Снимок, открытый только для чтения"""
+
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as meta:
+            self.meta = json.load(meta)
+        # Пустой файл отобразить в память нельзя
+        mmap_mode = 'r' if self.meta['rows'] else None
+        self.columns = {}
+        for name, typecode in COLUMNS.items():
+            column_path = os.path.join(path, name + '.npy')
+            # Снимки прежних версий выгружены без части колонок
+            self.columns[name] = (np.load(column_path, mmap_mode=mmap_mode) if os.path.exists(column_path)
+                                  else np.zeros(self.rows, dtype=typecode))
+
+    @property
+    def rows(self):
+        return self.meta['rows']
+
+    def labels(self, column):
+        return self.meta['statuses'] if column == 'status' else self.meta['levels']
+
+
+def current(directory=None):
+    """Последний выгруженный снимок (переоткрывается, когда выгружена новая версия)"""
+    global _loaded
+    directory = directory or settings.SNAPSHOT_DIR
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as pointer:
+            path = os.path.join(directory, pointer.read().strip())
+    except FileNotFoundError:
+        raise SnapshotUnavailable('Снимок для аналитики ещё не выгружен')
+
+    with _lock:
+        if _loaded is None or _loaded[0] != path:
+            _loaded = (path, Snapshot(path))
+        return _loaded[1]
+
+
+def _float(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f'{name}: ожидается число')
+
+
+def _timestamp(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'{name}: ожидается дата в формате ISO 8601')
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment.timestamp()
+
+
+def _codes(snapshot, column, values):
+    labels = snapshot.labels(column)
+    return [labels.index(value) for value in values.split(',') if value in labels]
+
+
+def _ids(params, name):
+    try:
+        return [int(value) for value in params[name].split(',')]
+    except ValueError:
+        raise ValueError(f'{name}: ожидаются id через запятую')
+
+
+def _height_stats(heights):
+    if not len(heights):
+        return {'count': 0, 'height_min': None, 'height_max': None, 'height_mean': None}
+    return {
+        'count': int(len(heights)),
+        'height_min': int(heights.min()),
+        'height_max': int(heights.max()),
+        'height_mean': round(float(heights.mean()), 1),
+    }
+
+
+def query(snapshot, params):
+    """
+    Агрегаты по снимку. Фильтры (все необязательны): lat_min, lat_max, lon_min, lon_max,
+    height_min, height_max, added_from, added_to (ISO 8601), status и level_<сезон>
+    (значения через запятую), area (id районов через запятую). group_by - status,
+    level_<сезон> или area, height_bins - число интервалов гистограммы высот.
+    """
+    columns = snapshot.columns
+    mask = np.ones(snapshot.rows, dtype=bool)
+
+    for column, low, high in (('latitude', 'lat_min', 'lat_max'),
+                              ('longitude', 'lon_min', 'lon_max'),
+                              ('height', 'height_min', 'height_max')):
+        low, high = _float(params, low), _float(params, high)
+        if low is not None:
+            mask &= columns[column] >= low
+        if high is not None:
+            mask &= columns[column] <= high
+
+    added_from, added_to = _timestamp(params, 'added_from'), _timestamp(params, 'added_to')
+    if added_from is not None:
+        mask &= columns['add_time'] >= added_from
+    if added_to is not None:
+        mask &= columns['add_time'] <= added_to
+
+    for column in GROUP_COLUMNS:
+        if params.get(column):
+            mask &= np.isin(columns[column], _codes(snapshot, column, params[column]))
+
+    if params.get('area'):
+        mask &= np.isin(columns['area'], _ids(params, 'area'))
+
+    heights = columns['height'][mask]
+    result = {
+        'snapshot': {key: snapshot.meta[key] for key in ('version', 'created_at', 'rows')},
+        'total': _height_stats(heights),
+    }
+
+    group_by = params.get('group_by')
+    if group_by == 'area':
+        codes = columns['area'][mask]
+        titles = snapshot.meta.get('areas', {})
+        result['groups'] = [
+            {'value': int(code) or None, 'title': titles.get(str(code)), **_height_stats(heights[codes == code])}
+            for code in np.unique(codes)
+        ]
+    elif group_by:
+        if group_by not in GROUP_COLUMNS:
+            raise ValueError(f"group_by: допустимые значения {', '.join(GROUP_COLUMNS + ('area',))}")
+        codes = columns[group_by][mask]
+        labels = snapshot.labels(group_by)
+        result['groups'] = [
+            {'value': labels[code], **_height_stats(heights[codes == code])}
+            for code in np.unique(codes)
+        ]
+
+    bins = params.get('height_bins')
+    if bins:
+        if not str(bins).isdigit() or not 0 < int(bins) <= 1000:
+            raise ValueError('height_bins: ожидается число от 1 до 1000')
+        counts, edges = np.histogram(heights, bins=int(bins))
+        result['height_histogram'] = {'counts': counts.tolist(), 'edges': edges.tolist()}
+
+    return result
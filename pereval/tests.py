@@ -4,6 +4,8 @@ from rest_framework.test import APIClient
 from rest_framework import status
 from .models import User, Coords, Level, Pereval, Image
 import json
+import os
+import unittest
 
 
 class PerevalModelTest(TestCase):
@@ -415,4 +417,2110 @@ class PerevalEdgeCasesTest(TestCase):
             content_type='application/json'
         )
 
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class DatabaseSettingsCheckTest(TestCase):
+    """Тесты системной проверки конфигурации базы данных"""
+
+    def test_sqlite_in_production_warns(self):
+        """SQLite в production даёт предупреждение"""
+        from django.test import override_settings
+        from .checks import check_production_database
+
+        with override_settings(PRODUCTION=True):
+            warnings = check_production_database(None)
+        self.assertEqual([w.id for w in warnings], ['pereval.W001'])
+
+    def test_sqlite_in_debug_ok(self):
+        """При разработке SQLite допустим"""
+        from django.test import override_settings
+        from .checks import check_production_database
+
+        with override_settings(PRODUCTION=False):
+            self.assertEqual(check_production_database(None), [])
+
+
+class CachedSchemaViewTest(TestCase):
+    """Тесты кэширования OpenAPI-схемы"""
+
+    def setUp(self):
+        from .schema_views import clear_schema_cache
+        clear_schema_cache()
+        self.client = APIClient()
+
+    def test_schema_etag_and_not_modified(self):
+        """Схема отдаётся с ETag, повторный запрос с If-None-Match получает 304"""
+        response = self.client.get(reverse('schema'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+        self.assertTrue(etag)
+
+        response = self.client.get(reverse('schema'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_schema_generated_once(self):
+        """Повторные запросы не перестраивают схему"""
+        from unittest import mock
+        from drf_spectacular.generators import SchemaGenerator
+
+        with mock.patch.object(SchemaGenerator, 'get_schema', wraps=SchemaGenerator().get_schema) as get_schema:
+            self.client.get(reverse('schema'))
+            self.client.get(reverse('schema'))
+        self.assertEqual(get_schema.call_count, 1)
+
+    def test_cache_key_normalized(self):
+        """Неподдерживаемые ?lang= и ?version= не создают новых записей кэша"""
+        from .schema_views import _schema_cache
+
+        for index in range(5):
+            self.client.get(reverse('schema'), {'lang': f'xx-{index}', 'version': f'v{index}'})
+        self.client.get(reverse('schema'))
+        self.assertEqual(len(_schema_cache), 1)
+
+        self.client.get(reverse('schema'), {'lang': 'en'})
+        self.client.get(reverse('schema'), {'lang': 'en-us'})
+        self.assertEqual(len(_schema_cache), 2)
+
+
+class PerformanceMetricsTest(TestCase):
+    """Тесты метрик производительности"""
+
+    def setUp(self):
+        from .metrics import reset_metrics
+        reset_metrics()
+        self.client = APIClient()
+        user = User.objects.create(email='metrics@example.com', last_name='Петров',
+                                   first_name='Пётр', phone='+79990000001')
+        self.pereval = Pereval.objects.create(
+            title='Перевал для метрик',
+            user=user,
+            coords=Coords.objects.create(latitude=43.0, longitude=42.0, height=3000),
+            level=Level.objects.create(summer='1A'),
+        )
+
+    def test_server_timing_header(self):
+        """Ответ содержит заголовок Server-Timing с SQL, сериализацией и общим временем"""
+        response = self.client.get(reverse('submit-data-detail', kwargs={'pk': self.pereval.pk}))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        timing = response['Server-Timing']
+        self.assertIn('sql;dur=', timing)
+        self.assertIn('serializer;dur=', timing)
+        self.assertIn('total;dur=', timing)
+
+    def test_metrics_endpoint(self):
+        """/metrics отдаёт гистограммы по эндпоинтам"""
+        self.client.get(reverse('submit-data-detail', kwargs={'pk': self.pereval.pk}))
+        response = self.client.get(reverse('metrics'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.content.decode()
+        self.assertIn('pereval_request_duration_seconds_count{endpoint="submit-data-detail"} 1', body)
+        self.assertIn('pereval_sql_queries_bucket{endpoint="submit-data-detail"', body)
+        self.assertNotIn('endpoint="metrics"', body)
+
+
+class BenchmarkTest(TestCase):
+    """Тесты нагрузочного бенчмарка"""
+
+    def test_seed_and_run_detail_scenario(self):
+        """Бенчмарк заполняет базу и возвращает перцентили и число запросов"""
+        from .bench import seed_dataset, run_scenario
+
+        dataset = seed_dataset(users=3, passes=10, images_per_pass=1, seed=1)
+        self.assertEqual(Pereval.objects.count(), 10)
+        self.assertEqual(Image.objects.count(), 10)
+
+        result = run_scenario('detail', dataset, requests=5, concurrency=1)
+        self.assertEqual(result['requests'], 5)
+        self.assertEqual(result['errors'], 0)
+        self.assertIsNotNone(result['latency_ms']['p99'])
+        self.assertGreater(result['queries_per_request'], 0)
+
+    def test_sqlite_runs_single_thread(self):
+        """На SQLite бенчмарк идёт в одном потоке: блокировки таблиц не попадают в результаты"""
+        import io
+        from unittest import mock
+        from django.core.management import call_command
+
+        command = 'pereval.management.commands.benchmark'
+        with mock.patch(f'{command}.run_benchmark', return_value={}) as run_benchmark, \
+                mock.patch(f'{command}.setup_test_environment'), \
+                mock.patch(f'{command}.teardown_test_environment'), \
+                mock.patch(f'{command}.connection.creation.create_test_db'), \
+                mock.patch(f'{command}.connection.creation.destroy_test_db'):
+            call_command('benchmark', '--concurrency', '8', stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertEqual(run_benchmark.call_args.kwargs['concurrency'], 1)
+
+    def test_not_throttled(self):
+        """Запросы бенчмарка с одного адреса не отклоняются троттлингом"""
+        from django.test import override_settings
+        from .bench import seed_dataset, run_scenario
+        from . import ratelimit
+
+        self.addCleanup(ratelimit.reset)
+        dataset = seed_dataset(users=3, passes=10, images_per_pass=1, seed=1)
+        with override_settings(RATE_LIMIT_ENABLED=True, RATE_LIMIT_READ_RATE=0.1, RATE_LIMIT_READ_BURST=2):
+            result = run_scenario('detail', dataset, requests=10, concurrency=1)
+        self.assertEqual(result['errors'], 0)
+
+    def test_fails_on_errors(self):
+        """Команда завершается ошибкой, если в сценарии были неуспешные запросы"""
+        import io
+        from unittest import mock
+        from django.core.management import call_command, CommandError
+
+        command = 'pereval.management.commands.benchmark'
+        report = {'results': [{'scenario': 'create', 'errors': 3}]}
+        with mock.patch(f'{command}.run_benchmark', return_value=report), \
+                mock.patch(f'{command}.setup_test_environment'), \
+                mock.patch(f'{command}.teardown_test_environment'), \
+                mock.patch(f'{command}.connection.creation.create_test_db'), \
+                mock.patch(f'{command}.connection.creation.destroy_test_db'):
+            with self.assertRaisesMessage(CommandError, 'create: 3'):
+                call_command('benchmark', stdout=io.StringIO(), stderr=io.StringIO())
+
+    def test_percentile(self):
+        """Перцентиль по ближайшему рангу"""
+        from .bench import percentile
+
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertIsNone(percentile([], 50))
+
+
+class DataGeneratorTest(TestCase):
+    """Тесты генератора синтетических данных"""
+
+    def test_generate_passes(self):
+        """Генератор создаёт заданное число перевалов с координатами в горных районах"""
+        from .datagen import generate_passes, MOUNTAIN_RANGES
+
+        created = generate_passes(25, users=5, batch_size=10, seed=3)
+
+        self.assertEqual(created, 25)
+        self.assertEqual(Pereval.objects.count(), 25)
+        self.assertEqual(User.objects.count(), 5)
+        for coords in Coords.objects.all():
+            self.assertTrue(any(
+                lat_min <= coords.latitude <= lat_max and lon_min <= coords.longitude <= lon_max
+                for _, lat_min, lat_max, lon_min, lon_max, _, _ in MOUNTAIN_RANGES
+            ))
+
+    def test_generated_documents_and_events(self):
+        """У сгенерированных перевалов есть события создания, у принятых - документы"""
+        from .datagen import generate_passes
+        from .models import ChangeEvent, PerevalDocument
+        from .read_model import PUBLISHED_STATUS
+
+        generate_passes(30, users=3, batch_size=10, seed=5)
+
+        self.assertEqual(set(ChangeEvent.objects.filter(action='created').values_list('pereval_id', flat=True)),
+                         set(Pereval.objects.values_list('pk', flat=True)))
+        self.assertEqual(set(PerevalDocument.objects.values_list('pereval_id', flat=True)),
+                         set(Pereval.objects.filter(status=PUBLISHED_STATUS).values_list('pk', flat=True)))
+
+    def test_generate_batch_reproducible(self):
+        """Одинаковое зерно и номер пачки дают одинаковые данные"""
+        from .datagen import create_users, generate_batch
+
+        user_ids = create_users(3)
+        first = generate_batch(0, 5, user_ids, seed=7)
+        second = generate_batch(0, 5, user_ids, seed=7)
+
+        def snapshot(ids):
+            return list(Pereval.objects.filter(pk__in=ids).order_by('pk').values_list(
+                'title', 'status', 'user_id', 'coords__latitude', 'coords__height', 'level__summer'))
+
+        self.assertEqual(snapshot(first), snapshot(second))
+
+
+class LegacyImportTest(TestCase):
+    """Тесты импорта архивных заявок"""
+
+    def setUp(self):
+        import tempfile
+
+        self.legacy_record = {
+            "beautyTitle": "пер. ",
+            "title": "Пхия",
+            "other_titles": "Триев",
+            "connect": "",
+            "add_time": "2021-09-22 13:18:13",
+            "user": {"email": "qwerty@mail.ru", "fam": "Пупкин", "name": "Василий",
+                     "otc": "Иванович", "phone": "+7 555 55 55"},
+            "coords": {"latitude": "45.3842", "longitude": "7.1525", "height": "1200"},
+            "level": {"winter": "", "summer": "1А", "autumn": "1А", "spring": ""},
+            "images": [{"data": "/legacy/1.jpg", "title": "Седловина"}],
+        }
+        self.tmp = tempfile.NamedTemporaryFile('w', suffix='.jsonl', encoding='utf-8', delete=False)
+        self.addCleanup(os.remove, self.tmp.name)
+
+    def write_lines(self, lines):
+        self.tmp.write('\n'.join(lines) + '\n')
+        self.tmp.flush()
+
+    def test_map_legacy_record(self):
+        """Поля fam/name/otc/beautyTitle переносятся в поля моделей"""
+        from .legacy_import import map_legacy_record
+
+        mapped = map_legacy_record(self.legacy_record)
+        self.assertEqual(mapped['user']['last_name'], 'Пупкин')
+        self.assertEqual(mapped['user']['middle_name'], 'Иванович')
+        self.assertEqual(mapped['pereval']['beauty_title'], 'пер. ')
+        self.assertEqual(mapped['coords']['height'], 1200)
+        self.assertIsNone(mapped['level']['winter'])
+        self.assertEqual(mapped['images'], [{'file_path': '/legacy/1.jpg', 'title': 'Седловина'}])
+
+    def test_import_and_resume(self):
+        """Импорт пишет заявки с событиями создания и не дублирует их при повторном запуске"""
+        from .legacy_import import import_shard
+        from .models import ChangeEvent
+
+        second = dict(self.legacy_record, title='Второй')
+        self.write_lines([json.dumps(self.legacy_record), 'не json', json.dumps(second)])
+
+        stats = import_shard([self.tmp.name], 0, 1, batch_size=1)
+        self.assertEqual(stats['imported'], 2)
+        self.assertEqual(stats['skipped'], 1)
+        self.assertEqual(ChangeEvent.objects.filter(action='created').count(), 2)
+        self.assertEqual(User.objects.count(), 1)
+        self.assertEqual(Image.objects.count(), 2)
+        self.assertEqual(Pereval.objects.get(title='Пхия').add_time.year, 2021)
+
+        stats = import_shard([self.tmp.name], 0, 1)
+        self.assertEqual(stats['imported'], 0)
+        self.assertEqual(Pereval.objects.count(), 2)
+
+    def test_shards_split_by_email(self):
+        """Каждая заявка попадает ровно в один шард"""
+        from .legacy_import import import_shard
+
+        records = [dict(self.legacy_record, user=dict(self.legacy_record['user'], email=f'u{i}@mail.ru'))
+                   for i in range(10)]
+        self.write_lines([json.dumps(record) for record in records])
+
+        imported = sum(import_shard([self.tmp.name], shard, 3)['imported'] for shard in range(3))
+        self.assertEqual(imported, 10)
+        self.assertEqual(Pereval.objects.count(), 10)
+
+    def test_scan_shards(self):
+        """Предварительный проход делит строки по шардам так же, как email записи"""
+        from .legacy_import import scan_shards, shard_for_email
+
+        emails = [f'u{i}@mail.ru' for i in range(10)]
+        records = [dict(self.legacy_record, user=dict(self.legacy_record['user'], email=email)) for email in emails]
+        self.write_lines([json.dumps(record) for record in records] + ['', 'не json'])
+
+        shards = scan_shards(self.tmp.name, 3)
+        for shard, (line_numbers, offsets) in enumerate(shards):
+            expected = [number for number, email in enumerate(emails, 1) if shard_for_email(email, 3) == shard]
+            if shard == 0:
+                expected.append(12)
+            self.assertEqual(list(line_numbers), expected)
+        with open(self.tmp.name, 'rb') as f:
+            f.seek(shards[0][1][-1])
+            self.assertEqual(f.readline().decode('utf-8').strip(), 'не json')
+
+    def test_rejects_other_shard_count(self):
+        """Импорт, начатый в другом числе процессов, не продолжается (иначе заявки задублируются)"""
+        from .legacy_import import ShardCountMismatch, import_files, import_shard
+
+        self.write_lines([json.dumps(self.legacy_record)])
+        for shard in range(2):
+            import_shard([self.tmp.name], shard, 2)
+
+        with self.assertRaises(ShardCountMismatch):
+            import_files([self.tmp.name], workers=1)
+        self.assertEqual(Pereval.objects.count(), 1)
+
+    def test_too_long_fields_skipped(self):
+        """Значения длиннее полей модели пропускаются с ошибкой, остальные заявки импортируются"""
+        from .legacy_import import import_shard
+
+        long_title = dict(self.legacy_record, title='П' * 256)
+        long_phone = dict(self.legacy_record, user=dict(self.legacy_record['user'], phone='1' * 21))
+        self.write_lines([json.dumps(long_title), json.dumps(long_phone), json.dumps(self.legacy_record)])
+
+        stats = import_shard([self.tmp.name], 0, 1)
+        self.assertEqual((stats['imported'], stats['skipped']), (1, 2))
+        self.assertIn(':1: title', stats['errors'][0])
+        self.assertIn(':2: user.phone', stats['errors'][1])
+
+
+class IdempotencyTest(TestCase):
+    """Тесты обработки заголовка Idempotency-Key"""
+
+    def setUp(self):
+        from .idempotency import clear_cache
+        clear_cache()
+        self.client = APIClient()
+        user = User.objects.create(email='retry@example.com', last_name='Сидоров',
+                                   first_name='Сидор', phone='+79990000002')
+        self.pereval = Pereval.objects.create(
+            title='Исходный перевал',
+            user=user,
+            coords=Coords.objects.create(latitude=43.0, longitude=42.0, height=3000),
+            level=Level.objects.create(summer='1A'),
+        )
+        self.url = reverse('submit-data-update', kwargs={'pk': self.pereval.pk})
+
+    def patch(self, data, key):
+        return self.client.patch(self.url, data=json.dumps(data), content_type='application/json',
+                                 HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_returns_stored_response(self):
+        """Повтор с тем же ключом возвращает сохранённый ответ и не меняет данные"""
+        response = self.patch({'title': 'Первое обновление'}, 'key-1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('Idempotent-Replayed', response)
+
+        Pereval.objects.filter(pk=self.pereval.pk).update(title='Изменено модератором')
+
+        response = self.patch({'title': 'Первое обновление'}, 'key-1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(response.data['state'], 1)
+        self.assertEqual(Pereval.objects.get(pk=self.pereval.pk).title, 'Изменено модератором')
+
+    def test_retry_without_database(self):
+        """Повтор из кэша процесса не обращается к базе"""
+        self.patch({'title': 'Первое обновление'}, 'key-2')
+
+        with self.assertNumQueries(0):
+            response = self.patch({'title': 'Первое обновление'}, 'key-2')
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+
+    def test_database_fallback(self):
+        """После очистки кэша процесса ответ берётся из базы"""
+        from .idempotency import clear_cache
+
+        self.patch({'title': 'Первое обновление'}, 'key-3')
+        clear_cache()
+        Pereval.objects.filter(pk=self.pereval.pk).update(title='Изменено модератором')
+
+        response = self.patch({'title': 'Первое обновление'}, 'key-3')
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(Pereval.objects.get(pk=self.pereval.pk).title, 'Изменено модератором')
+
+    def test_key_reused_with_other_body(self):
+        """Тот же ключ с другим телом запроса отклоняется"""
+        self.patch({'title': 'Первое обновление'}, 'key-4')
+        response = self.patch({'title': 'Другое обновление'}, 'key-4')
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    def test_record_not_saved(self):
+        """Если ключ не сохранился, изменения откатываются и клиент получает 500, а не успех"""
+        from unittest import mock
+        from django.db import DatabaseError
+        from .models import IdempotencyRecord
+
+        with mock.patch.object(IdempotencyRecord.objects, 'create', side_effect=DatabaseError('disk full')):
+            response = self.patch({'title': 'Первое обновление'}, 'key-5')
+
+        self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+        self.assertEqual(Pereval.objects.get(pk=self.pereval.pk).title, 'Исходный перевал')
+
+        response = self.patch({'title': 'Первое обновление'}, 'key-5')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('Idempotent-Replayed', response)
+
+    def test_lru_cache_eviction_and_ttl(self):
+        """Кэш вытесняет давно неиспользуемые записи и истекает по TTL"""
+        from unittest import mock
+        from .cache import LRUCache
+
+        cache = LRUCache(maxsize=2, ttl=10)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+
+        with mock.patch('lrucache.time.monotonic', return_value=10 ** 9):
+            self.assertIsNone(cache.get('a'))
+
+
+class IngestQueueTest(TestCase):
+    """Тесты асинхронного приёма заявок"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.payload = {
+            "title": "Перевал из очереди",
+            "user": {"email": "queue@example.com", "last_name": "Очередь",
+                     "first_name": "Оля", "phone": "+79990000003"},
+            "coords": {"latitude": 43.1, "longitude": 42.1, "height": 3100},
+            "level": {"summer": "1A"},
+            "images": []
+        }
+
+    def test_async_submit_returns_ticket(self):
+        """В асинхронном режиме заявка ставится в очередь и возвращается 202 с номером"""
+        from django.test import override_settings
+
+        with override_settings(INGEST_MODE='async'):
+            response = self.client.post(reverse('submit-data'), data=json.dumps(self.payload),
+                                        content_type='application/json')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(Pereval.objects.count(), 0)
+
+        response = self.client.get(reverse('submit-data-ingest-status',
+                                           kwargs={'ticket': response.data['ticket']}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['state'], 'queued')
+
+    def test_invalid_payload_not_queued(self):
+        """Некорректная заявка отклоняется сразу и в очередь не попадает"""
+        from django.test import override_settings
+        from .models import IngestTicket
+
+        self.payload['coords']['latitude'] = 100
+        with override_settings(INGEST_MODE='async'):
+            response = self.client.post(reverse('submit-data'), data=json.dumps(self.payload),
+                                        content_type='application/json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(IngestTicket.objects.count(), 0)
+
+    def test_claim_and_process(self):
+        """Заявка забирается одним обработчиком, результат сохраняется в заявке"""
+        from unittest import mock
+        from .ingest import enqueue, claim_batch, process_batch
+        from .serializers import PerevalSerializer
+
+        ticket = enqueue(self.payload)
+        tickets = claim_batch(10)
+        self.assertEqual([t.id for t in tickets], [ticket.id])
+        self.assertEqual(claim_batch(10), [])
+
+        user = User.objects.create(email='queue@example.com', last_name='Очередь',
+                                   first_name='Оля', phone='+79990000003')
+        pereval = Pereval.objects.create(
+            title='Перевал из очереди', user=user,
+            coords=Coords.objects.create(latitude=43.1, longitude=42.1, height=3100),
+            level=Level.objects.create(summer='1A'),
+        )
+        with mock.patch.object(PerevalSerializer, 'save', return_value=pereval):
+            process_batch(tickets)
+
+        ticket.refresh_from_db()
+        self.assertEqual(ticket.status, 'done')
+        self.assertEqual(ticket.pereval_id, pereval.id)
+
+    def test_reclaimed_ticket_processed_once(self):
+        """После перехвата заявки с истёкшей арендой прежний обработчик не создаёт перевал"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from .ingest import enqueue, claim_batch, process_batch
+        from .models import IngestTicket
+
+        ticket = enqueue(self.payload)
+        stale = claim_batch(10)
+        IngestTicket.objects.filter(pk=ticket.pk).update(claimed_at=timezone.now() - timedelta(days=1))
+        fresh = claim_batch(10)
+
+        self.assertEqual(process_batch(stale), 0)
+        self.assertEqual(Pereval.objects.count(), 0)
+        self.assertEqual(process_batch(fresh), 1)
+        self.assertEqual(Pereval.objects.count(), 1)
+        ticket.refresh_from_db()
+        self.assertEqual((ticket.status, ticket.claim_token), ('done', fresh[0].claim_token))
+
+
+class UserIdCacheTest(TestCase):
+    """Тесты кэша email -> id пользователя"""
+
+    def setUp(self):
+        from . import user_cache
+        user_cache.clear()
+        self.user = User.objects.create(email='cached@example.com', last_name='Кэш',
+                                        first_name='Карл', phone='+79990000004')
+
+    def test_lookup_cached_after_commit(self):
+        """После фиксации транзакции повторный поиск не обращается к базе"""
+        from . import user_cache
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(user_cache.get_user_id('cached@example.com'), self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(user_cache.get_user_id('cached@example.com'), self.user.pk)
+
+    def test_not_cached_before_commit(self):
+        """До фиксации транзакции id в кэш не попадает"""
+        from . import user_cache
+
+        user_cache.get_user_id('cached@example.com')
+        with self.assertNumQueries(1):
+            user_cache.get_user_id('cached@example.com')
+
+    def test_invalidated_on_delete_and_email_change(self):
+        """Удаление пользователя и смена email сбрасывают кэш"""
+        from . import user_cache
+
+        with self.captureOnCommitCallbacks(execute=True):
+            user_cache.get_user_id('cached@example.com')
+        self.user.email = 'renamed@example.com'
+        self.user.save()
+        self.assertIsNone(user_cache.get_user_id('cached@example.com'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            user_cache.get_user_id('renamed@example.com')
+        self.user.delete()
+        self.assertIsNone(user_cache.get_user_id('renamed@example.com'))
+
+    def test_save_does_not_reload_email(self):
+        """Сохранение загруженного пользователя не перечитывает email из базы"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from . import user_cache
+
+        user = User.objects.get(pk=self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            user_cache.get_user_id('cached@example.com')
+        user.email = 'loaded@example.com'
+        with CaptureQueriesContext(connection) as queries:
+            user.save()
+        self.assertFalse([query for query in queries if 'SELECT "pereval_user"."email"' in query['sql']])
+        self.assertIsNone(user_cache.get_user_id('cached@example.com'))
+
+    def test_user_list_unknown_email(self):
+        """Список перевалов неизвестного пользователя - 404"""
+        response = APIClient().get(reverse('submit-data-user-list'), {'user__email': 'nobody@example.com'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ImageUploadTest(TestCase):
+    """Тесты потоковой загрузки изображений"""
+
+    def setUp(self):
+        import shutil
+        import tempfile
+        from django.test import override_settings
+
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root, IMAGE_PROCESSING='inline')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.client = APIClient()
+        user = User.objects.create(email='photo@example.com', last_name='Фото',
+                                   first_name='Фёдор', phone='+79990000005')
+        self.pereval = Pereval.objects.create(
+            title='Перевал с фото',
+            user=user,
+            coords=Coords.objects.create(latitude=43.0, longitude=42.0, height=3000),
+            level=Level.objects.create(summer='1A'),
+        )
+        self.url = reverse('submit-data-images', kwargs={'pk': self.pereval.pk})
+
+    def make_png(self, width=40, height=30):
+        import io
+        from PIL import Image as PILImage
+
+        buffer = io.BytesIO()
+        PILImage.new('RGB', (width, height), 'blue').save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    def test_multipart_upload(self):
+        """Файлы из multipart сохраняются в MEDIA_ROOT, метаданные и миниатюра вычисляются"""
+        import os
+        from django.conf import settings
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, {
+                'image': [SimpleUploadedFile('a.png', self.make_png(), content_type='image/png'),
+                          SimpleUploadedFile('b.png', self.make_png(), content_type='image/png')],
+                'title': ['Седловина', 'Подъём'],
+            }, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['images']), 2)
+        image = Image.objects.get(title='Седловина')
+        self.assertEqual((image.width, image.height), (40, 30))
+        self.assertEqual(image.file_type, 'image/png')
+        self.assertTrue(image.thumbnail_path)
+        relative = image.file_path[len(settings.MEDIA_URL):]
+        self.assertEqual(os.path.getsize(os.path.join(settings.MEDIA_ROOT, relative)), image.file_size)
+
+    def test_raw_body_upload(self):
+        """Изображение в теле запроса с Content-Type: image/*"""
+        response = self.client.post(self.url + '?title=Вид', data=self.make_png(), content_type='image/png')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.pereval.images.get().title, 'Вид')
+
+    def test_rejects_large_and_unsupported_files(self):
+        """Слишком большие файлы и неизображения отклоняются"""
+        from django.test import override_settings
+
+        response = self.client.post(self.url, data=b'text', content_type='text/plain')
+        self.assertEqual(response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+        with override_settings(IMAGE_UPLOAD_MAX_SIZE=10):
+            response = self.client.post(self.url, data=self.make_png(), content_type='image/png')
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertFalse(self.pereval.images.exists())
+
+    def test_temporary_files_removed(self):
+        """Временные файлы удаляются, если следующий файл отклонён или запись в базу не удалась"""
+        import os
+        from unittest import mock
+        from django.conf import settings
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from django.test import override_settings
+
+        png = self.make_png()
+        with override_settings(IMAGE_UPLOAD_MAX_SIZE=len(png) + 10), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, {
+                'image': [SimpleUploadedFile('a.png', png, content_type='image/png'),
+                          SimpleUploadedFile('b.png', png * 2, content_type='image/png')],
+            }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertEqual(os.listdir(os.path.join(settings.MEDIA_ROOT, 'tmp')), [])
+
+        with mock.patch('pereval.views.Image.objects.create', side_effect=RuntimeError('сбой базы')), \
+                self.captureOnCommitCallbacks(execute=True), self.assertRaises(RuntimeError):
+            self.client.post(self.url, data=png, content_type='image/png')
+        self.assertEqual(os.listdir(os.path.join(settings.MEDIA_ROOT, 'tmp')), [])
+        self.assertFalse(os.path.exists(os.path.join(settings.MEDIA_ROOT, 'blobs')))
+
+    def test_identical_files_stored_once(self):
+        """Одинаковые файлы хранятся один раз, файл удаляется вместе с последней ссылкой"""
+        import os
+        from django.conf import settings
+        from .models import ImageBlob
+
+        png = self.make_png()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url, data=png, content_type='image/png')
+            self.client.post(self.url, data=png, content_type='image/png')
+
+        blob = ImageBlob.objects.get()
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual(blob.width, 40)
+        first, second = self.pereval.images.all()
+        self.assertEqual(first.file_path, second.file_path)
+        self.assertEqual(second.width, 40)
+        blob_file = os.path.join(settings.MEDIA_ROOT, blob.path)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 1)
+        self.assertTrue(os.path.exists(blob_file))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(ImageBlob.objects.exists())
+        self.assertFalse(os.path.exists(blob_file))
+
+    def test_blob_served_immutable(self):
+        """Файл из хранилища отдаётся с неизменяемыми заголовками кэширования"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url, data=self.make_png(), content_type='image/png')
+        image = self.pereval.images.get()
+
+        response = self.client.get(image.file_path)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['Content-Type'], 'image/png')
+
+        response = self.client.get(image.file_path, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(self.client.get('/media/blobs/../secret').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_patch_keeps_uploaded_files(self):
+        """PATCH с прежним списком изображений не удаляет загруженный файл"""
+        import os
+        from django.conf import settings
+        from .models import ImageBlob
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url + '?title=Вид', data=self.make_png(), content_type='image/png')
+        image = self.pereval.images.get()
+        blob_file = os.path.join(settings.MEDIA_ROOT, image.blob.path)
+
+        update_url = reverse('submit-data-update', kwargs={'pk': self.pereval.pk})
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(update_url, {'images': [
+                {'file_path': image.file_path, 'title': 'Вид с седловины'},
+                {'file_path': image.file_path, 'title': 'Копия'},
+            ]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        kept, copy = self.pereval.images.order_by('id')
+        self.assertEqual((kept.pk, kept.title), (image.pk, 'Вид с седловины'))
+        self.assertEqual(copy.blob_id, image.blob_id)
+        self.assertEqual(ImageBlob.objects.get().ref_count, 2)
+        self.assertTrue(os.path.exists(blob_file))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(update_url, {'images': [{'file_path': image.file_path, 'title': 'Копия'}]},
+                              format='json')
+        self.assertEqual(ImageBlob.objects.get().ref_count, 1)
+        self.assertTrue(os.path.exists(blob_file))
+
+    def test_blob_file_not_stored_on_rollback(self):
+        """Файл переносится в хранилище только после фиксации транзакции"""
+        import os
+        from django.conf import settings
+        from django.db import transaction
+        from .uploads import ImageWriter, store_blob
+
+        writer = ImageWriter('image/png')
+        writer.write(self.make_png())
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                blob, created = store_blob(writer)
+                transaction.set_rollback(True)
+
+        self.assertTrue(created)
+        self.assertFalse(os.path.exists(os.path.join(settings.MEDIA_ROOT, blob.path)))
+        writer.abort()
+        self.assertFalse(os.path.exists(writer.temp_path))
+
+    def test_blob_deleted_concurrently(self):
+        """Если blob удалили между get_or_create и увеличением счётчика, он создаётся заново"""
+        import os
+        from unittest import mock
+        from django.conf import settings
+        from . import uploads
+        from .models import ImageBlob
+        from .uploads import ImageWriter, store_blob
+
+        png = self.make_png()
+        first = ImageWriter('image/png')
+        first.write(png)
+        with self.captureOnCommitCallbacks(execute=True):
+            old_blob, _ = store_blob(first)
+
+        add_reference = uploads.add_reference
+
+        def released_meanwhile(blob):
+            # Параллельный release_blob удалил последнюю ссылку до увеличения счётчика
+            if blob.pk == old_blob.pk:
+                ImageBlob.objects.filter(pk=blob.pk).delete()
+                return False
+            return add_reference(blob)
+
+        second = ImageWriter('image/png')
+        second.write(png)
+        with mock.patch('pereval.uploads.add_reference', side_effect=released_meanwhile):
+            with self.captureOnCommitCallbacks(execute=True):
+                blob, created = store_blob(second)
+
+        self.assertTrue(created)
+        self.assertNotEqual(blob.pk, old_blob.pk)
+        self.assertEqual(ImageBlob.objects.get().ref_count, 1)
+        self.assertTrue(os.path.exists(os.path.join(settings.MEDIA_ROOT, blob.path)))
+
+
+class DuplicateDetectionTest(TestCase):
+    """Тесты поиска возможных дублей перевала"""
+
+    def setUp(self):
+        self.user = User.objects.create(email='dup@example.com', last_name='Дубль',
+                                        first_name='Денис', phone='+79990000006')
+        self.existing = self.create_pereval('Перевал Дятлова', 61.7531, 59.4522)
+
+    def create_pereval(self, title, latitude, longitude, other_titles=''):
+        return Pereval.objects.create(
+            title=title,
+            other_titles=other_titles,
+            user=self.user,
+            coords=Coords.objects.create(latitude=latitude, longitude=longitude, height=1100),
+            level=Level.objects.create(summer='1A'),
+        )
+
+    def test_grid_cell_set_on_save(self):
+        """Ячейка сетки вычисляется при сохранении координат"""
+        from .geo import grid_cell_for
+
+        self.assertEqual(self.existing.coords.grid_cell, grid_cell_for(61.7531, 59.4522))
+
+    def test_similarity(self):
+        """Похожесть названий по триграммам"""
+        from .duplicates import similarity
+
+        self.assertEqual(similarity('Дятлова', 'дятлова'), 1.0)
+        self.assertGreater(similarity('Перевал Дятлова', 'пер. Дятлова'), 0.4)
+        self.assertLess(similarity('Перевал Дятлова', 'Кара-Тюрек'), 0.1)
+
+    def test_nearby_similar_title_flagged(self):
+        """Близкий перевал с похожим названием отмечается как возможный дубль"""
+        from .duplicates import find_duplicates, flag_duplicates
+        from .models import DuplicateCandidate
+
+        near = self.create_pereval('пер. Дятлова', 61.7560, 59.4530)
+        far = self.create_pereval('Перевал Дятлова', 62.5, 59.4522)
+        other = self.create_pereval('Кара-Тюрек', 61.7532, 59.4523)
+
+        self.assertEqual(flag_duplicates(near), 1)
+        candidate = DuplicateCandidate.objects.get(pereval=near)
+        self.assertEqual(candidate.duplicate_of, self.existing)
+        self.assertLess(candidate.distance_m, 1000)
+        self.assertEqual([found for found, _, _ in find_duplicates(far)], [])
+        self.assertEqual(find_duplicates(other), [])
+
+    def test_flagged_on_submit(self):
+        """POST /submitData/ отмечает дубль, ответ не меняется"""
+        from .models import DuplicateCandidate
+
+        response = APIClient().post(reverse('submit-data'), {
+            'beauty_title': 'пер.',
+            'title': 'Дятлова',
+            'user': {'email': 'dup@example.com', 'last_name': 'Дубль', 'first_name': 'Денис',
+                     'phone': '+79990000006'},
+            'coords': {'latitude': 61.7535, 'longitude': 59.4525, 'height': 1100},
+            'level': {'summer': '1A'},
+            'images': [],
+        }, format='json')
+
+        self.assertEqual(response.data['status'], 200)
+        self.assertTrue(DuplicateCandidate.objects.filter(pereval_id=response.data['id'],
+                                                          duplicate_of=self.existing).exists())
+
+
+class TileClusterTest(TestCase):
+    """Тесты пирамиды кластеров карты"""
+
+    def setUp(self):
+        self.user = User.objects.create(email='map@example.com', last_name='Карта',
+                                        first_name='Кира', phone='+79990000007')
+
+    def create_pereval(self, latitude, longitude, height, status='new'):
+        return Pereval.objects.create(
+            title='Перевал на карте',
+            status=status,
+            user=self.user,
+            coords=Coords.objects.create(latitude=latitude, longitude=longitude, height=height),
+            level=Level.objects.create(summer='1A'),
+        )
+
+    def snapshot(self):
+        from .models import TileCluster
+
+        return {
+            (c.zoom, c.x, c.y): (c.count, round(c.latitude_sum, 6), round(c.longitude_sum, 6), c.max_height)
+            for c in TileCluster.objects.all()
+        }
+
+    def test_world_tile_aggregates_all_passes(self):
+        """На нулевом масштабе все перевалы района собраны в один кластер"""
+        from .tiles import apply_deltas, tile_clusters
+
+        self.create_pereval(43.30, 42.50, 3200)
+        self.create_pereval(43.40, 42.60, 3800)
+        self.create_pereval(43.35, 42.55, 3500, status='rejected')
+        apply_deltas()
+
+        clusters = tile_clusters(0, 0, 0)
+        self.assertEqual(len(clusters), 1)
+        self.assertEqual(clusters[0]['count'], 2)
+        self.assertAlmostEqual(clusters[0]['latitude'], 43.35)
+        self.assertEqual(clusters[0]['max_height'], 3800)
+
+    def test_incremental_updates_match_rebuild(self):
+        """Правка, модерация и удаление дают ту же пирамиду, что и полный пересчёт"""
+        from .tiles import apply_deltas, rebuild
+
+        first = self.create_pereval(43.30, 42.50, 3200)
+        second = self.create_pereval(43.40, 42.60, 3800)
+        third = self.create_pereval(61.75, 59.45, 1100)
+
+        second.coords.latitude = 43.10
+        second.coords.height = 3000
+        second.coords.save()
+        first.status = 'rejected'
+        first.save()
+        third.delete()
+
+        apply_deltas(batch_size=2)
+        incremental = self.snapshot()
+        rebuild()
+        self.assertEqual(incremental, self.snapshot())
+        self.assertEqual(incremental[(0, 4, 2)][3], 3000)
+
+    def test_changes_buffered_and_applied_in_batches(self):
+        """Заявка записывает одну строку изменения; пачка обновляет каждую ячейку один раз"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .models import TileCluster, TileDelta
+        from .tiles import apply_deltas
+
+        with CaptureQueriesContext(connection) as queries:
+            self.create_pereval(43.30, 42.50, 3200)
+        self.assertFalse(any('pereval_tile_cluster' in query['sql'] for query in queries))
+        self.assertEqual(TileDelta.objects.count(), 1)
+
+        for index in range(1, 10):
+            self.create_pereval(43.30 + index / 1000, 42.50, 3200 + index)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(apply_deltas(), 10)
+        updates = [query for query in queries if query['sql'].startswith('UPDATE "pereval_tile_cluster"')]
+        self.assertLessEqual(len(updates), TileCluster.objects.count())
+        self.assertFalse(TileDelta.objects.exists())
+        world = TileCluster.objects.get(zoom=0)
+        self.assertEqual((world.count, world.max_height), (10, 3209))
+
+    def test_read_does_not_apply_buffer(self):
+        """Чтение тайла не разбирает буфер; переполненный буфер разбирает запись после фиксации"""
+        from django.test import override_settings
+        from .models import TileDelta
+        from .tiles import tile_clusters
+
+        self.create_pereval(43.30, 42.50, 3200)
+        self.assertEqual(tile_clusters(0, 0, 0), [])
+        self.assertEqual(TileDelta.objects.count(), 1)
+
+        with override_settings(TILE_DELTA_MAX=2):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.create_pereval(43.40, 42.60, 3800)
+            self.assertEqual(TileDelta.objects.count(), 2)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.create_pereval(43.35, 42.55, 3500)
+
+        self.assertFalse(TileDelta.objects.exists())
+        self.assertEqual(tile_clusters(0, 0, 0)[0]['count'], 3)
+
+    def test_apply_command(self):
+        """manage.py apply_tile_deltas --once переносит накопленные изменения"""
+        import io
+        from django.core.management import call_command
+        from .models import TileDelta
+
+        self.create_pereval(43.30, 42.50, 3200)
+        out = io.StringIO()
+        call_command('apply_tile_deltas', '--once', stdout=out)
+        self.assertIn('1', out.getvalue())
+        self.assertFalse(TileDelta.objects.exists())
+
+    def test_tile_endpoint(self):
+        """GET /submitData/tiles/z/x/y возвращает кластеры, на крупном масштабе - перевалы"""
+        from .tiles import apply_deltas, cell_for
+
+        pereval = self.create_pereval(43.30, 42.50, 3200)
+        apply_deltas()
+        client = APIClient()
+
+        response = client.get(reverse('submit-data-tiles', kwargs={'z': 0, 'x': 0, 'y': 0}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['clusters'][0]['count'], 1)
+        self.assertIn('max-age', response['Cache-Control'])
+
+        x, y = cell_for(43.30, 42.50, 16)
+        response = client.get(reverse('submit-data-tiles', kwargs={'z': 16, 'x': x, 'y': y}))
+        self.assertEqual(response.data['clusters'][0]['id'], pereval.id)
+
+        response = client.get(reverse('submit-data-tiles', kwargs={'z': 1, 'x': 2, 'y': 0}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class AnalyticsSnapshotTest(TestCase):
+    """Тесты колоночного снимка для аналитики"""
+
+    def setUp(self):
+        import shutil
+        import tempfile
+        from django.test import override_settings
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings_override = override_settings(SNAPSHOT_DIR=directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        user = User.objects.create(email='stats@example.com', last_name='Стат',
+                                   first_name='Сергей', phone='+79990000008')
+        for latitude, height, status_code, summer in ((43.3, 3200, 'new', '1A'), (43.4, 3800, 'accepted', '2B'),
+                                                      (61.7, 1100, 'accepted', '1A')):
+            Pereval.objects.create(
+                title='Перевал', status=status_code, user=user,
+                coords=Coords.objects.create(latitude=latitude, longitude=42.5, height=height),
+                level=Level.objects.create(summer=summer),
+            )
+        self.url = reverse('submit-data-analytics')
+
+    def test_unavailable_before_export(self):
+        """До выгрузки снимка аналитика недоступна"""
+        response = APIClient().get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    def test_aggregates_without_database(self):
+        """Фильтры и группировка считаются по снимку без запросов к базе"""
+        from .snapshot import export
+
+        version, rows = export()
+        self.assertEqual(rows, 3)
+        Pereval.objects.all().delete()
+
+        client = APIClient()
+        with self.assertNumQueries(0):
+            response = client.get(self.url, {'lat_min': 43, 'lat_max': 44, 'group_by': 'level_summer'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['snapshot']['version'], version)
+        self.assertEqual(response.data['total']['count'], 2)
+        self.assertEqual(response.data['total']['height_max'], 3800)
+        self.assertEqual([(g['value'], g['count']) for g in response.data['groups']], [('1A', 1), ('2B', 1)])
+
+        response = client.get(self.url, {'status': 'accepted', 'height_bins': 2})
+        self.assertEqual(response.data['total']['count'], 2)
+        self.assertEqual(response.data['height_histogram']['counts'], [1, 1])
+
+        response = client.get(self.url, {'group_by': 'title'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_new_export_replaces_current(self):
+        """Новая выгрузка подменяет снимок, старые версии удаляются"""
+        import os
+        from django.conf import settings
+        from .snapshot import current, export
+
+        first, _ = export()
+        self.assertEqual(current().meta['version'], first)
+        Pereval.objects.filter(status='new').delete()
+        export()
+        third, rows = export()
+        self.assertEqual(current().rows, rows)
+        self.assertEqual(current().meta['version'], third)
+        self.assertNotIn(first, os.listdir(settings.SNAPSHOT_DIR))
+
+
+@unittest.skipUnless(os.getenv('FSTR_TEST_DB_DSN'), 'нужен PostgreSQL: FSTR_TEST_DB_DSN=postgresql://...')
+class AsyncPerevalDatabaseTest(unittest.IsolatedAsyncioTestCase):
+    """Тесты асинхронного клиента на локальном PostgreSQL (таблицы создаются во временной схеме)"""
+
+    SCHEMA = '''
+        CREATE TABLE users (id serial PRIMARY KEY, email text UNIQUE NOT NULL, phone text,
+                            last_name text, first_name text, middle_name text);
+        CREATE TABLE coords (id serial PRIMARY KEY, latitude double precision,
+                             longitude double precision, height integer);
+        CREATE TABLE pereval_levels (id serial PRIMARY KEY, winter text, summer text, autumn text, spring text);
+        CREATE TABLE pereval_added (id serial PRIMARY KEY, beauty_title text, title text, other_titles text,
+                                    connect text, add_time timestamp, user_id integer REFERENCES users,
+                                    coord_id integer REFERENCES coords, level_id integer REFERENCES pereval_levels,
+                                    area_id integer, activity_type text, status text);
+        CREATE TABLE pereval_images (id serial PRIMARY KEY, title text, file_path text, file_size integer,
+                                     file_type text, width integer, height integer,
+                                     uploaded_by integer REFERENCES users);
+        CREATE TABLE pereval_images_links (pereval_id integer REFERENCES pereval_added,
+                                           image_id integer REFERENCES pereval_images);
+    '''
+
+    async def asyncSetUp(self):
+        import asyncpg
+        from AsyncPerevalDatabase import AsyncPerevalDatabase
+
+        dsn = os.getenv('FSTR_TEST_DB_DSN')
+        self.schema = f'pereval_test_{os.getpid()}'
+        self.admin = await asyncpg.connect(dsn)
+        await self.admin.execute(f'CREATE SCHEMA {self.schema}; SET search_path TO {self.schema};' + self.SCHEMA)
+        AsyncPerevalDatabase.user_cache.clear()
+        self.db = AsyncPerevalDatabase(dsn=dsn, pool_size=4, server_settings={'search_path': self.schema})
+        await self.db.connect()
+
+    async def asyncTearDown(self):
+        await self.db.disconnect()
+        await self.admin.execute(f'DROP SCHEMA {self.schema} CASCADE')
+        await self.admin.close()
+
+    def record(self, index, images=2):
+        return {
+            'beautyTitle': 'пер. ',
+            'title': f'Перевал {index}',
+            'other_titles': '',
+            'connect': '',
+            'add_time': '2021-09-22 13:18:13',
+            'user': {'email': f'user{index % 3}@example.com', 'fam': 'Пупкин', 'name': 'Василий',
+                     'otc': 'Иванович', 'phone': '+7 555 55 55'},
+            'coords': {'latitude': 45.3842, 'longitude': 7.1525, 'height': 1200},
+            'level': {'winter': '', 'summer': '1А', 'autumn': '1А', 'spring': ''},
+            'images': [{'title': f'Фото {n}', 'file_path': f'/images/{index}_{n}.jpg'} for n in range(images)],
+        }
+
+    async def test_submit_data(self):
+        """Перевал записывается вместе с изображениями и связями"""
+        pereval_id = await self.db.submit_data(self.record(1))
+
+        self.assertIsNotNone(pereval_id)
+        links = await self.admin.fetchval(
+            f'SELECT count(*) FROM {self.schema}.pereval_images_links WHERE pereval_id = $1', pereval_id)
+        self.assertEqual(links, 2)
+
+    async def test_submit_many(self):
+        """submit_many возвращает id в порядке записей, ошибочные записи дают None"""
+        records = [self.record(index) for index in range(20)]
+        records[5] = {'user': {'email': 'broken@example.com'}}
+
+        ids = await self.db.submit_many(records, concurrency=4)
+
+        self.assertEqual(len(ids), 20)
+        self.assertIsNone(ids[5])
+        self.assertEqual(len(set(ids) - {None}), 19)
+        users = await self.admin.fetchval(f'SELECT count(*) FROM {self.schema}.users')
+        self.assertEqual(users, 3)
+
+    async def test_submit_string_coords(self):
+        """Координаты и высота строками (старые заявки) приводятся к числам"""
+        record = self.record(1)
+        record['coords'] = {'latitude': '45.3842', 'longitude': '7.1525', 'height': '1200'}
+
+        pereval_id = await self.db.submit_data(record)
+
+        self.assertIsNotNone(pereval_id)
+        height = await self.admin.fetchval(
+            f'SELECT c.height FROM {self.schema}.pereval_added p '
+            f'JOIN {self.schema}.coords c ON c.id = p.coord_id WHERE p.id = $1', pereval_id)
+        self.assertEqual(height, 1200)
+
+
+class AsyncSubmitParamsTest(unittest.TestCase):
+    """Тесты параметров асинхронного клиента (без PostgreSQL)"""
+
+    def test_coerce_string_params(self):
+        """Строковые координаты, высота и время приводятся к типам столбцов"""
+        from datetime import datetime
+        from AsyncPerevalDatabase import coerce_params
+        from PerevalDatabase import submit_params
+
+        _, params = submit_params({
+            'add_time': '2021-09-22 13:18:13', 'area_id': '3',
+            'coords': {'latitude': '45.3842', 'longitude': 7.1525, 'height': '1200'},
+            'level': {}, 'images': [],
+        })
+        coerce_params(params)
+
+        self.assertEqual(params[:3], [45.3842, 7.1525, 1200])
+        self.assertEqual(params[11], datetime(2021, 9, 22, 13, 18, 13))
+        self.assertEqual(params[12], 3)
+
+    def test_user_cache_keyed_by_database(self):
+        """id пользователя, закэшированный для одной базы, не используется для другой"""
+        import asyncio
+        from contextlib import asynccontextmanager
+        from unittest import mock
+        from AsyncPerevalDatabase import (
+            ASYNC_SUBMIT_KNOWN_USER_QUERY, ASYNC_SUBMIT_QUERY, AsyncPerevalDatabase,
+        )
+
+        AsyncPerevalDatabase.user_cache.clear()
+        self.addCleanup(AsyncPerevalDatabase.user_cache.clear)
+        record = {'user': {'email': 'cache@example.com'}, 'coords': {'latitude': 45.0, 'longitude': 7.0},
+                  'level': {}, 'images': []}
+
+        def client(dsn):
+            conn = mock.Mock(fetchrow=mock.AsyncMock(return_value={'id': 1, 'user_id': 7}))
+
+            @asynccontextmanager
+            async def acquire():
+                yield conn
+
+            db = AsyncPerevalDatabase(dsn=dsn)
+            db.pool = mock.Mock(acquire=acquire)
+            return db, conn
+
+        async def submit_twice():
+            first, first_conn = client('postgresql://localhost/first')
+            second, second_conn = client('postgresql://localhost/second')
+            await first.submit_data(record)
+            await first.submit_data(record)
+            await second.submit_data(record)
+            return first_conn, second_conn
+
+        first_conn, second_conn = asyncio.run(submit_twice())
+        self.assertEqual([call.args[0] for call in first_conn.fetchrow.call_args_list],
+                         [ASYNC_SUBMIT_QUERY, ASYNC_SUBMIT_KNOWN_USER_QUERY])
+        self.assertEqual(second_conn.fetchrow.call_args.args[0], ASYNC_SUBMIT_QUERY)
+
+
+class PerevalDatabaseReadTest(unittest.TestCase):
+    """Тесты методов чтения PerevalDatabase (соединение подменяется, PostgreSQL не нужен)"""
+
+    def setUp(self):
+        from unittest import mock
+        from PerevalDatabase import PerevalDatabase
+
+        self.db = PerevalDatabase()
+        self.cursor = mock.MagicMock()
+        self.cursor.__enter__.return_value = self.cursor
+        self.cursor.__iter__.return_value = iter([{'id': 1}, {'id': 2}])
+        self.conn = mock.Mock()
+        self.conn.cursor.return_value = self.cursor
+        patcher = mock.patch.object(PerevalDatabase, '_open_connection', return_value=self.conn)
+        self.open_connection = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def executed(self):
+        """Текст запроса (без подстановки параметров) и параметры"""
+        query, params = self.cursor.execute.call_args.args
+        return query.as_string(None), params
+
+    def test_without_filters(self):
+        """Без фильтров - все перевалы по порядку id, строки читаются серверным курсором"""
+        rows = list(self.db.iter_passes(itersize=50))
+
+        self.assertEqual(rows, [{'id': 1}, {'id': 2}])
+        query, params = self.executed()
+        self.assertNotIn('WHERE', query)
+        self.assertTrue(query.endswith(' ORDER BY p.id'))
+        self.assertEqual(params, [])
+        self.assertTrue(self.conn.cursor.call_args.kwargs['name'].startswith('pereval_read_'))
+        self.assertEqual(self.cursor.itersize, 50)
+        self.conn.rollback.assert_called_once()
+        self.conn.close.assert_called_once()
+
+    def test_filter_combinations(self):
+        """Условия WHERE и параметры идут в одном порядке для любых сочетаний фильтров"""
+        from datetime import datetime
+
+        since = datetime(2024, 1, 1)
+        list(self.db.iter_passes(status='accepted', since=since))
+        query, params = self.executed()
+        self.assertIn(' WHERE p.status = %s AND p.add_time >= %s ORDER BY p.id', query)
+        self.assertEqual(params, ['accepted', since])
+
+        list(self.db.iter_passes(status='new', user_email='a@example.com', since=since))
+        query, params = self.executed()
+        self.assertIn(' WHERE p.status = %s AND u.email = %s AND p.add_time >= %s ORDER BY', query)
+        self.assertEqual(params, ['new', 'a@example.com', since])
+        self.assertEqual(query.count('%s'), len(params))
+
+    def test_row_formats(self):
+        """Формат строк выбирает класс курсора, неизвестный формат отклоняется до соединения"""
+        from PerevalDatabase import ROW_FORMATS
+
+        list(self.db.iter_passes(row_format='record'))
+        self.assertIs(self.conn.cursor.call_args.kwargs['cursor_factory'], ROW_FORMATS['record'])
+
+        self.open_connection.reset_mock()
+        with self.assertRaises(ValueError):
+            list(self.db.iter_passes(row_format='xml'))
+        self.open_connection.assert_not_called()
+
+    def test_iter_wrappers(self):
+        """iter_by_status, iter_by_user и iter_since задают свой фильтр и передают остальные параметры"""
+        from datetime import datetime
+
+        list(self.db.iter_by_status('pending', itersize=10))
+        self.assertEqual(self.executed()[1], ['pending'])
+        self.assertEqual(self.cursor.itersize, 10)
+
+        list(self.db.iter_by_user('b@example.com'))
+        query, params = self.executed()
+        self.assertIn('WHERE u.email = %s', query)
+        self.assertEqual(params, ['b@example.com'])
+
+        since = datetime(2023, 5, 1)
+        list(self.db.iter_since(since, row_format='tuple'))
+        query, params = self.executed()
+        self.assertIn('WHERE p.add_time >= %s', query)
+        self.assertEqual(params, [since])
+
+    def test_connection_closed_on_error(self):
+        """Соединение закрывается и при ошибке запроса"""
+        self.cursor.execute.side_effect = RuntimeError('нет связи')
+
+        with self.assertRaises(RuntimeError):
+            list(self.db.iter_passes())
+        self.conn.close.assert_called_once()
+
+
+class PerevalDatabaseSubmitTest(unittest.TestCase):
+    """Тесты параметров записи PerevalDatabase (курсор подменяется, PostgreSQL не нужен)"""
+
+    record = {
+        'beautyTitle': 'пер. ', 'title': 'Пхия', 'other_titles': 'Триев', 'connect': '',
+        'add_time': '2021-09-22 13:18:13', 'area_id': 3, 'activity_type': 'пеший',
+        'user': {'email': 'qwerty@mail.ru', 'fam': 'Пупкин', 'name': 'Василий', 'otc': 'Иванович',
+                 'phone': '+7 555 55 55'},
+        'coords': {'latitude': 45.3842, 'longitude': 7.1525, 'height': 1200},
+        'level': {'winter': '', 'summer': '1А', 'autumn': '1А', 'spring': ''},
+        'images': [{'title': 'Седловина', 'file_path': '/images/1.jpg'}],
+    }
+
+    def test_numbered_params(self):
+        """%s нумеруются по порядку, остальной текст не меняется"""
+        from PerevalDatabase import numbered_params
+
+        self.assertEqual(numbered_params('SELECT %s, %s WHERE x = %s'), 'SELECT $1, $2 WHERE x = $3')
+        self.assertEqual(numbered_params('SELECT 1'), 'SELECT 1')
+
+    def test_submit_params_match_queries(self):
+        """Число и порядок параметров совпадают с %s в SUBMIT_QUERY и SUBMIT_KNOWN_USER_QUERY"""
+        from PerevalDatabase import SUBMIT_KNOWN_USER_QUERY, SUBMIT_QUERY, numbered_params, submit_params
+
+        fields, params = submit_params(self.record)
+        self.assertEqual(fields, ('+7 555 55 55', 'Пупкин', 'Василий', 'Иванович'))
+        self.assertEqual(SUBMIT_QUERY.count('%s'), 1 + len(fields) + len(params))
+        self.assertEqual(SUBMIT_KNOWN_USER_QUERY.count('%s'), 1 + len(params))
+        self.assertIn(f'${1 + len(fields) + len(params)}', numbered_params(SUBMIT_QUERY))
+
+        self.assertEqual(params[:3], [45.3842, 7.1525, 1200])
+        self.assertEqual(params[3:7], ['', '1А', '1А', ''])
+        self.assertEqual(params[7:14], ['пер. ', 'Пхия', 'Триев', '', '2021-09-22 13:18:13', 3, 'пеший'])
+        self.assertEqual(json.loads(params[14]), [{
+            'title': 'Седловина', 'file_path': '/images/1.jpg',
+            'file_size': None, 'file_type': None, 'width': None, 'height': None,
+        }])
+        # Порядок столбцов в запросе: coords, уровни, перевал, изображения
+        self.assertLess(SUBMIT_QUERY.index('INSERT INTO coords'), SUBMIT_QUERY.index('INSERT INTO pereval_levels'))
+        self.assertLess(SUBMIT_QUERY.index('INSERT INTO pereval_levels'), SUBMIT_QUERY.index('INSERT INTO pereval_added'))
+
+    def make_db(self, use_prepared=True):
+        from unittest import mock
+        from PerevalDatabase import PerevalDatabase
+
+        db = PerevalDatabase()
+        db.use_prepared = use_prepared
+        db.cursor = mock.Mock()
+        return db
+
+    def test_prepare_once_per_connection(self):
+        """PREPARE выполняется один раз на соединение, дальше только EXECUTE"""
+        import io
+        from contextlib import redirect_stdout
+        from unittest import mock
+        from PerevalDatabase import PerevalDatabase
+
+        db = self.make_db()
+        for params in ([1, 2], [3, 4]):
+            db._execute_prepared('pereval_submit', 'SELECT %s, %s', params)
+        statements = [repr(call.args[0]) for call in db.cursor.execute.call_args_list]
+        self.assertEqual(len(statements), 3)
+        self.assertIn("SQL('PREPARE ')", statements[0])
+        self.assertIn("SQL('SELECT $1, $2')", statements[0])
+        self.assertTrue(all("SQL('EXECUTE ')" in statement for statement in statements[1:]))
+        self.assertEqual(db.cursor.execute.call_args.args[1], [3, 4])
+
+        # Новое соединение - операторы подготавливаются заново
+        with mock.patch.object(PerevalDatabase, '_open_connection'), redirect_stdout(io.StringIO()):
+            db.connect()
+        db._execute_prepared('pereval_submit', 'SELECT %s, %s', [5, 6])
+        self.assertIn("SQL('PREPARE ')", repr(db.cursor.execute.call_args_list[0].args[0]))
+
+    def test_without_prepared_statements(self):
+        """FSTR_DB_PREPARE=False: запрос выполняется напрямую (PgBouncer в режиме transaction)"""
+        db = self.make_db(use_prepared=False)
+        db._execute_prepared('pereval_submit', 'SELECT %s', [1])
+        db.cursor.execute.assert_called_once_with('SELECT %s', [1])
+
+    def test_user_cache_per_database(self):
+        """id пользователя из кэша одной базы не используется для другой"""
+        from unittest import mock
+        from PerevalDatabase import PerevalDatabase, SUBMIT_KNOWN_USER_QUERY, SUBMIT_QUERY
+
+        PerevalDatabase.user_cache.clear()
+        self.addCleanup(PerevalDatabase.user_cache.clear)
+        queries = []
+        for host in ('db-a', 'db-a', 'db-b'):
+            db = self.make_db(use_prepared=False)
+            db.db_host = host
+            db.conn = mock.Mock(closed=False)
+            db.cursor.fetchone.return_value = {'user_id': 7, 'id': 1}
+            db.submit_data(self.record)
+            queries.append(db.cursor.execute.call_args.args[0])
+
+        self.assertEqual(queries, [SUBMIT_QUERY, SUBMIT_KNOWN_USER_QUERY, SUBMIT_QUERY])
+
+
+class ModerationAdminTest(TestCase):
+    """Тесты админки модерации"""
+
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+
+        admin_user = get_user_model().objects.create_superuser('moderator', 'moderator@example.com', 'password')
+        self.client.force_login(admin_user)
+        user = User.objects.create(email='admin@example.com', last_name='Адм',
+                                   first_name='Анна', phone='+79990000009')
+        self.perevals = [
+            Pereval.objects.create(
+                title=f'Перевал {index}', user=user,
+                coords=Coords.objects.create(latitude=43.0 + index / 100, longitude=42.0, height=3000 + index),
+                level=Level.objects.create(summer='1A'),
+            )
+            for index in range(3)
+        ]
+        Image.objects.create(pereval=self.perevals[0], file_path='/media/a.jpg', title='Седловина')
+
+    def test_changelists(self):
+        """Списки перевалов, пользователей и изображений открываются"""
+        for name in ('pereval_pereval', 'pereval_user', 'pereval_image'):
+            response = self.client.get(reverse(f'admin:{name}_changelist'))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.get(reverse('admin:pereval_pereval_change', args=[self.perevals[0].pk]))
+        self.assertContains(response, '<img src="/media/a.jpg"')
+
+    def test_bulk_status_actions(self):
+        """Массовые действия меняют статус и убирают отклонённые перевалы с карты"""
+        from .tiles import apply_deltas, tile_clusters
+
+        response = self.client.post(reverse('admin:pereval_pereval_changelist'), {
+            'action': 'mark_rejected',
+            '_selected_action': [self.perevals[0].pk, self.perevals[1].pk],
+        })
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertEqual(Pereval.objects.filter(status='rejected').count(), 2)
+        apply_deltas()
+        self.assertEqual(tile_clusters(0, 0, 0)[0]['count'], 1)
+
+        self.client.post(reverse('admin:pereval_pereval_changelist'), {
+            'action': 'mark_accepted',
+            '_selected_action': [self.perevals[0].pk],
+        })
+        apply_deltas()
+        self.assertEqual(tile_clusters(0, 0, 0)[0]['count'], 2)
+
+    def test_paginator_exact_for_small_tables(self):
+        """Без статистики PostgreSQL число строк считается точно"""
+        from .admin import ApproximateCountPaginator
+
+        self.assertEqual(ApproximateCountPaginator(Pereval.objects.order_by('pk'), 2).count, 3)
+
+
+class ModerationQueueTest(TestCase):
+    """Тесты очереди модерации"""
+
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+
+        moderators = get_user_model().objects
+        self.first = moderators.create_user('first', 'first@example.com', 'password', is_staff=True)
+        self.second = moderators.create_user('second', 'second@example.com', 'password', is_staff=True)
+        user = User.objects.create(email='queue@example.com', last_name='Очередь',
+                                   first_name='Ольга', phone='+79990000010')
+        self.perevals = [
+            Pereval.objects.create(
+                title=f'Перевал {index}', user=user,
+                coords=Coords.objects.create(latitude=43.0, longitude=42.0 + index / 100, height=3000),
+                level=Level.objects.create(summer='1A'),
+            )
+            for index in range(5)
+        ]
+
+    def client_for(self, moderator):
+        client = APIClient()
+        client.force_authenticate(moderator)
+        return client
+
+    def test_moderators_get_different_passes(self):
+        """Модераторы получают разные перевалы, они переходят в pending"""
+        first = self.client_for(self.first).post(reverse('moderation-claim'), {'limit': 3}, format='json')
+        second = self.client_for(self.second).post(reverse('moderation-claim'), {'limit': 3}, format='json')
+
+        first_ids = {item['id'] for item in first.data['passes']}
+        second_ids = {item['id'] for item in second.data['passes']}
+        self.assertEqual(len(first_ids), 3)
+        self.assertEqual(len(second_ids), 2)
+        self.assertFalse(first_ids & second_ids)
+        self.assertEqual(Pereval.objects.filter(status='pending', moderator=self.first).count(), 3)
+        self.assertIn('lease_expires_at', first.data)
+
+    def test_expired_lease_reclaimed(self):
+        """Перевал с истёкшей арендой забирает другой модератор, первый уже не может его закрыть"""
+        from datetime import timedelta
+        from django.utils import timezone
+
+        self.client_for(self.first).post(reverse('moderation-claim'), {'limit': 5}, format='json')
+        abandoned = self.perevals[0]
+        Pereval.objects.filter(pk=abandoned.pk).update(claimed_at=timezone.now() - timedelta(hours=1))
+
+        response = self.client_for(self.second).post(reverse('moderation-claim'), {'limit': 5}, format='json')
+        self.assertEqual([item['id'] for item in response.data['passes']], [abandoned.pk])
+
+        url = reverse('moderation-resolve', kwargs={'pk': abandoned.pk})
+        response = self.client_for(self.first).post(url, {'status': 'accepted'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        response = self.client_for(self.second).post(url, {'status': 'rejected'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        abandoned.refresh_from_db()
+        self.assertEqual((abandoned.status, abandoned.moderator, abandoned.claimed_at),
+                         ('rejected', self.second, None))
+
+    def test_release_and_permissions(self):
+        """Возврат в очередь; без прав модератора очередь недоступна"""
+        client = self.client_for(self.first)
+        client.post(reverse('moderation-claim'), {'limit': 1}, format='json')
+        response = client.post(reverse('moderation-release', kwargs={'pk': self.perevals[0].pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(Pereval.objects.filter(status='pending').exists())
+
+        response = APIClient().post(reverse('moderation-claim'), {'limit': 1}, format='json')
+        self.assertIn(response.status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
+        response = client.post(reverse('moderation-claim'), {'limit': 1000}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RateLimitTest(TestCase):
+    """Тесты ограничения частоты запросов и сброса нагрузки"""
+
+    def setUp(self):
+        from . import ratelimit
+        ratelimit.reset()
+        self.addCleanup(ratelimit.reset)
+
+    def test_token_bucket(self):
+        """Ведро вмещает burst запросов и пополняется со скоростью rate"""
+        from .ratelimit import take_token
+
+        self.assertEqual([take_token('bucket', 2, 3, now=100.0) for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(take_token('bucket', 2, 3, now=100.0), 0.5)
+        self.assertEqual(take_token('bucket', 2, 3, now=100.5), 0)
+
+    def test_throttled_per_client(self):
+        """Превысивший лимит клиент получает 429 с Retry-After, другие клиенты - нет"""
+        from django.test import override_settings
+
+        url = reverse('submit-data-user-list')
+        greedy, polite = {'REMOTE_ADDR': '10.0.0.1'}, {'REMOTE_ADDR': '10.0.0.2'}
+        with override_settings(RATE_LIMIT_READ_RATE=0.1, RATE_LIMIT_READ_BURST=2):
+            statuses = [self.client.get(url, {'user__email': 'greedy@example.com'}, **greedy).status_code
+                        for _ in range(3)]
+            other = self.client.get(url, {'user__email': 'polite@example.com'}, **polite)
+            response = self.client.get(url, {'user__email': 'greedy@example.com'}, **greedy)
+
+        self.assertEqual(statuses, [404, 404, 429])
+        self.assertEqual(other.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertGreater(int(response['Retry-After']), 0)
+
+    def test_email_does_not_select_bucket(self):
+        """Смена email не обходит лимит, а чужой email не расходует ведро его владельца"""
+        from django.test import override_settings
+
+        url = reverse('submit-data-user-list')
+        with override_settings(RATE_LIMIT_READ_RATE=0.1, RATE_LIMIT_READ_BURST=2):
+            statuses = [self.client.get(url, {'user__email': f'user{index}@example.com'},
+                                        REMOTE_ADDR='10.0.0.1').status_code for index in range(3)]
+            owner = self.client.get(url, {'user__email': 'user0@example.com'}, REMOTE_ADDR='10.0.0.2')
+
+        self.assertEqual(statuses, [404, 404, 429])
+        self.assertEqual(owner.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_load_shedding(self):
+        """Когда все места для записи заняты, запрос сразу получает 503, чтение продолжает работать"""
+        from django.http import HttpResponse
+        from django.test import RequestFactory, override_settings
+        from django.urls import resolve
+        from .ratelimit import AdmissionControlMiddleware
+
+        with override_settings(ADMISSION_MAX_WRITES=1):
+            middleware = AdmissionControlMiddleware(lambda request: HttpResponse())
+        factory = RequestFactory()
+
+        def request(method, path):
+            request = getattr(factory, method)(path)
+            request.resolver_match = resolve(path)
+            return request
+
+        busy = request('post', '/submitData/')
+        self.assertIsNone(middleware.process_view(busy, None, (), {}))
+        rejected = middleware.process_view(request('post', '/submitData/'), None, (), {})
+        self.assertEqual(rejected.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertIn('Retry-After', rejected)
+        self.assertIsNone(middleware.process_view(request('get', '/submitData/user/'), None, (), {}))
+
+        middleware(busy)  # ответ отдан - место освобождается
+        self.assertIsNone(middleware.process_view(request('post', '/submitData/'), None, (), {}))
+
+
+class PublishedDocumentTest(TestCase):
+    """Тесты готовых документов опубликованных перевалов"""
+
+    def setUp(self):
+        self.user = User.objects.create(email='doc@example.com', last_name='Документ',
+                                        first_name='Дина', phone='+79990000011')
+        self.pereval = Pereval.objects.create(
+            title='Опубликованный', user=self.user,
+            coords=Coords.objects.create(latitude=43.0, longitude=42.0, height=3000),
+            level=Level.objects.create(summer='1A'),
+        )
+        Image.objects.create(pereval=self.pereval, file_path='/media/a.jpg', title='Седловина')
+        self.draft = Pereval.objects.create(
+            title='Черновик', user=self.user,
+            coords=Coords.objects.create(latitude=43.1, longitude=42.1, height=3100),
+            level=Level.objects.create(summer='1B'),
+        )
+
+    def accept(self):
+        from .moderation import set_status
+        set_status(Pereval.objects.filter(pk=self.pereval.pk), 'accepted')
+
+    def test_document_served_on_accept(self):
+        """После принятия перевал отдаётся готовым документом одним запросом"""
+        from .models import PerevalDocument
+
+        self.assertFalse(PerevalDocument.objects.exists())
+        self.accept()
+
+        url = reverse('submit-data-detail', kwargs={'pk': self.pereval.pk})
+        with self.assertNumQueries(1):
+            response = APIClient().get(url)
+        self.assertEqual(response.data['status'], 'accepted')
+        self.assertEqual(response.data['images'][0]['title'], 'Седловина')
+        self.assertEqual(response.data['user']['email'], 'doc@example.com')
+
+    def test_document_refreshed_on_edits(self):
+        """Правки координат, изображений и пользователя обновляют документ, отклонение удаляет"""
+        from .models import PerevalDocument
+        from .read_model import get_document
+
+        self.accept()
+        self.pereval.coords.height = 3333
+        self.pereval.coords.save()
+        Image.objects.create(pereval=self.pereval, file_path='/media/b.jpg', title='Подъём')
+        self.user.phone = '+79990000000'
+        self.user.save()
+
+        document = get_document(self.pereval.pk)
+        self.assertEqual(document['coords']['height'], 3333)
+        self.assertEqual(len(document['images']), 2)
+        self.assertEqual(document['user']['phone'], '+79990000000')
+
+        self.pereval.status = 'rejected'
+        self.pereval.save()
+        self.assertFalse(PerevalDocument.objects.exists())
+
+    def test_user_list_and_delete(self):
+        """Список пользователя объединяет документы и обычные перевалы; удаление перевала работает"""
+        self.accept()
+        response = APIClient().get(reverse('submit-data-user-list'), {'user__email': 'doc@example.com'})
+        self.assertEqual([item['title'] for item in response.data], ['Опубликованный', 'Черновик'])
+
+        self.pereval.delete()
+        self.assertFalse(Pereval.objects.filter(pk=self.pereval.pk).exists())
+
+
+class ChangeEventTest(TestCase):
+    """Тесты событий изменений и журнала событий"""
+
+    def setUp(self):
+        import shutil
+        import tempfile
+        from django.contrib.auth import get_user_model
+        from django.test import override_settings
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings_override = override_settings(EVENT_LOG_DIR=directory, EVENT_LOG_SEGMENT_BYTES=300)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user('reader', is_staff=True))
+        user = User.objects.create(email='events@example.com', last_name='Событие',
+                                   first_name='Егор', phone='+79990000012')
+        self.pereval = Pereval.objects.create(
+            title='Перевал', user=user,
+            coords=Coords.objects.create(latitude=43.0, longitude=42.0, height=3000),
+            level=Level.objects.create(summer='1A'),
+        )
+
+    def test_changes_recorded_in_outbox(self):
+        """Создание, изменения, смена статуса и удаление попадают в outbox"""
+        from .models import ChangeEvent
+        from .moderation import set_status
+
+        image = Image.objects.create(pereval=self.pereval, file_path='/media/a.jpg', title='Вид')
+        image.delete()
+        set_status(Pereval.objects.filter(pk=self.pereval.pk), 'accepted')
+        pereval_id = self.pereval.pk
+        self.pereval.delete()
+
+        types = [f'{entity}.{action}' for entity, action in ChangeEvent.objects.order_by('id')
+                 .filter(pereval_id=pereval_id).values_list('entity', 'action')]
+        self.assertEqual(types, ['pereval.created', 'image.created', 'image.deleted',
+                                 'pereval.status', 'pereval.deleted'])
+        event = ChangeEvent.objects.get(action='status')
+        self.assertEqual((event.previous_status, event.status), ('new', 'accepted'))
+
+    def test_create_and_event_in_one_transaction(self):
+        """Если событие создания не записалось, перевал тоже не сохраняется"""
+        from unittest import mock
+
+        payload = {
+            'beauty_title': 'пер. ', 'title': 'Атомарный', 'other_titles': '', 'connect': '',
+            'user': {'email': 'events@example.com', 'last_name': 'Событие', 'first_name': 'Егор',
+                     'middle_name': '', 'phone': '+79990000012'},
+            'coords': {'latitude': 43.1, 'longitude': 42.5, 'height': 3000},
+            'level': {'summer': '1A'},
+            'images': [],
+        }
+        with mock.patch('pereval.signals.events.emit', side_effect=RuntimeError('outbox')):
+            response = self.client.post(reverse('submit-data'), payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+        self.assertFalse(Pereval.objects.filter(title='Атомарный').exists())
+
+    def test_patch_and_event_in_one_transaction(self):
+        """Ошибка в середине PATCH откатывает и изменения перевала, и событие"""
+        from unittest import mock
+        from .models import ChangeEvent
+
+        with mock.patch('pereval.views.replace_images', side_effect=RuntimeError('images')):
+            response = self.client.patch(reverse('submit-data-update', kwargs={'pk': self.pereval.pk}),
+                                         {'title': 'Изменён', 'images': []}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.pereval.refresh_from_db()
+        self.assertEqual(self.pereval.title, 'Перевал')
+        self.assertFalse(ChangeEvent.objects.filter(action='updated').exists())
+
+    def test_relay_and_consumer_offsets(self):
+        """События переносятся в сегменты журнала, потребитель читает с сохранённой позиции"""
+        import os
+        from django.conf import settings
+        from .events import EventLog, relay
+        from .models import ChangeEvent
+
+        for index in range(5):
+            self.pereval.title = f'Перевал {index}'
+            self.pereval.save()
+        self.assertEqual(relay(), 6)
+        self.assertFalse(ChangeEvent.objects.exists())
+        self.assertGreater(len(EventLog().segments()), 1)
+
+        # Оборванная при сбое строка не ломает чтение и дозапись
+        with open(os.path.join(settings.EVENT_LOG_DIR, '%020d.log' % EventLog().segments()[-1]), 'ab') as segment:
+            segment.write(b'{"offset": ')
+        self.pereval.delete()
+        relay()
+
+        url = reverse('submit-data-events')
+        response = self.client.get(url, {'consumer': 'search', 'limit': 4})
+        self.assertEqual([record['offset'] for record in response.data['events']], [0, 1, 2, 3])
+        self.assertEqual(response.data['events'][0]['type'], 'pereval.created')
+
+        self.client.post(reverse('submit-data-events-commit'), {'consumer': 'search', 'offset': 4}, format='json')
+        response = self.client.get(url, {'consumer': 'search'})
+        self.assertEqual([record['type'] for record in response.data['events']],
+                         ['pereval.updated', 'pereval.updated', 'pereval.deleted'])
+        self.assertEqual(response.data['next_offset'], 7)
+
+    def test_relay_events_committed_out_of_order(self):
+        """Событие с меньшим id, зафиксированное позже, не теряется; повтор после сбоя не дублируется"""
+        from .events import EventLog, relay
+        from .models import ChangeEvent
+
+        ChangeEvent.objects.all().delete()
+        ChangeEvent.objects.create(id=100, entity='pereval', action='updated', pereval_id=self.pereval.pk)
+        relay()
+        # Долгая транзакция получила id раньше, а зафиксировалась после пересылки события 100
+        ChangeEvent.objects.create(id=50, entity='pereval', action='status', pereval_id=self.pereval.pk,
+                                   status='accepted', previous_status='new')
+        relay()
+
+        # Сбой после записи в журнал: события остались в outbox
+        log = EventLog()
+        late = ChangeEvent.objects.create(id=70, entity='pereval', action='updated', pereval_id=self.pereval.pk)
+        log.append([late])
+        self.assertEqual(relay(), 1)
+
+        self.assertEqual([record['event'] for record in log.read(0, 10)], [100, 50, 70])
+        self.assertEqual([record['event'] for record in log.tail(2)], [50, 70])
+
+
+class StatusNotificationTest(TestCase):
+    """Тесты уведомлений о смене статуса (SSE)"""
+
+    def setUp(self):
+        import shutil
+        import tempfile
+        from django.test import override_settings
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings_override = override_settings(EVENT_LOG_DIR=directory, NOTIFY_POLL_SECONDS=0.05)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create(email='notify@example.com', last_name='Статус',
+                                        first_name='Семён', phone='+79990000013')
+        other = User.objects.create(email='other@example.com', last_name='Другой',
+                                    first_name='Дмитрий', phone='+79990000014')
+        self.pereval, self.foreign = [
+            Pereval.objects.create(
+                title='Перевал', user=user,
+                coords=Coords.objects.create(latitude=43.0, longitude=42.0, height=3000),
+                level=Level.objects.create(summer='1A'),
+            )
+            for user in (self.user, other)
+        ]
+
+    def moderate(self, status_code):
+        from .events import relay
+        from .moderation import set_status
+
+        set_status(Pereval.objects.filter(pk__in=[self.pereval.pk, self.foreign.pk]), status_code)
+        relay()
+
+    def moderate_one(self, pereval, status_code):
+        from .events import relay
+        from .moderation import set_status
+
+        set_status(Pereval.objects.filter(pk=pereval.pk), status_code)
+        relay()
+
+    async def test_hub_delivers_own_transitions(self):
+        """Подписчик получает смены статуса только своих перевалов, включая созданные после подписки"""
+        import asyncio
+        from asgiref.sync import sync_to_async
+        from .notifications import hub
+
+        subscription = hub.subscribe(self.user.pk, [self.pereval.pk])
+        self.addCleanup(hub.close)
+        await asyncio.sleep(0.1)
+        await sync_to_async(self.moderate)('pending')
+        notification = await asyncio.wait_for(subscription.queue.get(), 5)
+        self.assertEqual((notification['id'], notification['previous_status'], notification['status']),
+                         (self.pereval.pk, 'new', 'pending'))
+
+        def submit():
+            from .events import relay
+
+            created = Pereval.objects.create(
+                title='Новый', user=self.user, level=Level.objects.create(summer='1A'),
+                coords=Coords.objects.create(latitude=43.2, longitude=42.2, height=3100),
+            )
+            relay()
+            return created
+
+        created = await sync_to_async(submit)()
+        await asyncio.sleep(0.3)
+        await sync_to_async(self.moderate)('accepted')
+        await sync_to_async(self.moderate_one)(created, 'accepted')
+        received = [await asyncio.wait_for(subscription.queue.get(), 5) for _ in range(2)]
+        self.assertEqual([(item['id'], item['status']) for item in received],
+                         [(self.pereval.pk, 'accepted'), (created.pk, 'accepted')])
+        self.assertTrue(subscription.queue.empty())
+
+    async def test_stream_resumes_from_last_event_id(self):
+        """SSE после переподключения начинается с пропущенных событий"""
+        from asgiref.sync import sync_to_async
+        from django.test import AsyncClient
+
+        await sync_to_async(self.moderate)('pending')
+        await sync_to_async(self.moderate)('accepted')
+        response = await AsyncClient().get(reverse('submit-data-status-stream'), {'email': 'notify@example.com'},
+                                           headers={'Last-Event-ID': '-1'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        chunks = aiter(response.streaming_content)
+        self.assertTrue((await anext(chunks)).startswith(b'retry:'))
+        first, second = await anext(chunks), await anext(chunks)
+        self.assertIn(b'event: status', first)
+        self.assertIn(b'"status": "pending"', first)
+        self.assertIn(b'"status": "accepted"', second)
+        await chunks.aclose()
+
+
+class FastValidationTest(TestCase):
+    """Тесты быстрой проверки заявок"""
+
+    def payload(self, **changes):
+        data = {
+            'beauty_title': 'пер. ', 'title': 'Перевал', 'other_titles': '', 'connect': '',
+            'user': {'email': 'fast@example.com', 'last_name': 'Быстров', 'first_name': 'Борис',
+                     'middle_name': '', 'phone': '+79990000015'},
+            'coords': {'latitude': 43.1, 'longitude': 42.5, 'height': 3000},
+            'level': {'winter': None, 'summer': '1A', 'autumn': '', 'spring': ''},
+            'images': [{'file_path': '/media/a.jpg', 'title': 'Вид'}],
+        }
+        for path, value in changes.items():
+            *parents, name = path.split('__')
+            target = data
+            for parent in parents:
+                target = target[int(parent)] if isinstance(target, list) else target[parent]
+            if value is KeyError:
+                del target[name]
+            else:
+                target[name] = value
+        return data
+
+    def test_same_errors_as_serializer(self):
+        """Ошибки совпадают с ошибками PerevalSerializer"""
+        from .serializers import PerevalSerializer
+        from .validation import validate_submission
+
+        cases = [
+            self.payload(),
+            [],
+            self.payload(title=KeyError, user__email=KeyError),
+            self.payload(title='  ', beauty_title='x' * 300, connect=None),
+            self.payload(title=True, other_titles=['a'], user__phone=12345),
+            self.payload(user__email='not-an-email', user__last_name=''),
+            self.payload(coords__latitude=100, coords__longitude='-181', coords__height='3000.0'),
+            self.payload(coords__latitude='abc', coords__longitude=float('nan'), coords__height=3000.5),
+            self.payload(coords=None, level=[], user='fast@example.com'),
+            self.payload(level__summer='очень сложный', level__winter=1),
+            self.payload(images={}),
+            self.payload(images=[{'title': 'Без пути'}, 'a.jpg', {'file_path': 'b.jpg', 'title': 'Вид'}]),
+        ]
+        for data in cases:
+            with self.subTest(data=data):
+                serializer = PerevalSerializer(data=data)
+                serializer.is_valid()
+                self.assertEqual(validate_submission(data), serializer.errors or None)
+
+    def test_rejected_before_serializer(self):
+        """Некорректная заявка отклоняется без сериализатора с прежним текстом ошибки"""
+        from unittest import mock
+
+        data = self.payload(coords__latitude=100, title=KeyError)
+        with mock.patch('pereval.views.PerevalSerializer') as serializer_class:
+            response = self.client.post(reverse('submit-data'), data=json.dumps(data),
+                                        content_type='application/json')
+        serializer_class.assert_not_called()
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['message'], 'title: Обязательное поле.; coords: latitude')
+
+        response = self.client.post(reverse('submit-data'), data=json.dumps(self.payload()),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class AreaTest(TestCase):
+    """Тесты горных районов"""
+
+    @staticmethod
+    def square(lon_min, lat_min, lon_max, lat_max):
+        return [[lon_min, lat_min], [lon_max, lat_min], [lon_max, lat_max], [lon_min, lat_max], [lon_min, lat_min]]
+
+    def setUp(self):
+        from .areas import invalidate, load_geojson
+
+        # Откат транзакции теста не вызывает сигналы: индекс районов процесса сбрасывается явно
+        self.addCleanup(invalidate)
+
+        features = [
+            {'id': 1, 'type': 'Feature', 'properties': {'title': 'Кавказ'},
+             'geometry': {'type': 'Polygon', 'coordinates': [self.square(38, 41, 49, 45)]}},
+            # Эльбрус с "дырой" - точки в ней относятся к Кавказу
+            {'id': 2, 'type': 'Feature', 'properties': {'title': 'Приэльбрусье', 'parent': 1},
+             'geometry': {'type': 'Polygon', 'coordinates': [self.square(42, 43, 43, 44),
+                                                              self.square(42.4, 43.4, 42.6, 43.6)]}},
+        ]
+        # Много мелких районов, чтобы дерево было многоуровневым
+        features += [
+            {'id': 100 + index, 'type': 'Feature', 'properties': {'name': f'Район {index}'},
+             'geometry': {'type': 'MultiPolygon', 'coordinates': [[self.square(
+                 60 + index % 20, 50 + index // 20, 60.9 + index % 20, 50.9 + index // 20)]]}}
+            for index in range(200)
+        ]
+        load_geojson({'type': 'FeatureCollection', 'features': features})
+
+    def test_point_lookup(self):
+        """Точка относится к наименьшему содержащему её району; дерево совпадает с полным перебором"""
+        import random
+        from .areas import Region, area_for, get_index
+        from .models import Area
+
+        self.assertEqual(area_for(43.3, 42.8), 2)
+        self.assertEqual(area_for(43.5, 42.5), 1)
+        self.assertEqual(area_for(42.0, 40.0), 1)
+        self.assertIsNone(area_for(55.7, 37.6))
+        self.assertEqual(Area.objects.get(pk=2).parent_id, 1)
+        self.assertGreater(get_index().tree.height, 0)
+
+        regions = [Region(pk, geometry) for pk, geometry in Area.objects.values_list('id', 'geometry')]
+        rnd = random.Random(1)
+        for _ in range(500):
+            latitude, longitude = rnd.uniform(40, 61), rnd.uniform(37, 81)
+            matches = [region for region in regions if region.contains(longitude, latitude)]
+            expected = min(matches, key=lambda region: region.size).area_id if matches else None
+            self.assertEqual(area_for(latitude, longitude), expected)
+
+    def test_submit_assigns_area_and_filters(self):
+        """Новый перевал получает район; список и аналитика фильтруются по району"""
+        import shutil
+        import tempfile
+        from django.test import override_settings
+        from .areas import assign
+        from .snapshot import current, export, query
+
+        old = Pereval.objects.create(
+            title='Старый', user=User.objects.create(email='area@example.com', last_name='Район',
+                                                    first_name='Роман', phone='+79990000016'),
+            coords=Coords.objects.create(latitude=43.2, longitude=42.1, height=3500),
+            level=Level.objects.create(summer='1A'),
+        )
+        self.assertEqual(assign(), 1)
+        old.refresh_from_db()
+        self.assertEqual(old.area_id, 2)
+
+        payload = {
+            'title': 'Новый', 'user': {'email': 'area@example.com', 'last_name': 'Район',
+                                       'first_name': 'Роман', 'phone': '+79990000016'},
+            'coords': {'latitude': 41.5, 'longitude': 45.0, 'height': 2800},
+            'level': {'summer': '1B'}, 'images': [],
+        }
+        response = self.client.post(reverse('submit-data'), data=json.dumps(payload), content_type='application/json')
+        self.assertEqual(Pereval.objects.get(pk=response.data['id']).area_id, 1)
+
+        url = reverse('submit-data-user-list')
+        response = self.client.get(url, {'user__email': 'area@example.com', 'area': 2})
+        self.assertEqual([(item['title'], item['area']) for item in response.data], [('Старый', 2)])
+        self.assertEqual(self.client.get(url, {'user__email': 'area@example.com', 'area': 'x'}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        with override_settings(SNAPSHOT_DIR=directory):
+            export()
+            result = query(current(), {'group_by': 'area', 'area': '1,2'})
+        self.assertEqual([(group['value'], group['title'], group['count']) for group in result['groups']],
+                         [(1, 'Кавказ', 1), (2, 'Приэльбрусье', 1)])
+
+    def test_patch_updates_area(self):
+        """PATCH координат пересчитывает район перевала"""
+        pereval = Pereval.objects.create(
+            title='Правка', user=User.objects.create(email='patch-area@example.com', last_name='Правка',
+                                                    first_name='Пётр', phone='+79990000017'),
+            coords=Coords.objects.create(latitude=41.5, longitude=45.0, height=2800),
+            level=Level.objects.create(summer='1A'),
+        )
+        self.assertEqual(pereval.area_id, None)
+
+        response = self.client.patch(reverse('submit-data-update', kwargs={'pk': pereval.pk}),
+                                     data=json.dumps({'coords': {'latitude': 43.2, 'longitude': 42.1}}),
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        pereval.refresh_from_db()
+        self.assertEqual(pereval.area_id, 2)
+
+    def test_import_areas_rebuilds_documents(self):
+        """import_areas пересобирает документы, сохранённые до появления районов"""
+        import os
+        import tempfile
+        from django.core.management import call_command
+        from .models import PerevalDocument
+
+        pereval = Pereval.objects.create(
+            title='Опубликованный', status='accepted',
+            user=User.objects.create(email='doc-area@example.com', last_name='Документ',
+                                     first_name='Дина', phone='+79990000018'),
+            coords=Coords.objects.create(latitude=41.5, longitude=45.0, height=2800),
+            level=Level.objects.create(summer='1A'),
+        )
+        document = PerevalDocument.objects.get(pk=pereval.pk)
+        document.document.pop('area')
+        document.save()
+
+        fd, path = tempfile.mkstemp(suffix='.geojson')
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, 'w', encoding='utf-8') as source:
+            json.dump({'type': 'FeatureCollection', 'features': [
+                {'id': 1, 'type': 'Feature', 'properties': {'title': 'Кавказ'},
+                 'geometry': {'type': 'Polygon', 'coordinates': [self.square(38, 41, 49, 45)]}},
+            ]}, source)
+        call_command('import_areas', path, stdout=open(os.devnull, 'w'))
+
+        self.assertEqual(PerevalDocument.objects.get(pk=pereval.pk).document['area'], 1)
@@ -0,0 +1,297 @@
+"""
+Пирамида кластеров перевалов для карты (/submitData/tiles/{z}/{x}/{y}).
+
+Для каждого масштаба 0..TILE_MAX_ZOOM тайл (Web Mercator, как у OSM) разбит на
+2^TILE_CLUSTER_BITS x 2^TILE_CLUSTER_BITS ячеек; в TileCluster хранится число
+перевалов в ячейке, сумма координат (для центра) и максимальная высота.
+Ячейка масштаба z - это тайл масштаба z + TILE_CLUSTER_BITS, поэтому её
+родитель на масштабе z - 1 получается сдвигом координат на 1 бит.
+
+Добавление, правка, модерация и удаление перевала (signals.py) записывают
+в TileDelta одну строку изменения, а не обновляют ячейки всех масштабов:
+иначе каждая заявка обновляла бы десятки строк, и все записи ждали бы
+блокировки одних и тех же ячеек мелких масштабов. apply_deltas() переносит
+накопленные изменения в TileCluster пачками - каждая затронутая ячейка
+обновляется один раз за пачку. Изменения применяет фоновый процесс
+(manage.py apply_tile_deltas) и сама запись, если в буфере больше
+TILE_DELTA_MAX изменений. Чтение кластеров (tile_clusters) буфер не трогает и
+не берёт блокировок: карта может отставать от базы на содержимое буфера.
+
+После массовой загрузки в обход сигналов (generate_passes, import_legacy)
+пирамида строится заново - rebuild(). Отклонённые перевалы на карте не показываются.
+"""
+import logging
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Max, Q, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Pereval, TileCluster, TileDelta
+
+logger = logging.getLogger(__name__)
+
+HIDDEN_STATUSES = ('rejected',)
+MAX_LATITUDE = 85.0511287798  # граница проекции Web Mercator
+MAX_REQUEST_ZOOM = 22
+KEY_BATCH = 200  # ячеек в одном условии WHERE (OR по ячейкам)
+
+
+def is_visible(status):
+    return status not in HIDDEN_STATUSES
+
+
+def cell_for(latitude, longitude, level):
+    """Номер тайла (x, y) масштаба level, в который попадает точка"""
+    n = 1 << level
+    latitude = max(min(float(latitude), MAX_LATITUDE), -MAX_LATITUDE)
+    x = int((float(longitude) + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(latitude))) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_bounds(x, y, level):
+    """Границы тайла: (широта min, широта max, долгота min, долгота max)"""
+    n = 1 << level
+
+    def latitude(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return latitude(y + 1), latitude(y), x / n * 360 - 180, (x + 1) / n * 360 - 180
+
+
+def _keys(latitude, longitude):
+    """Ячейки всех масштабов, в которые попадает точка (по возрастанию масштаба)"""
+    max_zoom = settings.TILE_MAX_ZOOM
+    x, y = cell_for(latitude, longitude, max_zoom + settings.TILE_CLUSTER_BITS)
+    return [(zoom, x >> (max_zoom - zoom), y >> (max_zoom - zoom)) for zoom in range(max_zoom + 1)]
+
+
+def _key_filter(keys):
+    query = Q()
+    for zoom, x, y in keys:
+        query |= Q(zoom=zoom, x=x, y=y)
+    return query
+
+
+def _point(latitude, longitude, height, sign):
+    return TileDelta(latitude=float(latitude), longitude=float(longitude), height=int(height), sign=sign)
+
+
+def _buffer(deltas):
+    deltas = TileDelta.objects.bulk_create(deltas)
+    last_id = deltas[-1].id if deltas else None
+    if last_id is not None:
+        transaction.on_commit(lambda: _apply_if_full(last_id))
+
+
+def _apply_if_full(last_id):
+    """Переполненный буфер разбирает запись, не дожидаясь фонового процесса"""
+    # id изменений растут, поэтому изменение старше last_id - TILE_DELTA_MAX означает переполнение
+    if TileDelta.objects.filter(id__lte=last_id - settings.TILE_DELTA_MAX).exists():
+        apply_deltas()
+
+
+def add_points(points):
+    """Учитывает перевалы (широта, долгота, высота) в ячейках всех масштабов (при следующем apply_deltas)"""
+    _buffer([_point(*point, 1) for point in points])
+
+
+def remove_points(points):
+    """
+    Убирает перевалы из ячеек всех масштабов. Вызывается, когда в базе перевалов
+    уже нет (или они скрыты): при переносе максимум высоты пересчитывается по оставшимся.
+    """
+    _buffer([_point(*point, -1) for point in points])
+
+
+def add_point(latitude, longitude, height):
+    add_points([(latitude, longitude, height)])
+
+
+def remove_point(latitude, longitude, height):
+    remove_points([(latitude, longitude, height)])
+
+
+def move_point(old, new):
+    """Перевал сменил координаты или высоту: old и new - (широта, долгота, высота)"""
+    _buffer([_point(*old, -1), _point(*new, 1)])
+
+
+def apply_deltas(batch_size=None):
+    """Переносит накопленные изменения в TileCluster, возвращает их число"""
+    batch_size = batch_size or settings.TILE_DELTA_BATCH
+    applied = 0
+    while True:
+        with transaction.atomic():
+            # Параллельные вызовы разбирают разные изменения
+            deltas = list(TileDelta.objects.select_for_update(skip_locked=True).order_by('id')[:batch_size])
+            if not deltas:
+                return applied
+            _apply(deltas)
+            TileDelta.objects.filter(id__in=[delta.id for delta in deltas]).delete()
+        applied += len(deltas)
+        if len(deltas) < batch_size:
+            return applied
+
+
+def run_apply(stop_event, batch_size=None, poll_interval=1.0):
+    """Цикл переноса изменений пирамиды, пока не установлен stop_event"""
+    try:
+        while not stop_event.is_set():
+            try:
+                apply_deltas(batch_size)
+            except Exception:
+                logger.exception('Ошибка переноса изменений пирамиды карты')
+            stop_event.wait(poll_interval)
+    finally:
+        connection.close()
+
+
+def _apply(deltas):
+    # [изменение числа, изменение суммы широт, изменение суммы долгот, максимум добавленных высот]
+    cells = defaultdict(lambda: [0, 0.0, 0.0, None])
+    removed = {}  # ячейка -> максимум убранных высот
+    for delta in deltas:
+        for key in _keys(delta.latitude, delta.longitude):
+            cell = cells[key]
+            cell[0] += delta.sign
+            cell[1] += delta.sign * delta.latitude
+            cell[2] += delta.sign * delta.longitude
+            if delta.sign > 0:
+                cell[3] = delta.height if cell[3] is None else max(cell[3], delta.height)
+            else:
+                removed[key] = max(removed.get(key, delta.height), delta.height)
+
+    keys = sorted(cells)
+    TileCluster.objects.bulk_create([TileCluster(zoom=z, x=x, y=y) for z, x, y in keys if cells[z, x, y][3] is not None],
+                                    ignore_conflicts=True, batch_size=KEY_BATCH)
+    # Строки обновляются в одном порядке во всех транзакциях, поэтому взаимных блокировок нет
+    for zoom, x, y in keys:
+        count, latitude_sum, longitude_sum, height = cells[zoom, x, y]
+        changes = {
+            'count': F('count') + count,
+            'latitude_sum': F('latitude_sum') + latitude_sum,
+            'longitude_sum': F('longitude_sum') + longitude_sum,
+        }
+        if height is not None:
+            changes['max_height'] = Greatest(Coalesce('max_height', Value(height)), Value(height))
+        # Ячейку, удалённую полным пересчётом, уменьшать некуда
+        TileCluster.objects.filter(zoom=zoom, x=x, y=y, count__gte=max(-count, 0)).update(**changes)
+    for start in range(0, len(keys), KEY_BATCH):
+        TileCluster.objects.filter(_key_filter(keys[start:start + KEY_BATCH]), count=0).delete()
+
+    # Максимум меняется, только если убранный перевал был самым высоким в ячейке;
+    # мелкие масштабы пересчитываются по уже исправленным дочерним ячейкам
+    removed_keys = list(removed)
+    stale = []
+    for start in range(0, len(removed_keys), KEY_BATCH):
+        rows = (TileCluster.objects.filter(_key_filter(removed_keys[start:start + KEY_BATCH]))
+                .values_list('zoom', 'x', 'y', 'max_height'))
+        stale += [(zoom, x, y) for zoom, x, y, max_height in rows
+                  if max_height is None or max_height <= removed[zoom, x, y]]
+    for zoom, x, y in sorted(stale, reverse=True):
+        TileCluster.objects.filter(zoom=zoom, x=x, y=y).update(max_height=_cell_max_height(zoom, x, y))
+
+
+def _cell_max_height(zoom, x, y):
+    if zoom < settings.TILE_MAX_ZOOM:
+        return (TileCluster.objects
+                .filter(zoom=zoom + 1, x__in=(2 * x, 2 * x + 1), y__in=(2 * y, 2 * y + 1))
+                .aggregate(value=Max('max_height'))['value'])
+
+    level = zoom + settings.TILE_CLUSTER_BITS
+    heights = [
+        height
+        for latitude, longitude, height in _visible_points(*tile_bounds(x, y, level))
+        if cell_for(latitude, longitude, level) == (x, y)
+    ]
+    return max(heights, default=None)
+
+
+def _visible_points(lat_min, lat_max, lon_min, lon_max):
+    """Перевалы в прямоугольнике (с запасом на погрешность границ): (широта, долгота, высота)"""
+    eps = 1e-9
+    return (Pereval.objects
+            .filter(coords__latitude__gte=lat_min - eps, coords__latitude__lte=lat_max + eps,
+                    coords__longitude__gte=lon_min - eps, coords__longitude__lte=lon_max + eps)
+            .exclude(status__in=HIDDEN_STATUSES)
+            .values_list('coords__latitude', 'coords__longitude', 'coords__height'))
+
+
+def build_clusters(points):
+    """
+    Пирамида по последовательности точек (широта, долгота, высота):
+    список (zoom, x, y, число, сумма широт, сумма долгот, максимальная высота)
+    """
+    bits = settings.TILE_CLUSTER_BITS
+    max_zoom = settings.TILE_MAX_ZOOM
+    # [число, сумма широт, сумма долгот, максимальная высота]
+    levels = [defaultdict(lambda: [0, 0.0, 0.0, None]) for _ in range(max_zoom + 1)]
+
+    for latitude, longitude, height in points:
+        cell = levels[max_zoom][cell_for(latitude, longitude, max_zoom + bits)]
+        cell[0] += 1
+        cell[1] += latitude
+        cell[2] += longitude
+        cell[3] = height if cell[3] is None else max(cell[3], height)
+
+    for zoom in range(max_zoom, 0, -1):
+        for (x, y), (count, latitude_sum, longitude_sum, height) in levels[zoom].items():
+            parent = levels[zoom - 1][(x >> 1, y >> 1)]
+            parent[0] += count
+            parent[1] += latitude_sum
+            parent[2] += longitude_sum
+            parent[3] = height if parent[3] is None else max(parent[3], height)
+
+    return [(zoom, x, y, *cell) for zoom, cells in enumerate(levels) for (x, y), cell in cells.items()]
+
+
+def rebuild(batch_size=5000):
+    """Полный пересчёт пирамиды по всем перевалам, возвращает число ячеек"""
+    points = (Pereval.objects.exclude(status__in=HIDDEN_STATUSES)
+              .values_list('coords__latitude', 'coords__longitude', 'coords__height'))
+    clusters = [
+        TileCluster(zoom=zoom, x=x, y=y, count=count, latitude_sum=latitude_sum,
+                    longitude_sum=longitude_sum, max_height=height)
+        for zoom, x, y, count, latitude_sum, longitude_sum, height
+        in build_clusters(points.iterator(chunk_size=batch_size))
+    ]
+    with transaction.atomic():
+        # Накопленные изменения уже учтены в пересчёте
+        TileDelta.objects.all().delete()
+        TileCluster.objects.all().delete()
+        TileCluster.objects.bulk_create(clusters, batch_size=batch_size)
+    return len(clusters)
+
+
+def tile_clusters(z, x, y):
+    """
+    Кластеры тайла: список словарей count, latitude, longitude (центр), max_height.
+    На масштабах крупнее TILE_MAX_ZOOM возвращаются сами перевалы (count = 1, есть id).
+    Изменения, ещё не перенесённые из буфера (apply_deltas), в кластерах не видны.
+    """
+    if z > settings.TILE_MAX_ZOOM:
+        lat_min, lat_max, lon_min, lon_max = tile_bounds(x, y, z)
+        passes = (Pereval.objects
+                  .filter(coords__latitude__gte=lat_min, coords__latitude__lt=lat_max,
+                          coords__longitude__gte=lon_min, coords__longitude__lt=lon_max)
+                  .exclude(status__in=HIDDEN_STATUSES)
+                  .values_list('id', 'coords__latitude', 'coords__longitude', 'coords__height'))
+        return [
+            {'count': 1, 'latitude': latitude, 'longitude': longitude, 'max_height': height, 'id': pk}
+            for pk, latitude, longitude, height in passes
+        ]
+
+    size = 1 << settings.TILE_CLUSTER_BITS
+    clusters = (TileCluster.objects
+                .filter(zoom=z, x__gte=x * size, x__lt=(x + 1) * size, y__gte=y * size, y__lt=(y + 1) * size,
+                        count__gt=0)
+                .values_list('count', 'latitude_sum', 'longitude_sum', 'max_height'))
+    return [
+        {'count': count, 'latitude': latitude_sum / count, 'longitude': longitude_sum / count,
+         'max_height': height}
+        for count, latitude_sum, longitude_sum, height in clusters
+    ]
@@ -0,0 +1,288 @@
+"""
+Потоковая загрузка изображений перевалов.
+
+Байты изображения пишутся кусками сразу во временный файл в MEDIA_ROOT и затем
+переносятся на место, без буферизации файла целиком в памяти. Поддерживаются
+multipart/form-data (несколько файлов за запрос) и «сырое» тело запроса
+с Content-Type: image/* (в том числе Transfer-Encoding: chunked).
+
+Файлы хранятся по хэшу содержимого (MEDIA_ROOT/blobs/ab/cd/<sha256>.<ext>):
+одинаковые фотографии, в том числе повторно загруженные при ретраях,
+хранятся один раз, а записи Image ссылаются на общий ImageBlob.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+
+# Допустимые типы изображений и расширения файлов
+IMAGE_TYPES = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+}
+
+CHUNK_SIZE = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    """Файл больше IMAGE_UPLOAD_MAX_SIZE"""
+
+
+class UnsupportedImageType(ValueError):
+    """Тип файла не входит в IMAGE_TYPES"""
+
+
+class ImageWriter:
+    """Пишет загружаемый файл кусками во временный файл в MEDIA_ROOT"""
+
+    def __init__(self, content_type):
+        content_type = (content_type or '').split(';')[0].strip().lower()
+        if content_type not in IMAGE_TYPES:
+            raise UnsupportedImageType(f'Неподдерживаемый тип файла: {content_type or "не указан"}')
+        self.content_type = content_type
+        self.size = 0
+        self._hash = hashlib.sha256()
+
+        tmp_dir = os.path.join(settings.MEDIA_ROOT, 'tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile(dir=tmp_dir, suffix='.part', delete=False)
+
+    @property
+    def temp_path(self):
+        return self._file.name
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.size > settings.IMAGE_UPLOAD_MAX_SIZE:
+            self.abort()
+            raise UploadTooLarge(f'Размер файла превышает {settings.IMAGE_UPLOAD_MAX_SIZE} байт')
+        self._hash.update(chunk)
+        self._file.write(chunk)
+
+    @property
+    def sha256(self):
+        return self._hash.hexdigest()
+
+    def close(self):
+        self._file.close()
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self._file.name):
+            os.remove(self._file.name)
+
+
+class StreamedImage(UploadedFile):
+    """Загруженный файл, уже записанный на диск обработчиком ImageUploadHandler"""
+
+    def __init__(self, writer, name):
+        super().__init__(file=None, name=name, content_type=writer.content_type, size=writer.size)
+        self.writer = writer
+
+    def close(self):
+        # Файл уже закрыт обработчиком; Django закрывает загруженные файлы при ошибке разбора запроса
+        self.writer.close()
+
+
+class ImageUploadHandler(FileUploadHandler):
+    """Обработчик multipart-загрузки: каждый файл сразу пишется в MEDIA_ROOT через ImageWriter"""
+
+    chunk_size = CHUNK_SIZE
+
+    def __init__(self, request=None, writers=None):
+        super().__init__(request)
+        # Все начатые файлы запроса: их временные файлы удаляются и при ошибке в следующем файле
+        self.writers = writers if writers is not None else []
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None,
+                 content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.writer = ImageWriter(content_type)
+        self.writers.append(self.writer)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.writer.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        self.writer.close()
+        return StreamedImage(self.writer, self.file_name)
+
+    def upload_interrupted(self):
+        if getattr(self, 'writer', None) is not None:
+            self.writer.abort()
+
+
+def receive_stream(stream, content_type, writers=None):
+    """Читает «сырое» тело запроса кусками в ImageWriter (writers - список начатых файлов)"""
+    writer = ImageWriter(content_type)
+    if writers is not None:
+        writers.append(writer)
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        writer.write(chunk)
+    writer.close()
+    return writer
+
+
+def discard(writers):
+    """
+    Удаляет оставшиеся временные файлы загрузок. Внутри внешней транзакции файлы
+    ещё ждут переноса в хранилище (store_blob), поэтому удаляются после её фиксации.
+    """
+    def abort_all():
+        for writer in writers:
+            writer.abort()
+
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(abort_all)
+    else:
+        abort_all()
+
+
+def media_url(relative_path):
+    return settings.MEDIA_URL + relative_path.replace(os.sep, '/')
+
+
+def blob_relative_path(sha256, content_type):
+    return os.path.join('blobs', sha256[:2], sha256[2:4], sha256 + IMAGE_TYPES[content_type])
+
+
+def store_blob(writer):
+    """
+    Сохраняет загруженный файл в хранилище по хэшу и увеличивает счётчик ссылок.
+    Если такой файл уже есть, временный файл удаляется.
+    Вызывается внутри транзакции, в которой создаётся ссылающийся Image.
+    :return: (ImageBlob, created)
+    """
+    from .models import ImageBlob
+
+    writer.close()
+    sha256 = writer.sha256
+    relative_path = blob_relative_path(sha256, writer.content_type)
+
+    while True:
+        blob, created = ImageBlob.objects.get_or_create(
+            sha256=sha256,
+            defaults={'path': relative_path, 'size': writer.size, 'content_type': writer.content_type},
+        )
+        # Между get_or_create и увеличением счётчика release_blob мог удалить
+        # последний blob с этим хэшем: тогда он создаётся заново
+        if add_reference(blob):
+            break
+    absolute_path = os.path.join(settings.MEDIA_ROOT, blob.path)
+    if created or not os.path.exists(absolute_path):
+        # Файл переносится на место только после фиксации: при откате в хранилище
+        # не остаётся файла без записи ImageBlob
+        temp_path = writer.temp_path
+
+        def move_into_place():
+            if os.path.exists(temp_path):
+                os.makedirs(os.path.dirname(absolute_path), exist_ok=True)
+                os.replace(temp_path, absolute_path)
+
+        transaction.on_commit(move_into_place)
+    else:
+        writer.abort()
+    return blob, created
+
+
+def add_reference(blob):
+    """Увеличивает счётчик ссылок; False, если blob уже удалён"""
+    from .models import ImageBlob
+
+    return ImageBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1) > 0
+
+
+def blob_for_url(file_path):
+    """ImageBlob файла хранилища по его URL (file_path записи Image) или None"""
+    from .models import ImageBlob
+
+    if not file_path or not file_path.startswith(settings.MEDIA_URL):
+        return None
+    relative_path = file_path[len(settings.MEDIA_URL):].replace('/', os.sep)
+    return ImageBlob.objects.filter(path=relative_path).first()
+
+
+def replace_images(pereval, images):
+    """
+    Заменяет изображения перевала списком {file_path, title} (PATCH заявки).
+    Неизменённые записи остаются на месте, новые записи на файлы хранилища
+    получают ссылку на blob до удаления старых: иначе счётчик ссылок
+    обнулился бы и файл удалился вместе с заменяемой записью.
+    Вызывается внутри транзакции.
+    """
+    from .models import Image
+
+    existing = {}
+    for image in pereval.images.order_by('id'):
+        existing.setdefault(image.file_path, []).append(image)
+
+    for item in images:
+        file_path = item.get('file_path', '')
+        title = item.get('title', '')
+        same = existing.get(file_path)
+        if same:
+            image = same.pop(0)
+            if image.title != title:
+                image.title = title
+                image.save(update_fields=['title'])
+            continue
+
+        blob = blob_for_url(file_path)
+        if blob is not None and not add_reference(blob):
+            blob = None
+        Image.objects.create(
+            pereval=pereval,
+            blob=blob,
+            file_path=file_path,
+            title=title,
+            file_size=blob.size if blob else None,
+            file_type=blob.content_type if blob else '',
+            width=blob.width if blob else None,
+            height=blob.height if blob else None,
+            thumbnail_path=media_url(blob.thumbnail_path) if blob and blob.thumbnail_path else '',
+        )
+
+    for removed in existing.values():
+        for image in removed:
+            image.delete()
+
+
+def release_blob(blob_id):
+    """
+    Уменьшает счётчик ссылок; файл без ссылок удаляется после фиксации транзакции.
+    """
+    from django.db.models import ProtectedError
+    from .models import ImageBlob
+
+    ImageBlob.objects.filter(pk=blob_id, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+    blob = ImageBlob.objects.filter(pk=blob_id, ref_count=0).first()
+    if blob is None:
+        return
+
+    paths = [os.path.join(settings.MEDIA_ROOT, blob.path)]
+    if blob.thumbnail_path:
+        paths.append(os.path.join(settings.MEDIA_ROOT, blob.thumbnail_path))
+    try:
+        with transaction.atomic():
+            blob.delete()
+    except ProtectedError:
+        # На файл успела сослаться новая загрузка
+        return
+
+    def remove_files():
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    transaction.on_commit(remove_files)
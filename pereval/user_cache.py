@@ -0,0 +1,88 @@
+"""
+Кэш соответствия email -> id пользователя.
+
+Большинство заявок приходит от нескольких тысяч постоянных пользователей, поэтому
+id пользователя берётся из кэша процесса (LRU с TTL), затем из общего кэша Django
+(если задан USER_ID_CACHE_BACKEND, например Redis или Memcached), и только потом
+из базы. Записи сбрасываются сигналами при удалении пользователя и смене email.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .cache import LRUCache
+from .models import User
+
+_local = LRUCache(maxsize=settings.USER_ID_CACHE_SIZE, ttl=settings.USER_ID_CACHE_TTL)
+
+
+def _shared_cache():
+    alias = settings.USER_ID_CACHE_BACKEND
+    return caches[alias] if alias else None
+
+
+def _shared_key(email):
+    # Ключ без пробелов и спецсимволов, допустимый для любого бэкенда кэша
+    return 'pereval:user-id:' + hashlib.sha1(email.encode('utf-8')).hexdigest()
+
+
+def remember_on_commit(email, user_id):
+    """
+    Кэширует id после фиксации текущей транзакции (вне транзакции - сразу),
+    чтобы при откате в кэше не остался несуществующий или чужой id
+    """
+    transaction.on_commit(lambda: remember(email, user_id))
+
+
+def remember(email, user_id):
+    _local.set(email, user_id)
+    shared = _shared_cache()
+    if shared is not None:
+        shared.set(_shared_key(email), user_id, settings.USER_ID_CACHE_TTL)
+
+
+def invalidate(email):
+    _local.delete(email)
+    shared = _shared_cache()
+    if shared is not None:
+        shared.delete(_shared_key(email))
+
+
+def clear():
+    """Очистка кэша процесса (общий кэш не затрагивается)"""
+    _local.clear()
+
+
+def _cached_user_id(email):
+    user_id = _local.get(email)
+    if user_id is not None:
+        return user_id
+    shared = _shared_cache()
+    if shared is not None:
+        user_id = shared.get(_shared_key(email))
+        if user_id is not None:
+            _local.set(email, user_id)
+    return user_id
+
+
+def get_user_id(email):
+    """id пользователя по email или None, если такого пользователя нет"""
+    user_id = _cached_user_id(email)
+    if user_id is None:
+        user_id = User.objects.filter(email=email).values_list('id', flat=True).first()
+        if user_id is not None:
+            remember_on_commit(email, user_id)
+    return user_id
+
+
+def get_or_create_user_id(user_data):
+    """id пользователя по email из user_data; при отсутствии пользователь создаётся"""
+    email = user_data['email']
+    user_id = _cached_user_id(email)
+    if user_id is None:
+        user, _ = User.objects.get_or_create(email=email, defaults=user_data)
+        user_id = user.pk
+        remember_on_commit(email, user_id)
+    return user_id
@@ -0,0 +1,192 @@
+"""
+Быстрая проверка заявки на добавление перевала до PerevalSerializer.
+
+Схема проверки один раз строится по полям сериализатора (обязательность,
+типы, null/blank, валидаторы полей - длины строк, диапазоны координат) и
+применяется к разобранному JSON за один проход, без создания вложенных
+сериализаторов. Ошибки собираются в той же структуре, что serializer.errors,
+с теми же текстами, поэтому ответ 400 не отличается от ответа сериализатора.
+
+Проверка только отсекает заведомо некорректные заявки: прошедшая её заявка
+всё равно проверяется сериализатором.
+"""
+import math
+from collections.abc import Mapping
+from functools import lru_cache
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+
+from .serializers import PerevalSerializer
+
+
+class _Fail(Exception):
+    """Ошибка значения поля: ключ сообщения из error_messages поля"""
+
+    def __init__(self, key):
+        self.key = key
+
+
+def _to_char(field):
+    trim_whitespace = field.trim_whitespace
+
+    def convert(value):
+        if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            raise _Fail('invalid')
+        value = str(value)
+        return value.strip() if trim_whitespace else value
+    return convert
+
+
+def _to_integer(field):
+    max_string_length, re_decimal = field.MAX_STRING_LENGTH, field.re_decimal
+
+    def convert(value):
+        if isinstance(value, str) and len(value) > max_string_length:
+            raise _Fail('max_string_length')
+        try:
+            return int(re_decimal.sub('', str(value)))
+        except (ValueError, TypeError):
+            raise _Fail('invalid')
+    return convert
+
+
+def _to_float(field):
+    max_string_length = field.MAX_STRING_LENGTH
+
+    def convert(value):
+        if isinstance(value, str) and len(value) > max_string_length:
+            raise _Fail('max_string_length')
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise _Fail('invalid')
+        except OverflowError:
+            raise _Fail('overflow')
+        if not math.isfinite(value):
+            raise _Fail('invalid')
+        return value
+    return convert
+
+
+CONVERTERS = (
+    (serializers.CharField, _to_char),
+    (serializers.IntegerField, _to_integer),
+    (serializers.FloatField, _to_float),
+)
+
+
+def _compile_value(field):
+    """Проверка значения поля: возвращает ошибки поля или None"""
+    if isinstance(field, serializers.ListSerializer):
+        return _compile_list(field)
+    if isinstance(field, serializers.Serializer):
+        return _compile_serializer(field)
+
+    convert = next((factory(field) for field_class, factory in CONVERTERS if isinstance(field, field_class)), None)
+    validators = list(field.validators)
+    if convert is None or any(getattr(validator, 'requires_context', False) for validator in validators):
+        return _delegate(field)
+
+    messages = field.error_messages
+    allow_null = field.allow_null
+    is_char = isinstance(field, serializers.CharField)
+    allow_blank = is_char and field.allow_blank
+    trim_whitespace = is_char and field.trim_whitespace
+
+    def check(value):
+        if is_char and isinstance(value, str) and (value == '' or (trim_whitespace and not value.strip())):
+            return None if allow_blank else [str(messages['blank'])]
+        if value is None:
+            return None if allow_null else [str(messages['null'])]
+        try:
+            value = convert(value)
+        except _Fail as fail:
+            return [str(messages[fail.key])]
+        errors = []
+        for validator in validators:
+            try:
+                validator(value)
+            except DjangoValidationError as exc:
+                errors.extend(exc.messages)
+            except serializers.ValidationError as exc:
+                errors.extend(exc.detail)
+        return errors or None
+    return check
+
+
+def _delegate(field):
+    """Поле незнакомого типа проверяется самим полем сериализатора"""
+    def check(value):
+        try:
+            field.run_validation(value)
+        except serializers.ValidationError as exc:
+            return exc.detail
+        return None
+    return check
+
+
+def _compile_serializer(serializer):
+    plan = [
+        (field.field_name, field.required, field.error_messages['required'], _compile_value(field))
+        for field in serializer.fields.values() if not field.read_only
+    ]
+    invalid = serializer.error_messages['invalid']
+    allow_null = serializer.allow_null
+    null = serializer.error_messages['null']
+
+    def check(data):
+        if data is None:
+            return None if allow_null else [str(null)]
+        if not isinstance(data, Mapping):
+            return {api_settings.NON_FIELD_ERRORS_KEY: [str(invalid).format(datatype=type(data).__name__)]}
+        errors = {}
+        for name, required, required_message, check_value in plan:
+            if name not in data:
+                if required:
+                    errors[name] = [str(required_message)]
+                continue
+            field_errors = check_value(data[name])
+            if field_errors:
+                errors[name] = field_errors
+        return errors or None
+    return check
+
+
+def _compile_list(serializer):
+    check_item = _compile_serializer(serializer.child)
+    messages = serializer.error_messages
+    allow_empty, allow_null = serializer.allow_empty, serializer.allow_null
+
+    def check(data):
+        if data is None:
+            return None if allow_null else [str(messages['null'])]
+        if not isinstance(data, list):
+            message = str(messages['not_a_list']).format(input_type=type(data).__name__)
+            return {api_settings.NON_FIELD_ERRORS_KEY: [message]}
+        if not allow_empty and not data:
+            return {api_settings.NON_FIELD_ERRORS_KEY: [str(messages['empty'])]}
+        errors = {index: item_errors for index, item_errors in enumerate(map(check_item, data)) if item_errors}
+        if not errors:
+            return None
+        if getattr(api_settings, 'LIST_SERIALIZER_ERRORS_AS_DICT', False):
+            return errors
+        return [errors.get(index, {}) for index in range(len(data))]
+    return check
+
+
+@lru_cache(maxsize=None)
+def compile_validator(serializer_class):
+    """Проверка данных для serializer_class (строится один раз)"""
+    return _compile_serializer(serializer_class())
+
+
+def validate_submission(data):
+    """
+    Ошибки заявки в формате serializer.errors или None, если заявку нужно
+    передать сериализатору (данные формы проверяет только он)
+    """
+    if hasattr(data, 'getlist'):
+        return None
+    return compile_validator(PerevalSerializer)(data)
@@ -1,22 +1,61 @@
+import mimetypes
+import os
+
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.generics import RetrieveAPIView
-from drf_yasg.utils import swagger_auto_schema
-from drf_yasg import openapi
-from .models import Pereval, User, Coords, Level, Image
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAdminUser
+from .docs import swagger_auto_schema, openapi
+from .idempotency import idempotent
+from .ingest import enqueue
+from .ratelimit import TokenBucketThrottle
+from . import areas, events, image_processing, moderation, read_model, snapshot, tiles
+from .uploads import (
+    IMAGE_TYPES, ImageUploadHandler, StreamedImage, UploadTooLarge, UnsupportedImageType,
+    discard, receive_stream, media_url, replace_images, store_blob,
+)
+from . import user_cache
+from .models import Pereval, User, Coords, Level, Image, IngestTicket
 from .serializers import PerevalSerializer
+from .validation import validate_submission
 from rest_framework import status
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponseNotModified
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from django.db import transaction
 
 
 class SubmitDataView(APIView):
+    throttle_classes = [TokenBucketThrottle]
+
+    @idempotent
     def post(self, request):
+        # Заведомо некорректная заявка отклоняется до построения вложенных сериализаторов
+        if settings.SUBMIT_FAST_VALIDATION:
+            errors = validate_submission(request.data)
+            if errors:
+                return validation_error_response(errors)
+
         serializer = PerevalSerializer(data=request.data)
 
         if serializer.is_valid():
+            if settings.INGEST_MODE == 'async':
+                # Заявка сохраняется в очередь, перевал создаст фоновый обработчик
+                ticket = enqueue(request.data)
+                response_data = {
+                    'status': status.HTTP_202_ACCEPTED,
+                    'message': None,
+                    'id': None,
+                    'ticket': str(ticket.id)
+                }
+                return Response(response_data, status=status.HTTP_202_ACCEPTED)
+
             try:
-                pereval = serializer.save()
+                # Перевал и событие его создания (outbox) фиксируются одной транзакцией
+                with transaction.atomic():
+                    pereval = serializer.save()
                 response_data = {
                     'status': status.HTTP_200_OK,
                     'message': None,
@@ -31,19 +70,142 @@ class SubmitDataView(APIView):
                 }
                 return Response(response_data, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         else:
-            errors = serializer.errors
-            error_messages = []
+            return validation_error_response(serializer.errors)
+
+
+def validation_error_response(errors):
+    """Ответ 400 с ошибками проверки заявки через "; " """
+    error_messages = []
 
-            for field, messages in errors.items():
-                for message in messages:
-                    error_messages.append(f"{field}: {message}")
+    for field, messages in errors.items():
+        for message in messages:
+            error_messages.append(f"{field}: {message}")
 
-            response_data = {
+    response_data = {
+        'status': status.HTTP_400_BAD_REQUEST,
+        'message': "; ".join(error_messages),
+        'id': None
+    }
+    return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
+
+
+class IngestTicketStatus(APIView):
+    """
+    GET /submitData/ingest/<ticket>/ — состояние заявки, принятой в асинхронном режиме
+    """
+
+    @swagger_auto_schema(operation_description="Получить состояние заявки из очереди по номеру")
+    def get(self, request, ticket):
+        ticket = get_object_or_404(IngestTicket, pk=ticket)
+        return Response({
+            'ticket': str(ticket.id),
+            'state': ticket.status,
+            'id': ticket.pereval_id,
+            'message': ticket.message or None
+        }, status=status.HTTP_200_OK)
+
+
+class ModerationClaim(APIView):
+    """
+    POST /submitData/moderation/claim/ — взять в работу следующие N перевалов (модераторам)
+    """
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(
+        operation_description=("Взять в работу до limit новых перевалов: они переходят в статус pending "
+                               "и закрепляются за модератором до lease_expires_at"),
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={'limit': openapi.Schema(type=openapi.TYPE_INTEGER, description='Сколько перевалов взять')}
+        ),
+        responses={200: PerevalSerializer(many=True)}
+    )
+    def post(self, request):
+        try:
+            limit = int(request.data.get('limit', 10))
+        except (TypeError, ValueError):
+            limit = 0
+        if not 0 < limit <= settings.MODERATION_CLAIM_MAX:
+            return Response({
                 'status': status.HTTP_400_BAD_REQUEST,
-                'message': "; ".join(error_messages),
-                'id': None
-            }
-            return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
+                'message': f'limit должен быть от 1 до {settings.MODERATION_CLAIM_MAX}',
+                'passes': []
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        perevals, claimed_at = moderation.claim_next(request.user, limit)
+        return Response({
+            'status': status.HTTP_200_OK,
+            'message': None,
+            'lease_expires_at': moderation.lease_expires_at(claimed_at),
+            'passes': PerevalSerializer(perevals, many=True).data
+        }, status=status.HTTP_200_OK)
+
+
+class ModerationRenew(APIView):
+    """
+    POST /submitData/moderation/renew/ — продлить аренду всех перевалов модератора
+    """
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(operation_description="Продлить аренду перевалов, взятых модератором в работу")
+    def post(self, request):
+        renewed = moderation.renew(request.user)
+        return Response({
+            'state': 1,
+            'message': f'Аренда продлена, перевалов: {renewed}',
+            'lease_expires_at': moderation.lease_expires_at(timezone.now())
+        }, status=status.HTTP_200_OK)
+
+
+class ModerationResolve(APIView):
+    """
+    POST /submitData/moderation/<id>/resolve/ — завершить модерацию (accepted или rejected)
+    """
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(
+        operation_description="Принять или отклонить перевал, взятый модератором в работу",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={'status': openapi.Schema(type=openapi.TYPE_STRING, enum=['accepted', 'rejected'])}
+        )
+    )
+    def post(self, request, pk):
+        new_status = request.data.get('status')
+        if new_status not in ('accepted', 'rejected'):
+            return Response({
+                'state': 0,
+                'message': 'status должен быть accepted или rejected'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        if not moderation.resolve(pk, request.user, new_status):
+            return Response({
+                'state': 0,
+                'message': 'Перевал не взят в работу этим модератором'
+            }, status=status.HTTP_409_CONFLICT)
+        return Response({
+            'state': 1,
+            'message': 'Модерация завершена'
+        }, status=status.HTTP_200_OK)
+
+
+class ModerationRelease(APIView):
+    """
+    POST /submitData/moderation/<id>/release/ — вернуть перевал в очередь
+    """
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(operation_description="Вернуть перевал в очередь модерации (статус new)")
+    def post(self, request, pk):
+        if not moderation.release(pk, request.user):
+            return Response({
+                'state': 0,
+                'message': 'Перевал не взят в работу этим модератором'
+            }, status=status.HTTP_409_CONFLICT)
+        return Response({
+            'state': 1,
+            'message': 'Перевал возвращён в очередь'
+        }, status=status.HTTP_200_OK)
 
 
 class PerevalDetailView(RetrieveAPIView):
@@ -56,12 +218,18 @@ class SubmitDataDetail(APIView):
     """
     GET /submitData/<id> — получить одну запись (перевал) по её id
     """
+    throttle_classes = [TokenBucketThrottle]
 
     @swagger_auto_schema(
         operation_description="Получить информацию о перевале по ID",
         responses={200: PerevalSerializer}
     )
     def get(self, request, pk):
+        # Опубликованный перевал отдаётся готовым документом, без JOIN связанных таблиц
+        document = read_model.get_document(pk)
+        if document is not None:
+            return Response(document, status=status.HTTP_200_OK)
+
         pereval = get_object_or_404(Pereval, pk=pk)
         serializer = PerevalSerializer(pereval)
         return Response(serializer.data, status=status.HTTP_200_OK)
@@ -71,6 +239,7 @@ class SubmitDataUpdate(APIView):
     """
     PATCH /submitData/<id> — отредактировать существующую запись, если она в статусе new
     """
+    throttle_classes = [TokenBucketThrottle]
 
     @swagger_auto_schema(
         operation_description="Редактировать перевал (только если статус 'new')",
@@ -87,6 +256,7 @@ class SubmitDataUpdate(APIView):
             )
         }
     )
+    @idempotent
     def patch(self, request, pk):
         try:
             pereval = get_object_or_404(Pereval, pk=pk)
@@ -104,52 +274,49 @@ class SubmitDataUpdate(APIView):
             # Удаляем поля пользователя, которые нельзя редактировать
             user_data = data.pop('user', None)
 
-            # Обновляем основные данные перевала
-            updatable_fields = ['beauty_title', 'title', 'other_titles', 'connect']
-            for field in updatable_fields:
-                if field in data:
-                    setattr(pereval, field, data[field])
-
-            # Обновляем координаты
-            if 'coords' in data:
-                coords_data = data['coords']
-                if pereval.coords:
-                    # Обновляем существующие координаты
-                    for field, value in coords_data.items():
-                        setattr(pereval.coords, field, value)
-                    pereval.coords.save()
-                else:
-                    # Создаем новые координаты
-                    coords = Coords.objects.create(**coords_data)
-                    pereval.coords = coords
-
-            # Обновляем уровень сложности
-            if 'level' in data:
-                level_data = data['level']
-                if pereval.level:
-                    # Обновляем существующий уровень
-                    for field, value in level_data.items():
-                        setattr(pereval.level, field, value)
-                    pereval.level.save()
-                else:
-                    # Создаем новый уровень
-                    level = Level.objects.create(**level_data)
-                    pereval.level = level
-
-            # Сохраняем изменения в основном объекте
-            pereval.save()
-
-            # Обновляем изображения, если они переданы
-            if 'images' in data:
-                # Удаляем старые изображения
-                pereval.images.all().delete()
-                # Создаем новые изображения
-                for img_data in data['images']:
-                    Image.objects.create(
-                        pereval=pereval,
-                        file_path=img_data.get('file_path', ''),
-                        title=img_data.get('title', '')
-                    )
+            # Изменения и их события (outbox) фиксируются одной транзакцией
+            with transaction.atomic():
+                # Обновляем основные данные перевала
+                updatable_fields = ['beauty_title', 'title', 'other_titles', 'connect']
+                for field in updatable_fields:
+                    if field in data:
+                        setattr(pereval, field, data[field])
+
+                # Обновляем координаты
+                if 'coords' in data:
+                    coords_data = data['coords']
+                    if pereval.coords:
+                        # Обновляем существующие координаты
+                        for field, value in coords_data.items():
+                            setattr(pereval.coords, field, value)
+                        pereval.coords.save()
+                    else:
+                        # Создаем новые координаты
+                        coords = Coords.objects.create(**coords_data)
+                        pereval.coords = coords
+                    # Район перевала зависит от координат
+                    pereval.area_id = areas.area_for(pereval.coords.latitude, pereval.coords.longitude)
+
+                # Обновляем уровень сложности
+                if 'level' in data:
+                    level_data = data['level']
+                    if pereval.level:
+                        # Обновляем существующий уровень
+                        for field, value in level_data.items():
+                            setattr(pereval.level, field, value)
+                        pereval.level.save()
+                    else:
+                        # Создаем новый уровень
+                        level = Level.objects.create(**level_data)
+                        pereval.level = level
+
+                # Сохраняем изменения в основном объекте
+                pereval.save()
+
+                # Обновляем изображения, если они переданы
+                if 'images' in data:
+                    # Неизменённые изображения сохраняются, ссылки на загруженные файлы не теряются
+                    replace_images(pereval, data['images'])
 
             return Response({
                 'state': 1,
@@ -167,6 +334,7 @@ class SubmitDataUserList(APIView):
     """
     GET /submitData/?user__email=<email> — список данных обо всех объектах пользователя
     """
+    throttle_classes = [TokenBucketThrottle]
 
     @swagger_auto_schema(
         operation_description="Получить список перевалов пользователя по email",
@@ -177,6 +345,12 @@ class SubmitDataUserList(APIView):
                 description="Email пользователя",
                 type=openapi.TYPE_STRING,
                 required=True
+            ),
+            openapi.Parameter(
+                'area',
+                openapi.IN_QUERY,
+                description="id горного района",
+                type=openapi.TYPE_INTEGER
             )
         ],
         responses={200: PerevalSerializer(many=True)}
@@ -189,12 +363,247 @@ class SubmitDataUserList(APIView):
                 'error': 'Параметр user__email обязателен'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            user = User.objects.get(email=email)
-            perevals = Pereval.objects.filter(user=user)
-            serializer = PerevalSerializer(perevals, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        except User.DoesNotExist:
+        area_id = request.query_params.get('area')
+        if area_id is not None and not area_id.isdigit():
+            return Response({
+                'error': 'Параметр area должен быть числом'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        user_id = user_cache.get_user_id(email)
+        if user_id is None:
             return Response({
                 'error': 'Пользователь с таким email не найден'
-            }, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        documents = read_model.user_documents(user_id, int(area_id) if area_id is not None else None)
+        return Response(documents, status=status.HTTP_200_OK)
+
+
+class PerevalImageUpload(APIView):
+    """
+    POST /submitData/<id>/images/ — загрузить изображения перевала (только в статусе new)
+
+    multipart/form-data: файлы в любых полях, подписи в полях title (по порядку файлов);
+    либо тело запроса с Content-Type: image/* и подписью в параметре ?title=
+    """
+    parser_classes = [MultiPartParser]
+    throttle_classes = [TokenBucketThrottle]
+
+    @swagger_auto_schema(operation_description="Загрузить изображения перевала (только если статус 'new')")
+    def post(self, request, pk):
+        pereval = get_object_or_404(Pereval, pk=pk)
+        if pereval.status != 'new':
+            return Response({
+                'status': status.HTTP_400_BAD_REQUEST,
+                'message': 'Изображения можно добавить только к перевалу в статусе new',
+                'images': []
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        writers = []
+        try:
+            return self._store_uploads(request, pereval, writers)
+        finally:
+            # Временные файлы не остаются ни при ошибке в одном из файлов, ни при ошибке записи в базу
+            discard(writers)
+
+    def _store_uploads(self, request, pereval, writers):
+        try:
+            if request.content_type.startswith('multipart/form-data'):
+                request.upload_handlers = [ImageUploadHandler(request, writers)]
+                uploads = [upload for field in request.FILES for upload in request.FILES.getlist(field)]
+                titles = request.data.getlist('title')
+            else:
+                writer = receive_stream(request.stream, request.content_type, writers)
+                uploads = [StreamedImage(writer, 'upload' + IMAGE_TYPES[writer.content_type])]
+                titles = [request.query_params.get('title', '')]
+        except UploadTooLarge as e:
+            return Response({
+                'status': status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                'message': str(e),
+                'images': []
+            }, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        except UnsupportedImageType as e:
+            return Response({
+                'status': status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                'message': str(e),
+                'images': []
+            }, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+        if not uploads:
+            return Response({
+                'status': status.HTTP_400_BAD_REQUEST,
+                'message': 'Файлы изображений не переданы',
+                'images': []
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        images = []
+        with transaction.atomic():
+            for index, upload in enumerate(uploads):
+                # Одинаковые файлы хранятся один раз, Image ссылается на общий blob
+                blob, created = store_blob(upload.writer)
+                image = Image.objects.create(
+                    pereval=pereval,
+                    blob=blob,
+                    file_path=media_url(blob.path),
+                    title=titles[index] if index < len(titles) else '',
+                    file_size=blob.size,
+                    file_type=blob.content_type,
+                    width=blob.width,
+                    height=blob.height,
+                    thumbnail_path=media_url(blob.thumbnail_path) if blob.thumbnail_path else '',
+                )
+                if created:
+                    # Размеры и миниатюра вычисляются в пуле процессов после фиксации записи
+                    transaction.on_commit(
+                        lambda blob_id=blob.id, path=blob.path: image_processing.schedule(blob_id, path)
+                    )
+                images.append({'id': image.id, 'file_path': image.file_path})
+
+        return Response({
+            'status': status.HTTP_200_OK,
+            'message': None,
+            'images': images
+        }, status=status.HTTP_200_OK)
+
+
+class PerevalTiles(APIView):
+    """
+    GET /submitData/tiles/<z>/<x>/<y> — кластеры перевалов тайла карты (нумерация как у OSM)
+    """
+    throttle_classes = [TokenBucketThrottle]
+
+    @swagger_auto_schema(
+        operation_description="Кластеры перевалов в тайле карты: число, центр и максимальная высота",
+        responses={
+            200: openapi.Response(
+                description="Кластеры тайла",
+                examples={
+                    "application/json": {
+                        "zoom": 5,
+                        "x": 19,
+                        "y": 11,
+                        "clusters": [
+                            {"count": 42, "latitude": 43.21, "longitude": 42.45, "max_height": 4100}
+                        ]
+                    }
+                }
+            )
+        }
+    )
+    def get(self, request, z, x, y):
+        if z > tiles.MAX_REQUEST_ZOOM or x >= 1 << z or y >= 1 << z:
+            raise Http404('Тайл не найден')
+
+        response = Response({
+            'zoom': z,
+            'x': x,
+            'y': y,
+            'clusters': tiles.tile_clusters(z, x, y)
+        }, status=status.HTTP_200_OK)
+        response['Cache-Control'] = f'public, max-age={settings.TILE_CACHE_MAX_AGE}'
+        return response
+
+
+class PerevalAnalytics(APIView):
+    """
+    GET /submitData/analytics/ — агрегаты по колоночному снимку перевалов (без обращения к базе)
+    """
+    throttle_classes = [TokenBucketThrottle]
+
+    @swagger_auto_schema(
+        operation_description=("Число перевалов и статистика высот по снимку: фильтры lat_min, lat_max, "
+                               "lon_min, lon_max, height_min, height_max, added_from, added_to, status, "
+                               "level_<сезон>, area; группировка group_by; гистограмма height_bins"),
+    )
+    def get(self, request):
+        try:
+            return Response(snapshot.query(snapshot.current(), request.query_params), status=status.HTTP_200_OK)
+        except snapshot.SnapshotUnavailable as e:
+            return Response({'message': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except ValueError as e:
+            return Response({'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class PerevalEvents(APIView):
+    """
+    GET /submitData/events/ — события изменений перевалов из журнала начиная с offset
+    """
+    permission_classes = [IsAdminUser]
+    throttle_classes = [TokenBucketThrottle]
+
+    @swagger_auto_schema(
+        operation_description=("События журнала начиная с offset (или с сохранённой позиции consumer), "
+                               "не больше limit; next_offset - с чего читать дальше"),
+        manual_parameters=[
+            openapi.Parameter('offset', openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+            openapi.Parameter('limit', openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+            openapi.Parameter('consumer', openapi.IN_QUERY, type=openapi.TYPE_STRING),
+        ],
+    )
+    def get(self, request):
+        log = events.EventLog()
+        try:
+            if 'offset' in request.query_params:
+                offset = int(request.query_params['offset'])
+            elif 'consumer' in request.query_params:
+                offset = log.committed_offset(request.query_params['consumer'])
+            else:
+                offset = 0
+            limit = min(int(request.query_params.get('limit', settings.EVENT_READ_MAX)), settings.EVENT_READ_MAX)
+            if offset < 0 or limit < 1:
+                raise ValueError('offset и limit должны быть неотрицательными')
+        except ValueError as e:
+            return Response({'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        records = log.read(offset, limit)
+        next_offset = records[-1]['offset'] + 1 if records else offset
+        return Response({'events': records, 'next_offset': next_offset}, status=status.HTTP_200_OK)
+
+
+class PerevalEventsCommit(APIView):
+    """
+    POST /submitData/events/commit/ — сохранение позиции потребителя в журнале
+    """
+    permission_classes = [IsAdminUser]
+    throttle_classes = [TokenBucketThrottle]
+
+    @swagger_auto_schema(
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'consumer': openapi.Schema(type=openapi.TYPE_STRING),
+                'offset': openapi.Schema(type=openapi.TYPE_INTEGER),
+            },
+        ),
+        operation_description="Сохраняет offset, с которого потребитель продолжит чтение",
+    )
+    def post(self, request):
+        try:
+            consumer = str(request.data['consumer'])
+            offset = int(request.data['offset'])
+            if offset < 0:
+                raise ValueError('offset должен быть неотрицательным')
+            events.EventLog().commit_offset(consumer, offset)
+        except (KeyError, TypeError, ValueError) as e:
+            return Response({'state': 0, 'message': f'Некорректный запрос: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'state': 1, 'message': 'Позиция сохранена'}, status=status.HTTP_200_OK)
+
+
+def blob_view(request, path):
+    """
+    GET /media/blobs/<path> — файл изображения из хранилища по хэшу.
+    Содержимое по одному адресу никогда не меняется, поэтому кэшируется навсегда.
+    """
+    blob_path = os.path.normpath(os.path.join('blobs', path))
+    absolute_path = os.path.join(settings.MEDIA_ROOT, blob_path)
+    if not blob_path.startswith('blobs' + os.sep) or not os.path.isfile(absolute_path):
+        raise Http404('Файл не найден')
+
+    etag = '"%s"' % os.path.splitext(os.path.basename(blob_path))[0]
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(open(absolute_path, 'rb'), content_type=mimetypes.guess_type(absolute_path)[0])
+    response['ETag'] = etag
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
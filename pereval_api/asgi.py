@@ -13,4 +13,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pereval_api.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Импорт после настройки Django (get_asgi_application вызывает django.setup())
+from pereval.notifications import LifespanApplication  # noqa: E402
+
+application = LifespanApplication(django_application)
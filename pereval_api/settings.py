@@ -3,6 +3,8 @@ import os
 from dotenv import load_dotenv
 import sys
 
+load_dotenv()  # Загружаем переменные окружения из .env файла
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -10,7 +12,10 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = 'django-insecure-mqz#@v9nmmt20h(fttjsnote6o$r6!bkm2_$us6h=m19-zj$r2'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.getenv('DJANGO_DEBUG', 'True').lower() in ('1', 'true', 'yes')
+
+# Признак production-развёртывания (не меняется тестовым раннером, в отличие от DEBUG)
+PRODUCTION = not DEBUG
 ALLOWED_HOSTS = ['localhost', '127.0.0.1']
 
 # Application definition
@@ -22,12 +27,26 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework',
-    'drf_yasg',
-    'drf_spectacular',
     'pereval',  # Убедись, что это имя твоего приложения
 ]
 
+# Документация API (Swagger/ReDoc). Для воркеров, обслуживающих только API,
+# можно отключить: пакеты документации тогда не импортируются.
+API_DOCS_ENABLED = os.getenv('DJANGO_API_DOCS', 'True').lower() in ('1', 'true', 'yes')
+
+if API_DOCS_ENABLED:
+    INSTALLED_APPS += ['drf_yasg', 'drf_spectacular']
+
+# OpenAPI-схема строится один раз и кэшируется в памяти процесса.
+# API_SCHEMA_FILE - путь к заранее сгенерированной схеме
+# (python manage.py spectacular --file schema.yml), отдаётся вместо генерации.
+API_SCHEMA_CACHE = os.getenv('DJANGO_API_SCHEMA_CACHE', 'True').lower() in ('1', 'true', 'yes')
+API_SCHEMA_FILE = os.getenv('DJANGO_API_SCHEMA_FILE', '')
+API_SCHEMA_MAX_AGE = int(os.getenv('DJANGO_API_SCHEMA_MAX_AGE', '3600'))
+
 MIDDLEWARE = [
+    'pereval.middleware.PerformanceMetricsMiddleware',
+    'pereval.ratelimit.AdmissionControlMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -37,6 +56,118 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Эндпоинты, для которых собираются метрики (Server-Timing и /metrics)
+METRICS_ENDPOINTS = [
+    'submit-data',
+    'submit-data-detail',
+    'submit-data-update',
+    'submit-data-user-list',
+]
+METRICS_ENABLED = os.getenv('DJANGO_METRICS', 'True').lower() in ('1', 'true', 'yes')
+
+if not METRICS_ENABLED:
+    MIDDLEWARE.remove('pereval.middleware.PerformanceMetricsMiddleware')
+
+# Idempotency-Key: время хранения ответов (сек) и размер кэша в памяти процесса
+IDEMPOTENCY_TTL = int(os.getenv('DJANGO_IDEMPOTENCY_TTL', str(24 * 60 * 60)))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv('DJANGO_IDEMPOTENCY_CACHE_SIZE', '10000'))
+
+# Режим приёма заявок: sync - перевал создаётся в запросе,
+# async - заявка ставится в очередь (ответ 202), перевалы создаёт manage.py ingest_worker
+INGEST_MODE = os.getenv('DJANGO_INGEST_MODE', 'sync').lower()
+# Через сколько секунд заявку, зависшую в обработке, может забрать другой обработчик
+INGEST_LEASE_SECONDS = int(os.getenv('DJANGO_INGEST_LEASE_SECONDS', '300'))
+
+# Быстрая проверка заявок (pereval.validation) до PerevalSerializer
+SUBMIT_FAST_VALIDATION = os.getenv('DJANGO_SUBMIT_FAST_VALIDATION', 'True').lower() in ('1', 'true', 'yes')
+
+# Кэш email -> id пользователя: размер и время жизни кэша процесса,
+# USER_ID_CACHE_BACKEND - псевдоним из CACHES для общего кэша (пусто - только кэш процесса)
+USER_ID_CACHE_SIZE = int(os.getenv('DJANGO_USER_ID_CACHE_SIZE', '10000'))
+USER_ID_CACHE_TTL = int(os.getenv('DJANGO_USER_ID_CACHE_TTL', '3600'))
+USER_ID_CACHE_BACKEND = os.getenv('DJANGO_USER_ID_CACHE_BACKEND', '')
+
+# Поиск возможных дублей при добавлении перевала: радиус (м), порог похожести названий
+# (триграммы, 0..1) и размер ячейки пространственной сетки (градусы; при изменении
+# нужно пересчитать Coords.grid_cell)
+DUPLICATE_DETECTION = os.getenv('DJANGO_DUPLICATE_DETECTION', 'True').lower() in ('1', 'true', 'yes')
+DUPLICATE_RADIUS_M = float(os.getenv('DJANGO_DUPLICATE_RADIUS_M', '1000'))
+DUPLICATE_TITLE_SIMILARITY = float(os.getenv('DJANGO_DUPLICATE_TITLE_SIMILARITY', '0.4'))
+GEO_GRID_DEG = float(os.getenv('DJANGO_GEO_GRID_DEG', '0.05'))
+
+# Горные районы: как часто (сек) процесс перечитывает многоугольники районов
+# (изменения районов в самом процессе применяются сразу)
+AREA_INDEX_TTL = int(os.getenv('DJANGO_AREA_INDEX_TTL', '300'))
+
+# Пирамида кластеров для карты: до какого масштаба хранятся кластеры (крупнее - отдельные
+# перевалы), на сколько ячеек делится тайл (2^bits по стороне) и max-age ответа (сек)
+TILE_MAX_ZOOM = int(os.getenv('DJANGO_TILE_MAX_ZOOM', '12'))
+TILE_CLUSTER_BITS = int(os.getenv('DJANGO_TILE_CLUSTER_BITS', '3'))
+TILE_CACHE_MAX_AGE = int(os.getenv('DJANGO_TILE_CACHE_MAX_AGE', '60'))
+# Сколько накопленных изменений пирамиды переносится в TileCluster за одну транзакцию
+TILE_DELTA_BATCH = int(os.getenv('DJANGO_TILE_DELTA_BATCH', '5000'))
+# Сверх скольких изменений в буфере запись сама переносит их, не дожидаясь apply_tile_deltas,
+# и пауза (сек) между переносами в apply_tile_deltas
+TILE_DELTA_MAX = int(os.getenv('DJANGO_TILE_DELTA_MAX', '10000'))
+TILE_DELTA_POLL_SECONDS = float(os.getenv('DJANGO_TILE_DELTA_POLL_SECONDS', '5'))
+
+# Колоночный снимок для аналитики: каталог, сколько версий хранить,
+# период обновления (сек) для manage.py export_snapshot --loop
+SNAPSHOT_DIR = os.getenv('DJANGO_SNAPSHOT_DIR', os.path.join(BASE_DIR, 'snapshot'))
+SNAPSHOT_KEEP = int(os.getenv('DJANGO_SNAPSHOT_KEEP', '2'))
+SNAPSHOT_REFRESH_SECONDS = int(os.getenv('DJANGO_SNAPSHOT_REFRESH_SECONDS', '3600'))
+
+# Очередь модерации: через сколько секунд брошенный модератором перевал (аренда истекла) можно
+# забрать другому модератору и сколько перевалов можно взять одним запросом
+MODERATION_LEASE_SECONDS = int(os.getenv('DJANGO_MODERATION_LEASE_SECONDS', '900'))
+MODERATION_CLAIM_MAX = int(os.getenv('DJANGO_MODERATION_CLAIM_MAX', '50'))
+
+# Ограничение частоты запросов (token bucket на клиента: email или IP): пополнение в секунду
+# и размер ведра отдельно для чтения и записи. RATE_LIMIT_CACHE_BACKEND - псевдоним из CACHES
+# для общего между процессами состояния (пусто - кэш процесса).
+RATE_LIMIT_ENABLED = os.getenv('DJANGO_RATE_LIMIT', 'True').lower() in ('1', 'true', 'yes')
+RATE_LIMIT_READ_RATE = float(os.getenv('DJANGO_RATE_LIMIT_READ_RATE', '50'))
+RATE_LIMIT_READ_BURST = int(os.getenv('DJANGO_RATE_LIMIT_READ_BURST', '100'))
+RATE_LIMIT_WRITE_RATE = float(os.getenv('DJANGO_RATE_LIMIT_WRITE_RATE', '10'))
+RATE_LIMIT_WRITE_BURST = int(os.getenv('DJANGO_RATE_LIMIT_WRITE_BURST', '50'))
+RATE_LIMIT_CACHE_BACKEND = os.getenv('DJANGO_RATE_LIMIT_CACHE_BACKEND', '')
+RATE_LIMIT_CACHE_SIZE = int(os.getenv('DJANGO_RATE_LIMIT_CACHE_SIZE', '100000'))
+# IP клиента из X-Forwarded-For (только за доверенным прокси)
+RATE_LIMIT_TRUST_FORWARDED = os.getenv('DJANGO_RATE_LIMIT_TRUST_FORWARDED', 'False').lower() in ('1', 'true', 'yes')
+
+# Сброс нагрузки: сколько запросов чтения и записи процесс обрабатывает одновременно,
+# сверх этого - сразу 503 с Retry-After (сек)
+ADMISSION_ENDPOINTS = [
+    'submit-data',
+    'submit-data-detail',
+    'submit-data-update',
+    'submit-data-user-list',
+    'submit-data-images',
+    'submit-data-tiles',
+    'submit-data-analytics',
+    'submit-data-events',
+]
+ADMISSION_MAX_READS = int(os.getenv('DJANGO_ADMISSION_MAX_READS', '32'))
+ADMISSION_MAX_WRITES = int(os.getenv('DJANGO_ADMISSION_MAX_WRITES', '8'))
+ADMISSION_RETRY_AFTER = int(os.getenv('DJANGO_ADMISSION_RETRY_AFTER', '1'))
+
+# Журнал событий изменений для внешних потребителей: каталог, размер сегмента (байт),
+# размер пачки и пауза (сек) процесса manage.py relay_events
+EVENT_LOG_DIR = os.getenv('DJANGO_EVENT_LOG_DIR', os.path.join(BASE_DIR, 'events'))
+EVENT_LOG_SEGMENT_BYTES = int(os.getenv('DJANGO_EVENT_LOG_SEGMENT_BYTES', str(64 * 1024 * 1024)))
+EVENT_RELAY_BATCH = int(os.getenv('DJANGO_EVENT_RELAY_BATCH', '1000'))
+EVENT_RELAY_POLL_SECONDS = float(os.getenv('DJANGO_EVENT_RELAY_POLL_SECONDS', '1'))
+EVENT_READ_MAX = int(os.getenv('DJANGO_EVENT_READ_MAX', '1000'))
+
+# Уведомления о смене статуса (SSE, под ASGI): период опроса журнала событий (сек),
+# интервал комментария-пинга (сек), пауза переподключения клиента (мс),
+# размер очереди подписчика и число подписок на процесс
+NOTIFY_POLL_SECONDS = float(os.getenv('DJANGO_NOTIFY_POLL_SECONDS', '0.5'))
+NOTIFY_HEARTBEAT_SECONDS = float(os.getenv('DJANGO_NOTIFY_HEARTBEAT_SECONDS', '15'))
+NOTIFY_RETRY_MS = int(os.getenv('DJANGO_NOTIFY_RETRY_MS', '3000'))
+NOTIFY_QUEUE_SIZE = int(os.getenv('DJANGO_NOTIFY_QUEUE_SIZE', '100'))
+NOTIFY_MAX_SUBSCRIBERS = int(os.getenv('DJANGO_NOTIFY_MAX_SUBSCRIBERS', '10000'))
+
 ROOT_URLCONF = 'pereval_api.urls'  # Замени на имя твоего проекта
 
 TEMPLATES = [
@@ -57,13 +188,59 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'pereval_api.wsgi.application'  # Замени на имя твоего проекта
 
-# Database - используем SQLite для простоты
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Database
+# Движок выбирается переменной DJANGO_DB_ENGINE: sqlite (по умолчанию) или postgresql.
+# Параметры подключения к PostgreSQL те же, что использует PerevalDatabase (FSTR_DB_*).
+DB_ENGINE = os.getenv('DJANGO_DB_ENGINE', 'sqlite').lower()
+
+if DB_ENGINE in ('postgres', 'postgresql'):
+    DB_OPTIONS = {
+        'connect_timeout': int(os.getenv('FSTR_DB_CONNECT_TIMEOUT', '5')),
+    }
+
+    # Ограничение времени выполнения запроса на стороне сервера (мс, 0 - без ограничения)
+    DB_STATEMENT_TIMEOUT = int(os.getenv('FSTR_DB_STATEMENT_TIMEOUT', '0'))
+    if DB_STATEMENT_TIMEOUT:
+        DB_OPTIONS['options'] = f'-c statement_timeout={DB_STATEMENT_TIMEOUT}'
+
+    # Пул соединений Django 5.1+ (работает только с драйвером psycopg 3)
+    DB_POOL_MAX_SIZE = int(os.getenv('FSTR_DB_POOL_MAX_SIZE', '0'))
+    if DB_POOL_MAX_SIZE:
+        DB_OPTIONS['pool'] = {
+            'min_size': int(os.getenv('FSTR_DB_POOL_MIN_SIZE', '1')),
+            'max_size': DB_POOL_MAX_SIZE,
+        }
+
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('FSTR_DB_NAME', 'pereval'),
+            'HOST': os.getenv('FSTR_DB_HOST', 'localhost'),
+            'PORT': os.getenv('FSTR_DB_PORT', '5432'),
+            'USER': os.getenv('FSTR_DB_LOGIN', ''),
+            'PASSWORD': os.getenv('FSTR_DB_PASS', ''),
+            # Постоянные соединения: время жизни в секундах (None - без ограничения).
+            # При использовании пула CONN_MAX_AGE должен быть равен 0.
+            'CONN_MAX_AGE': (
+                0 if DB_POOL_MAX_SIZE
+                else None if os.getenv('FSTR_DB_CONN_MAX_AGE') == 'none'
+                else int(os.getenv('FSTR_DB_CONN_MAX_AGE', '60'))
+            ),
+            # Проверка соединения перед повторным использованием
+            'CONN_HEALTH_CHECKS': os.getenv('FSTR_DB_CONN_HEALTH_CHECKS', 'True').lower() in ('1', 'true', 'yes'),
+            # Для pgbouncer в режиме transaction pooling серверные курсоры нужно отключить
+            'DISABLE_SERVER_SIDE_CURSORS': os.getenv('FSTR_DB_PGBOUNCER', 'False').lower() in ('1', 'true', 'yes'),
+            'OPTIONS': DB_OPTIONS,
+        }
+    }
+else:
+    # SQLite для локальной разработки и тестов
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('DJANGO_SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        }
     }
-}
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -95,18 +272,27 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Загрузка изображений: максимальный размер файла, обработка (process - пул процессов,
+# inline - сразу в потоке запроса), число процессов и размер миниатюры
+IMAGE_UPLOAD_MAX_SIZE = int(os.getenv('DJANGO_IMAGE_UPLOAD_MAX_SIZE', str(20 * 1024 * 1024)))
+IMAGE_PROCESSING = os.getenv('DJANGO_IMAGE_PROCESSING', 'process').lower()
+IMAGE_PROCESS_WORKERS = int(os.getenv('DJANGO_IMAGE_PROCESS_WORKERS', '2'))
+IMAGE_THUMBNAIL_SIZE = int(os.getenv('DJANGO_IMAGE_THUMBNAIL_SIZE', '320'))
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # REST Framework settings
 REST_FRAMEWORK = {
-    'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_RENDERER_CLASSES': [
         'rest_framework.renderers.JSONRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',
     ],
 }
 
+if API_DOCS_ENABLED:
+    REST_FRAMEWORK['DEFAULT_SCHEMA_CLASS'] = 'drf_spectacular.openapi.AutoSchema'
+
 # Spectacular settings
 SPECTACULAR_SETTINGS = {
     'TITLE': 'PEREVAL API',
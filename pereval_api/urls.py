@@ -1,41 +1,55 @@
-from django.urls import path, include
+from django.conf import settings
+from django.contrib import admin
+from django.urls import path
 from django.views.generic import RedirectView
-from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
-from rest_framework import permissions
+from pereval.metrics import metrics_view
+from pereval.notifications import status_stream
 from pereval.views import (
     SubmitDataView,
     PerevalDetailView,
     SubmitDataDetail,
     SubmitDataUpdate,
     SubmitDataUserList,
-)
-
-# Настройки Swagger
-schema_view = get_schema_view(
-    openapi.Info(
-        title="Pereval-Online API",
-        default_version='v1',
-        description="API для управления данными о горных перевалах",
-        terms_of_service="https://your-terms-url.com/  ",
-        contact=openapi.Contact(email="great.egor7288@gmail.com"),
-        license=openapi.License(name="MIT License"),
-    ),
-    public=True,
-    permission_classes=(permissions.AllowAny,),
+    IngestTicketStatus,
+    PerevalImageUpload,
+    PerevalTiles,
+    PerevalAnalytics,
+    PerevalEvents,
+    PerevalEventsCommit,
+    ModerationClaim,
+    ModerationRenew,
+    ModerationResolve,
+    ModerationRelease,
+    blob_view,
 )
 
 urlpatterns = [
-    # Документация
-    path('submitData/schema/', SpectacularAPIView.as_view(), name='schema'),
-    path('submitData/swagger/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
-    path('submitData/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
-
     # API Endpoints
     path('', RedirectView.as_view(url='/submitData/', permanent=False), name='home'),
+    path('admin/', admin.site.urls),
     path('submitData/', SubmitDataView.as_view(), name='submit-data'),
     path('submitData/<int:pk>/', SubmitDataDetail.as_view(), name='submit-data-detail'),  # Изменено
     path('submitData/<int:pk>/update/', SubmitDataUpdate.as_view(), name='submit-data-update'),
+    path('submitData/<int:pk>/images/', PerevalImageUpload.as_view(), name='submit-data-images'),
+    path(settings.MEDIA_URL.lstrip('/') + 'blobs/<path:path>', blob_view, name='image-blob'),
     path('submitData/user/', SubmitDataUserList.as_view(), name='submit-data-user-list'),  # Добавлено
-]
\ No newline at end of file
+    path('submitData/tiles/<int:z>/<int:x>/<int:y>', PerevalTiles.as_view(), name='submit-data-tiles'),
+    path('submitData/analytics/', PerevalAnalytics.as_view(), name='submit-data-analytics'),
+    path('submitData/events/', PerevalEvents.as_view(), name='submit-data-events'),
+    path('submitData/events/commit/', PerevalEventsCommit.as_view(), name='submit-data-events-commit'),
+    path('submitData/status/stream/', status_stream, name='submit-data-status-stream'),
+    path('submitData/moderation/claim/', ModerationClaim.as_view(), name='moderation-claim'),
+    path('submitData/moderation/renew/', ModerationRenew.as_view(), name='moderation-renew'),
+    path('submitData/moderation/<int:pk>/resolve/', ModerationResolve.as_view(), name='moderation-resolve'),
+    path('submitData/moderation/<int:pk>/release/', ModerationRelease.as_view(), name='moderation-release'),
+    path('submitData/ingest/<uuid:ticket>/', IngestTicketStatus.as_view(), name='submit-data-ingest-status'),
+]
+
+if settings.METRICS_ENABLED:
+    urlpatterns.append(path('metrics', metrics_view, name='metrics'))
+
+# Документация (schema/swagger/redoc) подключается только если включена
+if settings.API_DOCS_ENABLED:
+    from pereval.docs import docs_urlpatterns
+
+    urlpatterns += docs_urlpatterns()